@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""ページ結合方式（pil / lossless）のCPU時間と出力サイズの比較ベンチマーク.
+
+pil はタイルをデコードして結合し quality=95 で再エンコードする。
+lossless は jpegtran -drop でDCT係数のまま結合する（jpegtranが必要）。
+CPU時間には jpegtran 子プロセスの分も含める。
+
+使い方:
+    python benchmarks/bench_assembly.py [--cols 4] [--rows 5] [--tile 512] [--repeat 3]
+    python benchmarks/bench_assembly.py --tiles-dir path/to/tiles  # 記録済みタイル
+"""
+
+import argparse
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench_stitch import load_tiles, make_tiles  # noqa: E402
+
+from src.shufoo.lossless import assemble_lossless, jpegtran_path  # noqa: E402
+from src.shufoo.stitcher import build_page, compute_layout, read_tile_sizes  # noqa: E402
+
+
+def cpu_seconds() -> float:
+    self_usage = resource.getrusage(resource.RUSAGE_SELF)
+    child_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return (
+        self_usage.ru_utime + self_usage.ru_stime
+        + child_usage.ru_utime + child_usage.ru_stime
+    )
+
+
+def measure(tiles: list[bytes], assembly: str, repeat: int) -> tuple[float, float, int]:
+    """(CPU秒/ページ, 経過秒/ページ, 出力バイト数) を返す."""
+    cpu_start = cpu_seconds()
+    wall_start = time.perf_counter()
+    size = 0
+    for _ in range(repeat):
+        size = len(build_page(list(tiles), assembly=assembly).data)
+    return (
+        (cpu_seconds() - cpu_start) / repeat,
+        (time.perf_counter() - wall_start) / repeat,
+        size,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cols", type=int, default=4)
+    parser.add_argument("--rows", type=int, default=5)
+    parser.add_argument("--tile", type=int, default=512)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--tiles-dir", type=Path)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tiles_dir = args.tiles_dir
+        if tiles_dir is None:
+            tiles_dir = Path(tmp)
+            make_tiles(tiles_dir, args.cols, args.rows, args.tile)
+        tiles = load_tiles(tiles_dir)
+
+    print(f"tiles: {len(tiles)} ({sum(map(len, tiles)) // 1024}KB)")
+    if jpegtran_path() is None:
+        print("jpegtran が見つかりません: lossless は pil にフォールバックします")
+    else:
+        layout = compute_layout(read_tile_sizes(tiles))
+        if assemble_lossless(list(tiles), layout) is None:
+            print("タイルが無劣化結合の条件を満たしません: pil にフォールバックします")
+
+    print(f"{'assembly':<10} {'CPU ms':>9} {'wall ms':>9} {'output KB':>10}")
+    for assembly in ("pil", "lossless"):
+        cpu, wall, size = measure(tiles, assembly, args.repeat)
+        print(
+            f"{assembly:<10} {cpu * 1000:>9.1f} {wall * 1000:>9.1f} "
+            f"{size // 1024:>10}"
+        )
+
+
+if __name__ == "__main__":
+    main()
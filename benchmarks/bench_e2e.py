@@ -0,0 +1,407 @@
+#!/usr/bin/env python3
+"""記録済みHTTPの再生によるエンドツーエンド・ベンチマーク.
+
+main.py と同じパイプラインを、実通信の代わりにカセット
+（src.utils.replay）を再生して実行する。アップロードは fake バックエンド、
+LINE送信は遅延だけを入れた疑似APIに置き換えるため、完全にオフラインで動く。
+データディレクトリは一時ディレクトリを使う。--runs 2 以上では同じデータ
+ディレクトリで繰り返し実行し、2回目以降はキャッシュが効いた状態を測る。
+
+出力: 全体の経過時間・ピークRSS、ステージごとの所要時間・ピークRSS、
+ホストごとのリクエスト数・受信バイト数、アップロード/送信の件数。
+
+使い方:
+    python benchmarks/bench_e2e.py                         # 合成カセット（3店舗）
+    python benchmarks/bench_e2e.py --cassette fixtures/run-2024-06-01
+        # config.yaml の record.cassette で記録したもの
+    python benchmarks/bench_e2e.py --latency-ms 50 --upload-latency-ms 300 --json
+    python benchmarks/bench_e2e.py --target-width 480  # ズームの選択を比べる
+    python benchmarks/bench_e2e.py --progressive --pages 12  # 最初の画像が届くまで
+    python benchmarks/bench_e2e.py --upload-failure-rate 1  # アップロード先の障害
+    python benchmarks/bench_e2e.py --runs 2 --budget 40  # 実行時間の予算（2回目は学習済み）
+    python benchmarks/bench_e2e.py --runs 2 --check  # CI: 失敗・再送があれば終了コード1
+"""
+
+import argparse
+import json
+import logging
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench_stitch import load_tiles, make_tiles  # noqa: E402
+
+from src.models import Recipient, StoreConfig  # noqa: E402
+from src.notify.ledger import DeliveryLedger  # noqa: E402
+from src.notify.line_notifier import LineNotifier  # noqa: E402
+from src.pipeline import Pipeline  # noqa: E402
+from src.scheduler import BudgetScheduler, CostModel  # noqa: E402
+from src.shufoo.client import IMAGE_BASE_URL, ShufooClient  # noqa: E402
+from src.shufoo.downloader import ChirashiDownloader  # noqa: E402
+from src.shufoo.image_pool import ImagePool  # noqa: E402
+from src.shufoo.layout_cache import TileLayoutCache  # noqa: E402
+from src.shufoo.page_cache import ShopPageCache  # noqa: E402
+from src.shufoo.resolution import ResolutionPolicy  # noqa: E402
+from src.upload.fake import FakeBackend  # noqa: E402
+from src.utils.image_uploader import ImageUploader  # noqa: E402
+from src.utils.metrics import max_rss_kb, metrics  # noqa: E402
+from src.utils.replay import Cassette, RequestStats, install  # noqa: E402
+from src.utils.resilience import resilience  # noqa: E402
+
+
+class FakeMessagingApi:
+    """push_message / multicast を遅延のみで模擬する MessagingApi."""
+
+    def __init__(self, latency_ms: float, quota: int | None = None):
+        self.latency_ms = latency_ms
+        self.quota = quota
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.messages = 0
+        # 月間の送信数（リクエスト数 × 送信先の数）
+        self.usage = 0
+        # 最初の送信が完了した時刻（perf_counter）
+        self.first_push: float | None = None
+        # 送信先ごとの、見出しに書かれたページ数の合計と受け取った画像の数
+        self.announced_pages = 0
+        self.images = 0
+
+    def push_message(self, request, _request_timeout=None):
+        self._send(request, [request.to])
+
+    def multicast(self, request, _request_timeout=None):
+        self._send(request, list(request.to))
+
+    def _send(self, request, user_ids: list[str]) -> None:
+        time.sleep(self.latency_ms / 1000)
+        announced = sum(
+            int(m.group(1)) for m in (
+                re.search(r"\((\d+)p\)$", getattr(message, "text", None) or "")
+                for message in request.messages
+            ) if m
+        )
+        images = sum(
+            1 for message in request.messages
+            if getattr(message, "original_content_url", None)
+        )
+        with self._lock:
+            self.requests += 1
+            self.messages += len(request.messages)
+            self.usage += len(user_ids)
+            self.announced_pages += announced * len(user_ids)
+            self.images += images * len(user_ids)
+            if self.first_push is None:
+                self.first_push = time.perf_counter()
+
+    def get_message_quota(self):
+        if self.quota is None:
+            return SimpleNamespace(type="none", value=None)
+        return SimpleNamespace(type="limited", value=self.quota)
+
+    def get_message_quota_consumption(self):
+        return SimpleNamespace(total_usage=self.usage)
+
+
+def build_synthetic_cassette(
+    path: Path, stores: int, chirashis: int, pages: int,
+    cols: int, rows: int, tile: int, shared: int = 0,
+) -> None:
+    """Shufoo!の店舗ページとタイルを模したカセットを作る.
+
+    shared 件のチラシは全店舗に共通で掲載する（同じチェーンの店舗を想定）。
+    タイルはズーム200（tile px）とズーム100（半分の大きさ）の両方を用意する。
+    """
+    cassette = Cassette(str(path))
+    today = date.today()
+    date_path = (today - timedelta(days=1)).strftime("%Y/%m/%d")
+    store_list = []
+    shared_ids = [f"8{c:05d}" for c in range(shared)]
+    recorded: set[str] = set()
+    with tempfile.TemporaryDirectory() as tmp:
+        for s in range(stores):
+            shop_id = f"9{s:05d}"
+            store_list.append({"name": f"店舗{s + 1}", "shopId": shop_id})
+            ids = shared_ids + [f"{shop_id}{c:03d}" for c in range(chirashis)]
+            links = "".join(
+                f'<a href="/pntweb/shopDetail/{shop_id}/{cid}/">チラシ</a>'
+                for cid in ids
+            )
+            html = (
+                f"<html><script>dataLayer.push({{'content_title': "
+                f"'店舗{s + 1}のチラシ'}});</script><body>{links}</body></html>"
+            )
+            cassette.record(
+                "GET", f"https://www.shufoo.net/pntweb/shopDetail/{shop_id}/",
+                200, {"Content-Type": "text/html; charset=utf-8"},
+                html.encode("utf-8"),
+            )
+            for cid in ids:
+                if cid in recorded:
+                    continue
+                recorded.add(cid)
+                base = f"{IMAGE_BASE_URL}/c/{date_path}/{cid}/index/img"
+                for page in range(pages):
+                    for zoom, size in ((200, tile), (100, tile // 2)):
+                        page_dir = Path(tmp) / f"{cid}_{page}_{zoom}"
+                        page_dir.mkdir()
+                        make_tiles(page_dir, cols, rows, size)
+                        for idx, data in enumerate(load_tiles(page_dir)):
+                            url = f"{base}/{page}_{zoom}_{idx}.jpg"
+                            headers = {"Content-Type": "image/jpeg"}
+                            cassette.record("HEAD", url, 200, headers, b"")
+                            cassette.record("GET", url, 200, headers, data)
+    cassette.save(today=today.isoformat(), stores=store_list)
+
+
+def make_recipients(stores: list[StoreConfig], count: int) -> list[Recipient]:
+    """1人目は全店舗、以降は店舗をランダムに購読する送信先を作る."""
+    rng = random.Random(0)
+    recipients = [Recipient(user_id="U0")]
+    for i in range(1, count):
+        subscribed = rng.sample(stores, rng.randint(1, len(stores)))
+        recipients.append(
+            Recipient(user_id=f"U{i}", stores={s.shop_id for s in subscribed})
+        )
+    return recipients
+
+
+def run(args: argparse.Namespace, cassette_path: Path, data: Path) -> dict:
+    cassette = Cassette(str(cassette_path))
+    today = date.fromisoformat(cassette.meta["today"])
+    stores = [
+        StoreConfig(name=s["name"], shop_id=str(s["shopId"]))
+        for s in cassette.meta["stores"]
+    ]
+    stats = RequestStats()
+    metrics.reset()
+    resilience.configure({})
+
+    backend = FakeBackend(
+        latency_ms=args.upload_latency_ms, failure_rate=args.upload_failure_rate,
+    )
+    uploader = ImageUploader(
+        backend=backend, cache_path=str(data / "upload_cache.json")
+    )
+    api = FakeMessagingApi(args.push_latency_ms, args.push_quota)
+    line = LineNotifier(
+        channel_access_token="",
+        uploader=uploader,
+        api=api,
+        recipients=make_recipients(stores, args.recipients),
+    )
+    shufoo = ShufooClient(
+        layout_cache=TileLayoutCache(str(data / "tile_cache.json")),
+        today=lambda: today,
+        page_cache=ShopPageCache(str(data / "page_cache.json")),
+    )
+    downloader = ChirashiDownloader(
+        base_dir=str(data / "images"),
+        workers=args.workers,
+        image_pool=ImagePool(workers=args.image_workers, kind="thread"),
+    )
+    for session in (shufoo.session, downloader.session):
+        install(session, cassette, "replay", args.latency_ms, stats)
+
+    pipeline = Pipeline(
+        shufoo, downloader, line,
+        ledger=DeliveryLedger(str(data / "ledger.json")),
+        resolution=ResolutionPolicy(
+            target_width=args.target_width,
+            path=str(data / "page_widths.json"),
+        ),
+        progressive=args.progressive,
+        scheduler=BudgetScheduler(
+            budget_seconds=args.budget, reserve_seconds=0,
+            costs=CostModel(str(data / "timings.json")),
+        ),
+    )
+    start = time.perf_counter()
+    results = pipeline.run(stores)
+    wall = time.perf_counter() - start
+    downloader.close()
+
+    return {
+        "stores": len(stores),
+        "succeeded": sum(results.values()),
+        "wall_seconds": round(wall, 3),
+        "first_image_seconds": (
+            round(api.first_push - start, 3) if api.first_push else None
+        ),
+        "peak_rss_kb": max_rss_kb(),
+        "stages": {
+            name: {**s, "seconds": round(s["seconds"], 3)}
+            for name, s in pipeline.stage_stats.items()
+        },
+        "http": stats.as_dict(),
+        "head_requests": shufoo.head_requests,
+        "shop_pages": shufoo.page_stats,
+        "uploads": {
+            "count": backend.upload_count, "bytes": backend.uploaded_bytes,
+        },
+        "push": {
+            "requests": api.requests, "messages": api.messages,
+            "quota_usage": api.usage,
+            "announced_pages": api.announced_pages, "images": api.images,
+        },
+        "metrics": metrics.report()["totals"],
+        "hosts": resilience.report(),
+        "degraded": pipeline.scheduler.degraded,
+    }
+
+
+def check_reports(reports: list[dict]) -> list[str]:
+    """失敗した店舗・欠けたページ・初回の送信なし・2回目以降の転送を問題として返す."""
+    problems = []
+    for i, report in enumerate(reports, 1):
+        push = report["push"]
+        if report["succeeded"] < report["stores"]:
+            problems.append(
+                f"run {i}: {report['succeeded']}/{report['stores']}店舗のみ成功"
+            )
+        if i == 1 and not push["requests"]:
+            problems.append("run 1: LINEへの送信なし")
+        if push["images"] != push["announced_pages"]:
+            problems.append(
+                f"run {i}: 見出しの{push['announced_pages']}ページに対し"
+                f"画像{push['images']}件（送信先ごとの合計）"
+            )
+        if i > 1 and (report["uploads"]["count"] or report["push"]["requests"]):
+            problems.append(
+                f"run {i}: アップロード{report['uploads']['count']}件 / "
+                f"送信{report['push']['requests']}件（送信済みのはず）"
+            )
+    return problems
+
+
+def print_report(report: dict) -> None:
+    print(
+        f"stores: {report['succeeded']}/{report['stores']}, "
+        f"wall: {report['wall_seconds']:.2f}s, "
+        f"peak RSS: {report['peak_rss_kb'] // 1024}MB"
+    )
+    if report["first_image_seconds"] is not None:
+        print(f"first image: {report['first_image_seconds']:.2f}s")
+    print(f"{'stage':<10} {'calls':>6} {'seconds':>9} {'peak MB':>8}")
+    for name, s in report["stages"].items():
+        print(
+            f"{name:<10} {s['calls']:>6} {s['seconds']:>9.2f} "
+            f"{s['peak_rss_kb'] // 1024:>8}"
+        )
+    print(f"{'request':<32} {'count':>6} {'KB':>9}")
+    for key, h in report["http"].items():
+        print(f"{key:<32} {h['requests']:>6} {h['bytes'] // 1024:>9}")
+    print(
+        f"uploads: {report['uploads']['count']} "
+        f"({report['uploads']['bytes'] // 1024}KB), "
+        f"push: {report['push']['requests']} requests / "
+        f"{report['push']['messages']} messages / "
+        f"quota {report['push']['quota_usage']}"
+    )
+    pages = report["shop_pages"]
+    print(
+        f"shop pages: changed {pages['changed']}, unchanged {pages['unchanged']}, "
+        f"304 {pages['not_modified']}"
+    )
+    totals = report["metrics"]
+    if totals.get("tile_pages"):
+        print(
+            f"tiles: {totals['tile_bytes'] / totals['tile_pages'] / 1024:.0f}KB/page "
+            f"({totals['tile_pages']:.0f} pages)"
+        )
+    degraded = report["degraded"]
+    if any(degraded.values()):
+        print(
+            f"degraded: zoom {degraded['zoom']}, pages {degraded['pages']}, "
+            f"skipped {degraded['skipped']}"
+        )
+    for host, h in report["hosts"].items():
+        print(
+            f"host {host}: {h['state']}, errors {h['errors']}/{h['requests']}, "
+            f"rejected {h['rejected']}, srtt {h['srtt_ms']:.0f}ms"
+        )
+    print("metrics: " + ", ".join(
+        f"{name}={value}" for name, value in report["metrics"].items()
+    ))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cassette", type=Path)
+    parser.add_argument("--stores", type=int, default=3)
+    parser.add_argument("--chirashis", type=int, default=2)
+    parser.add_argument(
+        "--shared", type=int, default=0, help="全店舗に共通で掲載するチラシ数",
+    )
+    parser.add_argument("--pages", type=int, default=3)
+    parser.add_argument("--cols", type=int, default=4)
+    parser.add_argument("--rows", type=int, default=5)
+    parser.add_argument("--tile", type=int, default=256)
+    parser.add_argument("--latency-ms", type=float, default=30)
+    parser.add_argument("--upload-latency-ms", type=float, default=200)
+    parser.add_argument(
+        "--upload-failure-rate", type=float, default=0.0,
+        help="アップロードを失敗させる確率（疑似）",
+    )
+    parser.add_argument("--push-latency-ms", type=float, default=100)
+    parser.add_argument("--push-quota", type=int, help="月間の送信数の上限（疑似）")
+    parser.add_argument("--recipients", type=int, default=1, help="送信先の人数")
+    parser.add_argument(
+        "--target-width", type=int, help="目標のページ幅（省略時は最大のズーム）",
+    )
+    parser.add_argument(
+        "--progressive", action="store_true",
+        help="1ページ目を取得しだい送る（pipeline.delivery: progressive）",
+    )
+    parser.add_argument("--budget", type=float, help="実行時間の予算（秒）")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--image-workers", type=int, default=0)
+    parser.add_argument("--runs", type=int, default=1, help="同じデータで繰り返す回数")
+    parser.add_argument("--json", action="store_true", help="JSONで出力する")
+    parser.add_argument(
+        "--check", action="store_true",
+        help="失敗した店舗・欠けたページ・初回の送信なし・"
+        "2回目以降のアップロードや送信があれば終了コード1",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cassette_path = args.cassette
+        if cassette_path is None:
+            cassette_path = Path(tmp) / "cassette"
+            build_synthetic_cassette(
+                cassette_path, args.stores, args.chirashis, args.pages,
+                args.cols, args.rows, args.tile, args.shared,
+            )
+        data = Path(tmp) / "data"
+        reports = [run(args, cassette_path, data) for _ in range(args.runs)]
+
+    if args.json:
+        print(json.dumps(
+            reports[0] if len(reports) == 1 else reports,
+            ensure_ascii=False, indent=2,
+        ))
+    else:
+        for i, report in enumerate(reports, 1):
+            if len(reports) > 1:
+                print(f"--- run {i} ---")
+            print_report(report)
+    if args.check:
+        problems = check_reports(reports)
+        for problem in problems:
+            print(f"NG: {problem}", file=sys.stderr)
+        if problems:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
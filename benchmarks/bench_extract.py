@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""店舗ページ抽出のマイクロベンチマーク.
+
+従来の方式（リンクと dataLayer の項目ごとにHTML全体を走査する）と、
+src.shufoo.extractor の方式（リンクの走査1回 + dataLayer 部分のみの解析）で
+1ページあたりの抽出時間を比較し、抽出したチラシIDが一致することも確認する。
+--combined では、リンクと dataLayer の項目を1つの正規表現にまとめた場合も測る。
+
+使い方:
+    python benchmarks/bench_extract.py                   # 合成ページ
+    python benchmarks/bench_extract.py --pages-dir path/to/pages
+        # {shopId}.html 形式の保存済みページ
+    python benchmarks/bench_extract.py --cassette fixtures/run-2024-06-01
+"""
+
+import argparse
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.shufoo.extractor import extract_shop_page  # noqa: E402
+from src.utils.replay import Cassette  # noqa: E402
+
+_SHOP_URL = re.compile(r"^GET https://www\.shufoo\.net/pntweb/shopDetail/(\d+)/$")
+
+
+def legacy_extract(html: str, shop_id: str) -> tuple[list[str], str | None]:
+    """従来の抽出（比較用）."""
+    ids: list[str] = []
+    seen: set[str] = set()
+    link_pattern = re.compile(rf"/pntweb/shopDetail/{re.escape(shop_id)}/(\d+)/")
+    for m in link_pattern.finditer(html):
+        if m.group(1) not in seen:
+            seen.add(m.group(1))
+            ids.append(m.group(1))
+    for pattern in [
+        r"chirashiId\s*:\s*['\"](\d+)['\"]",
+        r"siteCatalyst_chirashiId\s*:\s*['\"](\d+)['\"]",
+    ]:
+        m = re.search(pattern, html)
+        if m and m.group(1) not in seen:
+            seen.add(m.group(1))
+            ids.append(m.group(1))
+    title = re.search(r"['\"]content_title['\"]\s*:\s*['\"]([^'\"]+)['\"]", html)
+    return ids, title.group(1) if title else None
+
+
+_COMBINED = re.compile(
+    r"/pntweb/shopDetail/(\d+)/(\d+)/(?:([^<>]{0,300})>([^<]{0,200}))?"
+    r"|(content_title|chirashiId|siteCatalyst_chirashiId)['\"]?"
+    r"\s*:\s*['\"]([^'\"]*)['\"]"
+)
+
+
+def combined_extract(html: str, shop_id: str) -> list[tuple]:
+    """1つの正規表現でまとめて走査する場合（比較用）."""
+    return [
+        m.groups() for m in _COMBINED.finditer(html)
+        if m.group(1) in (None, shop_id)
+    ]
+
+
+def synthetic_page(shop_id: str, chirashis: int, noise_kb: int, seed: int) -> str:
+    """他店舗へのリンクや広告を含む、実ページ程度の大きさのHTMLを作る."""
+    rng = random.Random(seed)
+    parts = ["<html><head><script>dataLayer.push({'content_title': 'チラシ', "
+             f"siteCatalyst_chirashiId: '{shop_id}999'}});</script></head><body>"]
+    size = 0
+    own = [f"{shop_id}{i:03d}" for i in range(chirashis)]
+    while size < noise_kb * 1024:
+        other = rng.randint(100000, 999999)
+        chunk = (
+            f'<div class="ad"><a href="/pntweb/shopDetail/{other}/{other}1/">'
+            f'<img src="https://ipqcache2.shufoo.net/x/{other}.jpg"></a>'
+            f"<p>{'テキスト' * rng.randint(5, 30)}</p></div>"
+        )
+        if own and rng.random() < 0.05:
+            cid = own.pop()
+            chunk += (
+                f'<a href="/pntweb/shopDetail/{shop_id}/{cid}/" '
+                f'title="週末セール {cid}">見る</a>'
+            )
+        parts.append(chunk)
+        size += len(chunk)
+    parts.extend(
+        f'<a href="/pntweb/shopDetail/{shop_id}/{cid}/">見る</a>' for cid in own
+    )
+    parts.append("</body></html>")
+    return "".join(parts)
+
+
+def load_pages(args: argparse.Namespace) -> list[tuple[str, str]]:
+    if args.pages_dir:
+        return [
+            (p.stem, p.read_text(encoding="utf-8"))
+            for p in sorted(args.pages_dir.glob("*.html"))
+        ]
+    if args.cassette:
+        cassette = Cassette(str(args.cassette))
+        pages = []
+        for key in cassette.entries:
+            m = _SHOP_URL.match(key)
+            if m:
+                _, body = cassette.next_response("GET", key[4:])
+                pages.append((m.group(1), body.decode("utf-8", "replace")))
+        return pages
+    return [
+        (str(100000 + i), synthetic_page(str(100000 + i), 3, args.noise_kb, i))
+        for i in range(args.pages)
+    ]
+
+
+def measure(fn, pages: list[tuple[str, str]], repeat: int) -> float:
+    """1ページあたりのマイクロ秒を返す."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for shop_id, html in pages:
+            fn(html, shop_id)
+    return (time.perf_counter() - start) / (repeat * len(pages)) * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages-dir", type=Path)
+    parser.add_argument("--cassette", type=Path)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--noise-kb", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--combined", action="store_true")
+    args = parser.parse_args()
+
+    pages = load_pages(args)
+    if not pages:
+        print("ページがありません")
+        return
+
+    mismatches = [
+        shop_id for shop_id, html in pages
+        if legacy_extract(html, shop_id)[0]
+        != extract_shop_page(html, shop_id).chirashi_ids
+    ]
+    avg_kb = sum(len(html) for _, html in pages) / len(pages) / 1024
+    print(f"pages: {len(pages)} (平均 {avg_kb:.0f}KB), ID不一致: {len(mismatches)}")
+    if mismatches:
+        print(f"  不一致の店舗: {', '.join(mismatches[:5])}")
+
+    methods = [("legacy", legacy_extract), ("extractor", extract_shop_page)]
+    if args.combined:
+        methods.append(("combined", combined_extract))
+    print(f"{'method':<12} {'us/page':>10}")
+    baseline = None
+    for name, fn in methods:
+        us = measure(fn, pages, args.repeat)
+        baseline = baseline or us
+        print(f"{name:<12} {us:>10.1f} ({baseline / us:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""画像処理プールのスケーリングベンチマーク.
+
+ページ単位のタイル群（結合 + quality=95エンコード + プレビュー生成）を
+ImagePool に投入し、ワーカー数ごとのスループット（ページ/秒）を測る。
+
+使い方:
+    python benchmarks/bench_image_pool.py [--pages 24] [--kind process thread]
+    python benchmarks/bench_image_pool.py --corpus path/to/pages
+        # corpus/<page>/*.jpg 形式の記録済みタイル
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench_stitch import load_tiles, make_tiles  # noqa: E402
+
+from src.shufoo.image_pool import ImagePool  # noqa: E402
+
+
+def load_corpus(corpus: Path) -> list[list[bytes]]:
+    return [
+        load_tiles(page_dir)
+        for page_dir in sorted(corpus.iterdir()) if page_dir.is_dir()
+    ]
+
+
+def synthetic_corpus(pages: int, cols: int, rows: int, size: int) -> list[list[bytes]]:
+    with tempfile.TemporaryDirectory() as tmp:
+        make_tiles(Path(tmp), cols, rows, size)
+        tiles = load_tiles(Path(tmp))
+    return [list(tiles) for _ in range(pages)]
+
+
+def run(corpus: list[list[bytes]], workers: int, kind: str) -> float:
+    """ページ/秒 を返す（プールの起動時間は含めない）."""
+    pool = ImagePool(workers=workers, kind=kind)
+    try:
+        # ワーカーを起動させておく
+        pool.submit(list(corpus[0])).result()
+        start = time.perf_counter()
+        futures = [pool.submit(list(tiles)) for tiles in corpus]
+        for future in futures:
+            future.result()
+        return len(corpus) / (time.perf_counter() - start)
+    finally:
+        pool.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", type=Path)
+    parser.add_argument("--pages", type=int, default=24)
+    parser.add_argument("--cols", type=int, default=4)
+    parser.add_argument("--rows", type=int, default=5)
+    parser.add_argument("--tile", type=int, default=512)
+    parser.add_argument("--kind", nargs="+", default=["process", "thread"])
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    if args.corpus:
+        corpus = load_corpus(args.corpus)
+    else:
+        corpus = synthetic_corpus(args.pages, args.cols, args.rows, args.tile)
+
+    worker_counts = [0]
+    n = 1
+    while n <= args.max_workers:
+        worker_counts.append(n)
+        n *= 2
+
+    print(f"pages: {len(corpus)}, cpu: {os.cpu_count()}")
+    print(f"{'kind':<8} {'workers':>7} {'pages/s':>9} {'speedup':>8}")
+    for kind in args.kind:
+        baseline = None
+        for workers in worker_counts:
+            rate = run(corpus, workers, kind)
+            baseline = baseline or rate
+            label = "inline" if workers == 0 else kind
+            print(f"{label:<8} {workers:>7} {rate:>9.2f} {rate / baseline:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""起動時間のベンチマーク.
+
+python -X importtime で、実行モードごとに読み込まれるモジュールと
+その所要時間を測る。重いモジュール（requests / Pillow / line-bot-sdk / PyYAML）が
+どのモードで読み込まれるかと、累積時間の大きいモジュールを表示する。
+
+  import : main.py の読み込みのみ（引数の解析まで）
+  check  : --check / --dry-run（店舗ページの変化の確認）
+  run    : 通常の実行（新しいチラシがなければここまで）
+  send   : 新しいチラシをLINEに送る場合
+
+使い方:
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --runs 10 --top 15 --profile send
+    python benchmarks/bench_startup.py --config config.yaml
+        # main.py --check 全体の所要時間も測る（店舗ページを取得する）
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+SCENARIOS = {
+    "import": "import main",
+    "check": "import main; import src.shufoo.page_check",
+    "run": "import main; import src.daemon, src.utils.replay",
+    "send": "import main; import src.daemon, src.utils.replay; "
+            "import linebot.v3.messaging, PIL.Image",
+}
+
+HEAVY = ("yaml", "requests", "PIL", "linebot", "boto3")
+
+
+def parse_importtime(stderr: str) -> list[tuple[str, int, int]]:
+    """(モジュール名, 階層, 累積マイクロ秒) のリスト."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        rows.append((name.strip(), depth, int(cumulative)))
+    return rows
+
+
+def measure(code: str, runs: int) -> dict:
+    walls = []
+    rows: list[tuple[str, int, int]] = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", code],
+            cwd=ROOT, capture_output=True, text=True,
+        )
+        walls.append((time.perf_counter() - start) * 1000)
+        if proc.returncode != 0:
+            raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+        rows = parse_importtime(proc.stderr)
+    loaded = {name.split(".")[0] for name, _, _ in rows}
+    return {
+        "wall_ms": statistics.median(walls),
+        "import_ms": sum(us for _, depth, us in rows if depth == 0) / 1000,
+        "modules": len(rows),
+        "heavy": [m for m in HEAVY if m in loaded],
+        "rows": rows,
+    }
+
+
+def measure_check(config: Path, runs: int) -> float:
+    """main.py --check 全体の所要時間（中央値, ms）."""
+    walls = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, str(ROOT / "main.py"), "--check",
+             "--config", str(config.resolve())],
+            cwd=ROOT, capture_output=True,
+        )
+        walls.append((time.perf_counter() - start) * 1000)
+    return statistics.median(walls)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--profile", choices=SCENARIOS, default="run")
+    parser.add_argument("--config", type=Path)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    results = {}
+    for name, code in SCENARIOS.items():
+        try:
+            results[name] = measure(code, args.runs)
+        except RuntimeError as e:
+            print(f"{name}: 計測できません ({e})", file=sys.stderr)
+    if args.config:
+        results["check_e2e"] = {"wall_ms": measure_check(args.config, args.runs)}
+
+    if args.json:
+        print(json.dumps(
+            {k: {f: v for f, v in r.items() if f != "rows"} for k, r in results.items()},
+            ensure_ascii=False, indent=1,
+        ))
+        return
+
+    print(f"{'mode':<10} {'wall ms':>9} {'import ms':>10} {'modules':>8}  heavy")
+    for name, r in results.items():
+        if "rows" not in r:
+            print(f"{name:<10} {r['wall_ms']:>9.0f}")
+            continue
+        print(
+            f"{name:<10} {r['wall_ms']:>9.0f} {r['import_ms']:>10.1f} "
+            f"{r['modules']:>8}  {', '.join(r['heavy']) or '-'}"
+        )
+
+    profile = results.get(args.profile)
+    if profile:
+        print(f"\n{args.profile}: 累積時間の大きいモジュール")
+        top = sorted(
+            (row for row in profile["rows"] if row[1] <= 1),
+            key=lambda row: -row[2],
+        )[:args.top]
+        for name, depth, us in top:
+            print(f"  {'  ' * depth}{name:<40} {us / 1000:>8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
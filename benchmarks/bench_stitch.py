@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""タイル結合のピークメモリ比較ベンチマーク.
+
+全タイルをデコードして保持してから結合する従来方式（memory）と、
+ヘッダからレイアウトを決めて1枚ずつ貼り付ける方式（streaming）を
+それぞれ別プロセスで実行し、結合処理中のピークRSS増分を比較する。
+
+使い方:
+    python benchmarks/bench_stitch.py [--cols 4] [--rows 5] [--tile 512]
+    python benchmarks/bench_stitch.py --tiles-dir path/to/tiles  # 記録済みタイル
+"""
+
+import argparse
+import io
+import math
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from PIL import Image  # noqa: E402
+
+from src.shufoo.stitcher import (  # noqa: E402
+    compute_layout,
+    read_tile_sizes,
+    stitch_tiles,
+)
+from src.utils.metrics import max_rss_kb  # noqa: E402
+
+
+def make_tiles(out_dir: Path, cols: int, rows: int, size: int) -> None:
+    """右端列・最下行が狭い、Shufoo!と同じ形のタイルを生成する."""
+    idx = 0
+    for row in range(rows):
+        for col in range(cols):
+            w = size if col < cols - 1 else size // 2
+            h = size if row < rows - 1 else size // 3
+            img = Image.effect_noise((w, h), 64).convert("RGB")
+            img.save(out_dir / f"{idx:03d}.jpg", "JPEG", quality=90)
+            idx += 1
+
+
+def load_tiles(tiles_dir: Path) -> list[bytes]:
+    return [p.read_bytes() for p in sorted(tiles_dir.glob("*.jpg"))]
+
+
+def stitch_in_memory(tiles: list[bytes]) -> Image.Image:
+    """従来方式: 全タイルをデコードして保持してから結合する."""
+    images = [Image.open(io.BytesIO(data)) for data in tiles]
+    for img in images:
+        img.load()
+    layout = compute_layout([img.size for img in images])
+    canvas = Image.new("RGB", (layout.width, layout.height), (255, 255, 255))
+    for idx, img in enumerate(images):
+        canvas.paste(img, layout.position(idx))
+    return canvas
+
+
+def run_child(mode: str, tiles_dir: Path) -> None:
+    tiles = load_tiles(tiles_dir)
+    read_tile_sizes(tiles)  # PILのプラグイン読み込みを計測対象から外す
+    before = max_rss_kb()
+    start = time.perf_counter()
+    if mode == "memory":
+        img = stitch_in_memory(tiles)
+    else:
+        img = stitch_tiles(tiles)
+    elapsed = time.perf_counter() - start
+    after = max_rss_kb()
+    print(f"{mode}\t{after - before}\t{elapsed * 1000:.1f}\t{img.width}x{img.height}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cols", type=int, default=4)
+    parser.add_argument("--rows", type=int, default=5)
+    parser.add_argument("--tile", type=int, default=512)
+    parser.add_argument("--tiles-dir", type=Path)
+    parser.add_argument("--child", choices=["memory", "streaming"])
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.tiles_dir)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tiles_dir = args.tiles_dir
+        if tiles_dir is None:
+            tiles_dir = Path(tmp)
+            make_tiles(tiles_dir, args.cols, args.rows, args.tile)
+        count = len(list(tiles_dir.glob("*.jpg")))
+
+        print(f"tiles: {count}")
+        print(f"{'mode':<10} {'peak RSS +KB':>13} {'time ms':>9}  size")
+        results = {}
+        for mode in ("memory", "streaming"):
+            out = subprocess.run(
+                [sys.executable, __file__, "--child", mode,
+                 "--tiles-dir", str(tiles_dir)],
+                check=True, capture_output=True, text=True,
+            ).stdout.strip().split("\t")
+            results[mode] = int(out[1])
+            print(f"{mode:<10} {out[1]:>13} {out[2]:>9}  {out[3]}")
+
+        if results["memory"]:
+            saved = 1 - results["streaming"] / results["memory"]
+            print(f"peak RSS reduction: {math.floor(saved * 100)}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,57 +1,60 @@
 #!/usr/bin/env python3
-"""Shufoo! チラシ画像LINE送信."""
+"""Shufoo! チラシ画像LINE送信.
 
+使い方:
+    python main.py           # 1回実行（cron / GitHub Actions 用）
+    python main.py --daemon  # 常駐して店舗ページを定期的に確認する
+    python main.py --check   # 店舗ページの変化だけを確認する（変化あり: 終了コード2）
+
+起動を速くするため、重いモジュール（requests / Pillow / line-bot-sdk）は
+実際に使う処理の中で読み込む（benchmarks/bench_startup.py）。
+"""
+
+import argparse
 import logging
 import sys
 
 from src.config import AppConfig
-from src.notify.line_notifier import LineNotifier
-from src.shufoo.client import ShufooClient
-from src.shufoo.downloader import ChirashiDownloader
+from src.models import StoreConfig
 from src.utils.logging_config import setup_logging
 
+# --check で変化があった場合の終了コード（1はエラー）
+EXIT_CHANGED = 2
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Shufoo! チラシ画像LINE送信")
+    parser.add_argument(
+        "--daemon", action="store_true",
+        help="常駐して新しいチラシが出た店舗だけを処理する（config.yaml の daemon）",
+    )
+    parser.add_argument(
+        "--check", "--dry-run", dest="check", action="store_true",
+        help="送信せずに店舗ページの変化だけを確認する"
+             "（変化なし: 0 / 変化あり: 2 / エラー: 1）",
+    )
+    parser.add_argument("--config", default="config.yaml", help="設定ファイル")
+    return parser.parse_args()
+
 
 def main() -> None:
+    args = parse_args()
     setup_logging()
     logger = logging.getLogger(__name__)
     logger.info("=== チラシ送信 開始 ===")
 
     try:
-        config = AppConfig()
+        config = AppConfig(args.config)
         config.load()
         stores = config.stores
         if not stores:
             logger.warning("有効な店舗がありません")
             return
-
-        line_cfg = config.line_config
-        line = LineNotifier(
-            channel_access_token=line_cfg["channel_access_token"],
-            user_id=line_cfg["user_id"],
-        )
-        shufoo = ShufooClient()
-        downloader = ChirashiDownloader()
-
-        for store in stores:
-            logger.info("--- %s ---", store.name)
-            try:
-                chirashis = shufoo.fetch_chirashi_list(store)
-                if not chirashis:
-                    logger.info("  チラシなし")
-                    continue
-
-                for chirashi in chirashis:
-                    chirashi = downloader.download(chirashi)
-                    if not chirashi.local_image_paths:
-                        logger.warning("  画像取得失敗")
-                        continue
-                    line.send_chirashi(store, chirashi)
-
-            except Exception as e:
-                logger.error("  %s エラー: %s", store.name, e)
-                continue
-
-        downloader.cleanup_old_images(days=3)
+        if args.check:
+            exit_code = EXIT_CHANGED if check(stores) else 0
+        else:
+            run(args, config)
+            exit_code = 0
 
     except FileNotFoundError as e:
         logger.critical(str(e))
@@ -61,6 +64,136 @@ def main() -> None:
         sys.exit(1)
 
     logger.info("=== チラシ送信 終了 ===")
+    if exit_code:
+        sys.exit(exit_code)
+
+
+def check(stores: list[StoreConfig]) -> bool:
+    """店舗ページの変化を確認し、処理が必要な店舗があればTrueを返す."""
+    from src.shufoo.page_cache import ShopPageCache
+    from src.shufoo.page_check import check_stores
+
+    logger = logging.getLogger(__name__)
+    changed = check_stores(stores, ShopPageCache())
+    for store in changed:
+        logger.info("変化あり: %s", store.name)
+    logger.info("店舗ページの確認: 変化あり %d/%d店舗", len(changed), len(stores))
+    return bool(changed)
+
+
+def run(args: argparse.Namespace, config: AppConfig) -> None:
+    """全店舗を処理する（--daemon では常駐して繰り返す）."""
+    from datetime import date
+
+    from src.daemon import Daemon, PollSchedule
+    from src.notify.ledger import DeliveryLedger
+    from src.notify.line_notifier import LineNotifier
+    from src.pipeline import Pipeline
+    from src.scheduler import BudgetScheduler
+    from src.shufoo.client import ShufooClient
+    from src.shufoo.downloader import ChirashiDownloader
+    from src.shufoo.image_pool import ImagePool
+    from src.shufoo.layout_cache import TileLayoutCache
+    from src.shufoo.page_cache import ShopPageCache
+    from src.shufoo.resolution import ResolutionPolicy
+    from src.utils.image_uploader import ImageUploader
+    from src.utils.metrics import metrics
+    from src.utils.replay import Cassette, install
+    from src.utils.resilience import resilience
+
+    resilience.configure(config.resilience_config)
+    stores = config.stores
+    uploader = ImageUploader.from_config(config.upload_config)
+
+    line_cfg = config.line_config
+    line = LineNotifier(
+        channel_access_token=line_cfg["channel_access_token"],
+        uploader=uploader,
+        recipients=config.recipients,
+        workers=line_cfg.get("push_workers", 4),
+    )
+    shufoo = ShufooClient(
+        layout_cache=TileLayoutCache(), page_cache=ShopPageCache()
+    )
+    download_cfg = config.download_config
+    downloader = ChirashiDownloader(
+        mode=download_cfg.get("mode", "threaded"),
+        workers=download_cfg.get("workers", 8),
+        per_host=download_cfg.get("per_host", 6),
+        retries=download_cfg.get("retries", 3),
+        assembly=download_cfg.get("assembly", "pil"),
+        image_pool=ImagePool(
+            workers=download_cfg.get("image_workers", 0),
+            kind=download_cfg.get("image_executor", "process"),
+        ),
+    )
+
+    # 記録モード: 実通信のやり取りをカセットに保存する（ベンチマーク用）
+    cassette = None
+    record_cfg = config.record_config
+    if record_cfg.get("cassette"):
+        cassette = Cassette(record_cfg["cassette"])
+        for session in (shufoo.session, downloader.session, uploader.session):
+            install(session, cassette, "record")
+
+    pipeline = Pipeline(
+        shufoo,
+        downloader,
+        line,
+        concurrency=config.pipeline_config.get("concurrency"),
+        ledger=DeliveryLedger(),
+        resolution=ResolutionPolicy.from_config(
+            download_cfg.get("resolution") or {}
+        ),
+        progressive=config.pipeline_config.get("delivery") == "progressive",
+        scheduler=BudgetScheduler.from_config(config.budget_config),
+    )
+    report_cfg = config.report_config
+
+    def write_report(results: dict[str, bool]) -> None:
+        shufoo.log_summary()
+        uploader.log_summary()
+        resilience.log_summary()
+        metrics.write(
+            report_cfg.get("json", "logs/run_report.json"),
+            report_cfg.get("prometheus"),
+            results=results,
+            stages=pipeline.stage_stats,
+            hosts=resilience.report(),
+            degraded=pipeline.scheduler.degraded,
+        )
+
+    if args.daemon:
+        daemon_cfg = config.daemon_config
+
+        def after_run(results: dict[str, bool]) -> None:
+            # レポートは実行ごとに出力し、次の実行に持ち越さない
+            write_report(results)
+            metrics.reset()
+            pipeline.reset()
+            shufoo.reset()
+            uploader.reset()
+
+        Daemon(
+            pipeline,
+            stores,
+            PollSchedule.from_config(daemon_cfg),
+            after_run=after_run,
+            daily=lambda: downloader.cleanup_old_images(days=3),
+            workers=daemon_cfg.get("workers", 4),
+        ).run()
+    else:
+        write_report(pipeline.run(stores))
+    if cassette:
+        cassette.save(
+            today=date.today().isoformat(),
+            stores=[
+                {"name": s.name, "shopId": s.shop_id} for s in stores
+            ],
+        )
+
+    downloader.close()
+    downloader.cleanup_old_images(days=3)
 
 
 if __name__ == "__main__":
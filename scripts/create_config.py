@@ -11,11 +11,10 @@ from pathlib import Path
 def create_config():
     """環境変数から config.yaml を生成"""
 
-    # 必須環境変数のチェック
-    required_vars = [
-        'LINE_CHANNEL_ACCESS_TOKEN',
-        'LINE_USER_ID'
-    ]
+    # 必須環境変数のチェック（LINE_RECIPIENTS があれば LINE_USER_ID は不要）
+    required_vars = ['LINE_CHANNEL_ACCESS_TOKEN']
+    if not os.getenv('LINE_RECIPIENTS'):
+        required_vars.append('LINE_USER_ID')
 
     missing_vars = [var for var in required_vars if not os.getenv(var)]
     if missing_vars:
@@ -36,11 +35,14 @@ def create_config():
                 raise ValueError("STORES must be a JSON array")
 
             for store in stores_data:
-                stores.append({
+                entry = {
                     'name': store['name'],
                     'shopId': str(store['shopId']),
                     'enabled': store.get('enabled', True)
-                })
+                }
+                if 'priority' in store:
+                    entry['priority'] = int(store['priority'])
+                stores.append(entry)
         except json.JSONDecodeError as e:
             # デバッグ用に最初の100文字を表示
             preview = stores_json_cleaned[:100] if len(stores_json_cleaned) <= 100 else stores_json_cleaned[:100] + "..."
@@ -84,6 +86,17 @@ def create_config():
         }
     }
 
+    # 複数の送信先（JSON形式）
+    recipients_json = os.getenv('LINE_RECIPIENTS')
+    if recipients_json:
+        try:
+            recipients = json.loads(recipients_json.strip())
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON format in LINE_RECIPIENTS: {e}")
+        if not isinstance(recipients, list):
+            raise ValueError("LINE_RECIPIENTS must be a JSON array")
+        config['line']['recipients'] = recipients
+
     # config.yamlに書き込み
     config_path = Path(__file__).parent.parent / 'config.yaml'
     with open(config_path, 'w', encoding='utf-8') as f:
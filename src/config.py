@@ -5,7 +5,7 @@ from pathlib import Path
 
 import yaml
 
-from src.models import StoreConfig
+from src.models import Recipient, StoreConfig
 
 logger = logging.getLogger(__name__)
 
@@ -35,6 +35,9 @@ class AppConfig:
             raise ValueError("少なくとも1店舗を登録してください")
         if "line" not in self._raw:
             raise ValueError("line設定が必要です")
+        line = self._raw["line"] or {}
+        if not line.get("user_id") and not line.get("recipients"):
+            raise ValueError("line.user_id または line.recipients が必要です")
 
     def _parse_stores(self) -> None:
         self._stores = []
@@ -43,6 +46,10 @@ class AppConfig:
                 name=s["name"],
                 shop_id=str(s["shopId"]),
                 enabled=s.get("enabled", True),
+                poll_minutes=s.get("poll_minutes"),
+                peak_hours=s.get("peak_hours"),
+                target_width=s.get("target_width"),
+                priority=s.get("priority", 0),
             )
             self._stores.append(store)
 
@@ -53,3 +60,49 @@ class AppConfig:
     @property
     def line_config(self) -> dict:
         return self._raw.get("line", {})
+
+    @property
+    def recipients(self) -> list[Recipient]:
+        """送信先. line.recipients がなければ line.user_id の1人."""
+        line = self.line_config
+        entries = line.get("recipients") or [{"user_id": line.get("user_id")}]
+        return [
+            Recipient(
+                user_id=r["user_id"],
+                stores={str(s) for s in r["stores"]} if r.get("stores") else None,
+                target_width=r.get("target_width"),
+            )
+            for r in entries
+        ]
+
+    @property
+    def pipeline_config(self) -> dict:
+        return self._raw.get("pipeline") or {}
+
+    @property
+    def budget_config(self) -> dict:
+        return self._raw.get("budget") or {}
+
+    @property
+    def resilience_config(self) -> dict:
+        return self._raw.get("resilience") or {}
+
+    @property
+    def download_config(self) -> dict:
+        return self._raw.get("download") or {}
+
+    @property
+    def upload_config(self) -> dict:
+        return self._raw.get("upload") or {}
+
+    @property
+    def record_config(self) -> dict:
+        return self._raw.get("record") or {}
+
+    @property
+    def report_config(self) -> dict:
+        return self._raw.get("report") or {}
+
+    @property
+    def daemon_config(self) -> dict:
+        return self._raw.get("daemon") or {}
@@ -0,0 +1,264 @@
+"""常駐モード.
+
+cron などで毎回起動する代わりにプロセスを常駐させ、HTTPセッション（TLS接続）・
+タイル構成のキャッシュ・画像ワーカーを使い回す。店舗ごとに次の確認時刻を持ち、
+チラシの公開が多い時間帯は短い間隔で店舗ページを確認する。新しいチラシIDが
+現れた店舗だけをまとめてパイプラインで処理する（確認で取得した店舗ページを
+そのまま使い、パイプラインでは取得し直さない）。
+
+公開が多い時間帯は設定（peak_hours）に加え、過去に新しいチラシを検出した
+時刻から店舗ごとに学習する（data/publish_times.json）。
+"""
+
+import logging
+import signal
+import threading
+from collections import Counter
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+from src.models import StoreConfig
+from src.pipeline import Pipeline
+from src.utils.json_store import JsonStore
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL_MINUTES = 60
+DEFAULT_PEAK_INTERVAL_MINUTES = 10
+# 同じ時（HH時台）に何回公開されたら、公開が多い時間帯とみなすか
+LEARN_MIN_COUNT = 2
+# 学習した時間帯は、その時の何分前から短い間隔で確認するか
+LEARN_LEAD_MINUTES = 30
+MINUTES_PER_DAY = 24 * 60
+
+
+def parse_window(text: str) -> tuple[int, int]:
+    """"HH:MM-HH:MM" を0時からの分数の組にする（日をまたぐ場合は終了 > 1440）."""
+    start_text, end_text = text.split("-")
+    start = _minutes(start_text)
+    end = _minutes(end_text)
+    if end <= start:
+        end += MINUTES_PER_DAY
+    return start, end
+
+
+def _minutes(text: str) -> int:
+    hour, minute = text.strip().split(":")
+    return int(hour) * 60 + int(minute)
+
+
+class PollSchedule:
+    """店舗ごとの確認間隔を決める."""
+
+    def __init__(
+        self,
+        interval_minutes: int = DEFAULT_INTERVAL_MINUTES,
+        peak_interval_minutes: int = DEFAULT_PEAK_INTERVAL_MINUTES,
+        peak_hours: list[str] | None = None,
+        history_path: str = "data/publish_times.json",
+        learn_days: int = 28,
+    ):
+        """
+        Args:
+            interval_minutes: 通常の確認間隔（店舗の poll_minutes が優先）
+            peak_interval_minutes: 公開が多い時間帯の確認間隔
+            peak_hours: 公開が多い時間帯（"HH:MM-HH:MM"、店舗の peak_hours が優先）
+            learn_days: 公開時刻の学習に使う日数
+        """
+        self.interval = timedelta(minutes=interval_minutes)
+        self.peak_interval = timedelta(minutes=peak_interval_minutes)
+        self.peak_hours = list(peak_hours or [])
+        self.learn_days = learn_days
+        self._history = JsonStore(history_path)
+
+    @classmethod
+    def from_config(cls, config: dict) -> "PollSchedule":
+        return cls(
+            interval_minutes=config.get("interval_minutes", DEFAULT_INTERVAL_MINUTES),
+            peak_interval_minutes=config.get(
+                "peak_interval_minutes", DEFAULT_PEAK_INTERVAL_MINUTES
+            ),
+            peak_hours=config.get("peak_hours"),
+            history_path=config.get("history", "data/publish_times.json"),
+            learn_days=config.get("learn_days", 28),
+        )
+
+    def record_publish(self, store: StoreConfig, when: datetime) -> None:
+        """新しいチラシを検出した時刻を記録する."""
+        cutoff = when - timedelta(days=self.learn_days)
+        with self._history.lock:
+            times = [
+                t for t in self._history.data.get(store.shop_id, [])
+                if datetime.fromisoformat(t) >= cutoff
+            ]
+            times.append(when.isoformat(timespec="minutes"))
+            self._history.data[store.shop_id] = times
+            self._history.save()
+
+    def peak_windows(self, store: StoreConfig) -> list[tuple[int, int]]:
+        """公開が多い時間帯（設定 + 学習）を分数の組で返す."""
+        configured = (
+            store.peak_hours if store.peak_hours is not None else self.peak_hours
+        )
+        windows = [parse_window(w) for w in configured]
+        with self._history.lock:
+            times = list(self._history.data.get(store.shop_id, []))
+        hours = Counter(datetime.fromisoformat(t).hour for t in times)
+        for hour, count in sorted(hours.items()):
+            if count >= LEARN_MIN_COUNT:
+                windows.append((hour * 60 - LEARN_LEAD_MINUTES, (hour + 1) * 60))
+        return windows
+
+    def in_peak(self, store: StoreConfig, when: datetime) -> bool:
+        minute = when.hour * 60 + when.minute
+        return any(
+            (minute - start) % MINUTES_PER_DAY < end - start
+            for start, end in self.peak_windows(store)
+        )
+
+    def next_poll(self, store: StoreConfig, now: datetime) -> datetime:
+        """次に店舗ページを確認する時刻."""
+        interval = (
+            timedelta(minutes=store.poll_minutes) if store.poll_minutes
+            else self.interval
+        )
+        if self.in_peak(store, now):
+            return now + min(interval, self.peak_interval)
+
+        # 次の確認までに公開が多い時間帯が始まるなら、開始時刻に確認する
+        next_time = now + interval
+        minute = now.hour * 60 + now.minute
+        base = now.replace(second=0, microsecond=0)
+        for start, _ in self.peak_windows(store):
+            until = (start - minute) % MINUTES_PER_DAY
+            if until:
+                next_time = min(next_time, base + timedelta(minutes=until))
+        return next_time
+
+
+class Daemon:
+    """店舗ページを定期的に確認し、新しいチラシがあればパイプラインを実行する."""
+
+    def __init__(
+        self,
+        pipeline: Pipeline,
+        stores: list[StoreConfig],
+        schedule: PollSchedule,
+        after_run: Callable[[dict[str, bool]], None] | None = None,
+        daily: Callable[[], None] | None = None,
+        workers: int = 4,
+    ):
+        """
+        Args:
+            after_run: パイプライン実行後に結果を渡して呼ぶ（レポート出力など）
+            daily: 日付が変わったら呼ぶ（古い画像の削除など）
+            workers: 店舗ページを並行に確認する数
+        """
+        self.pipeline = pipeline
+        self.stores = stores
+        self.schedule = schedule
+        self.after_run = after_run
+        self.daily = daily
+        self.workers = max(1, workers)
+        self._stop = threading.Event()
+        # shop_id → 直近に確認したチラシID / 条件付き取得の検証子
+        self._known: dict[str, set[str]] = {}
+        self._validators: dict[str, dict] = {}
+        self._today = date.today()
+
+    def stop(self, *_) -> None:
+        """実行中のパイプラインが終わったら停止する."""
+        if not self._stop.is_set():
+            logger.info("停止要求を受け付けました")
+        self._stop.set()
+
+    def run(self) -> None:
+        """停止要求があるまで確認を繰り返す. 初回は全店舗を処理する."""
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, self.stop)
+        logger.info("常駐モード開始: %d店舗", len(self.stores))
+
+        now = datetime.now()
+        next_poll = {s.shop_id: now for s in self.stores}
+        while not self._stop.is_set():
+            now = datetime.now()
+            due = [s for s in self.stores if next_poll[s.shop_id] <= now]
+            if not due:
+                wait = (min(next_poll.values()) - now).total_seconds()
+                self._stop.wait(max(1.0, wait))
+                continue
+            try:
+                self.poll(due)
+            except Exception as e:
+                logger.error("確認処理エラー: %s", e, exc_info=True)
+            now = datetime.now()
+            for store in due:
+                next_poll[store.shop_id] = self.schedule.next_poll(store, now)
+            self._maintain()
+            logger.info(
+                "次回の確認: %s",
+                min(next_poll.values()).strftime("%H:%M"),
+            )
+        logger.info("常駐モード終了")
+
+    def poll(self, stores: list[StoreConfig]) -> dict[str, bool]:
+        """店舗ページを確認し、新しいチラシが現れた店舗を処理する.
+
+        処理を完了できなかった店舗は、次回の確認でも新しいチラシとして扱う。
+        """
+        with ThreadPoolExecutor(
+            max_workers=min(self.workers, len(stores)), thread_name_prefix="poll"
+        ) as executor:
+            found = dict(zip(
+                (s.shop_id for s in stores), executor.map(self._check, stores)
+            ))
+        changed = [s for s in stores if found[s.shop_id]]
+        if not changed:
+            logger.info("新しいチラシなし (%d店舗を確認)", len(stores))
+            return {}
+
+        results = self.pipeline.run(changed)
+        for store in self.pipeline.committed:
+            if found.get(store.shop_id):
+                self._accept(store, *found[store.shop_id])
+        if self.after_run:
+            self.after_run(results)
+        return results
+
+    def _check(self, store: StoreConfig) -> tuple[list[str], dict, bool] | None:
+        """新しいチラシIDがあれば (チラシID, 検証子, 学習対象か) を返す.
+
+        起動後の初回は、確認できた店舗をすべて処理対象とする。
+        """
+        validators = dict(self._validators.get(store.shop_id, {}))
+        ids = self.pipeline.shufoo.peek_chirashi_ids(store, validators)
+        if ids is None:
+            return None
+        known = self._known.get(store.shop_id)
+        new = [cid for cid in ids if known is None or cid not in known]
+        if not new:
+            self._accept(store, ids, validators, False)
+            return None
+        if known is not None:
+            logger.info("新しいチラシ: %s %s", store.name, ", ".join(new))
+        return ids, validators, known is not None
+
+    def _accept(
+        self, store: StoreConfig, ids: list[str], validators: dict, learn: bool
+    ) -> None:
+        """処理済みのチラシIDとして記録する."""
+        self._known[store.shop_id] = set(ids)
+        self._validators[store.shop_id] = validators
+        if learn:
+            self.schedule.record_publish(store, datetime.now())
+
+    def _maintain(self) -> None:
+        today = date.today()
+        if today != self._today:
+            self._today = today
+            if self.daily:
+                try:
+                    self.daily()
+                except Exception as e:
+                    logger.error("日次処理エラー: %s", e)
@@ -10,6 +10,30 @@ class StoreConfig:
     name: str
     shop_id: str
     enabled: bool = True
+    # 常駐モードの確認間隔（分）と公開が多い時間帯。None なら daemon 設定に従う
+    poll_minutes: int | None = None
+    peak_hours: list[str] | None = None
+    # 必要なページ幅(px)。None なら download.resolution に従う
+    target_width: int | None = None
+    # 処理の優先度（大きいほど先に処理し、時間切れで品質を落とされにくい）
+    priority: int = 0
+
+
+@dataclass
+class Recipient:
+    """LINEの送信先."""
+    user_id: str
+    # 購読する店舗（shopId または店舗名）。None なら全店舗
+    stores: set[str] | None = None
+    # 端末に必要なページ幅(px)
+    target_width: int | None = None
+
+    def subscribes(self, store: StoreConfig) -> bool:
+        return (
+            self.stores is None
+            or store.shop_id in self.stores
+            or store.name in self.stores
+        )
 
 
 @dataclass
@@ -19,6 +43,15 @@ class Chirashi:
     store: StoreConfig
     title: str
     image_urls: list[str]
-    publish_start: datetime
-    publish_end: datetime
+    # タイル情報の取得時に日付パスから設定する
+    publish_start: datetime | None = None
+    publish_end: datetime | None = None
     local_image_paths: list[str] = field(default_factory=list)
+    # local_image_paths と対応する各ページのタイル群のハッシュ
+    page_hashes: list[str] = field(default_factory=list)
+    # 結合時にメモリ上で作ったプレビューJPEG（未生成のページはNone）
+    previews: list[bytes | None] = field(default_factory=list)
+    # 今回結合したページの幅（保存済みのページを再利用した分は含まない）
+    page_widths: list[int] = field(default_factory=list)
+    # 実行時間の上限のためズームかページ数を減らして送る（次回に送り直す）
+    degraded: bool = False
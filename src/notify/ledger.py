@@ -0,0 +1,97 @@
+"""送信済みチラシの台帳.
+
+(店舗, chirashi_id) ごとに送信時のタイル構成・ページハッシュ・送信日時を
+data/ledger.json に記録する。ダウンロード前にタイル構成を、
+送信前にページハッシュを照合し、送信済みで変化のないチラシを省く。
+品質を落として送ったチラシ（degraded）は未送信として扱い、次回に送り直す。
+"""
+
+import logging
+from datetime import datetime, timedelta
+
+from src.models import Chirashi
+from src.utils.json_store import JsonStore
+
+logger = logging.getLogger(__name__)
+
+
+def _key(chirashi: Chirashi) -> str:
+    return f"{chirashi.store.shop_id}/{chirashi.chirashi_id}"
+
+
+def _zoom(chirashi: Chirashi) -> int | None:
+    tile_info = getattr(chirashi, "_tile_info", None)
+    return tile_info.get("zoom") if tile_info else None
+
+
+def _layout(chirashi: Chirashi) -> list:
+    """ダウンロード前に分かるチラシの構成（タイル数 or 画像URL）."""
+    tile_info = getattr(chirashi, "_tile_info", None)
+    if tile_info and tile_info.get("pages"):
+        return [[p["page"], p["tile_count"]] for p in tile_info["pages"]]
+    return list(chirashi.image_urls)
+
+
+class DeliveryLedger:
+    """送信済みチラシを永続化する台帳."""
+
+    def __init__(self, path: str = "data/ledger.json", retention_days: int = 30):
+        self._store = JsonStore(path)
+        self._purge(retention_days)
+
+    def is_sent(self, chirashi: Chirashi) -> bool:
+        """同じ構成のまま送信済みか（ダウンロード前の判定）.
+
+        送信時とズームが異なる場合（解像度の設定を変えた場合）はタイル数が
+        変わるため、ページ数だけで比べる。品質を落として送った場合は
+        送信済みとしない。
+        """
+        with self._store.lock:
+            entry = self._store.data.get(_key(chirashi))
+        if entry is None or entry.get("degraded"):
+            return False
+        layout = _layout(chirashi)
+        if entry.get("zoom", _zoom(chirashi)) != _zoom(chirashi):
+            return len(entry["layout"]) == len(layout)
+        return entry["layout"] == layout
+
+    def is_known(self, chirashi: Chirashi) -> bool:
+        """一度でも送信したことがあるか."""
+        with self._store.lock:
+            return _key(chirashi) in self._store.data
+
+    def is_unchanged(self, chirashi: Chirashi) -> bool:
+        """送信済みのページと内容が同じか（ダウンロード後の判定）."""
+        with self._store.lock:
+            entry = self._store.data.get(_key(chirashi))
+        return (
+            entry is not None
+            and bool(chirashi.page_hashes)
+            and entry["page_hashes"] == chirashi.page_hashes
+        )
+
+    def record(self, chirashi: Chirashi) -> None:
+        with self._store.lock:
+            self._store.data[_key(chirashi)] = {
+                "store": chirashi.store.name,
+                "chirashi_id": chirashi.chirashi_id,
+                "layout": _layout(chirashi),
+                "zoom": _zoom(chirashi),
+                "page_hashes": chirashi.page_hashes,
+                "degraded": chirashi.degraded,
+                "sent_at": datetime.now().isoformat(timespec="seconds"),
+            }
+            self._store.save()
+
+    def _purge(self, retention_days: int) -> None:
+        cutoff = datetime.now() - timedelta(days=retention_days)
+        with self._store.lock:
+            expired = [
+                key for key, entry in self._store.data.items()
+                if datetime.fromisoformat(entry["sent_at"]) < cutoff
+            ]
+            for key in expired:
+                del self._store.data[key]
+            if expired:
+                self._store.save()
+                logger.debug("古い送信記録を%d件削除", len(expired))
@@ -1,87 +1,403 @@
-"""LINE Messaging API v3 でチラシ画像を送信する."""
+"""LINE Messaging API v3 でチラシ画像を送信する.
 
+1リクエストには最大5メッセージまで入れられ、月間の送信数はメッセージ数
+ではなくリクエスト数（× 宛先数）で数えられる。そのため送信するチラシを
+送信待ちに溜め、店舗・チラシをまたいでメッセージを5件ずつ詰めて送る。
+
+送信先が複数いる場合は、購読する店舗の組み合わせが同じ送信先をまとめ、
+同じメッセージ（同じ画像URL）をマルチキャストで送る。送信先のグループ間は
+並行に送り、グループ内はチラシが分かれないよう順に送る。
+同じチェーンの複数店舗に掲載されたチラシは1件として送り、見出しに店舗を並べる。
+
+段階的な送信（push_now）では送信待ちを経ずにすぐ送る。1ページ目を先に送り、
+残りのページは後から送るため、リクエスト数は増えるが最初の画像が早く届く。
+
+line-bot-sdk は読み込みに時間がかかるため、実際に送信する時まで読み込まない。
+"""
+
+import importlib.util
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 
-from src.models import Chirashi, StoreConfig
-from src.utils.image_uploader import create_preview, upload_image
+from src.models import Chirashi, Recipient, StoreConfig
+from src.utils.image_uploader import ImageUploader
+from src.utils.metrics import metrics
+from src.utils.resilience import resilience
 
 logger = logging.getLogger(__name__)
 
+MAX_MESSAGES_PER_REQUEST = 5
+MAX_MULTICAST_RECIPIENTS = 500
+# 流量制限・サーキットブレーカーの単位
+LINE_API_HOST = "api.line.me"
+# 送信リクエストのタイムアウト（秒。応答時間から短くする上限）
+PUSH_TIMEOUT = 30.0
+
+
+@dataclass
+class _Outgoing:
+    """送信待ちのチラシ1件分のメッセージ."""
+    # 同じチラシを掲載する店舗ごとのチラシ
+    chirashis: list[Chirashi]
+    messages: list
+
+    def subscribed_by(self, recipient: Recipient) -> bool:
+        return any(recipient.subscribes(c.store) for c in self.chirashis)
+
+
+def pack_messages(outgoing: list[_Outgoing]) -> list[tuple[list, set[int]]]:
+    """メッセージを順序を保って5件ずつのリクエストに詰める.
+
+    Returns:
+        (メッセージ, 含まれる送信待ちの番号) のリスト
+    """
+    batches: list[tuple[list, set[int]]] = []
+    for idx, item in enumerate(outgoing):
+        for message in item.messages:
+            if not batches or len(batches[-1][0]) >= MAX_MESSAGES_PER_REQUEST:
+                batches.append(([], set()))
+            batches[-1][0].append(message)
+            batches[-1][1].add(idx)
+    return batches
+
 
 class LineNotifier:
     """LINE Messaging API v3でチラシ画像をプッシュ送信する."""
 
-    def __init__(self, channel_access_token: str, user_id: str):
-        self.user_id = user_id
-        try:
-            from linebot.v3.messaging import (
-                ApiClient,
-                Configuration,
-                MessagingApi,
-            )
-            config = Configuration(access_token=channel_access_token)
-            self._api_client = ApiClient(config)
-            self._api = MessagingApi(self._api_client)
-            self._available = True
-        except ImportError:
+    def __init__(
+        self,
+        channel_access_token: str,
+        user_id: str | None = None,
+        uploader: ImageUploader | None = None,
+        api=None,
+        recipients: list[Recipient] | None = None,
+        workers: int = 4,
+    ):
+        """
+        Args:
+            api: MessagingApi 互換オブジェクト（省略時はトークンから生成）
+            recipients: 送信先（省略時は user_id の1人が全店舗を購読）
+            workers: 送信先グループを並行に送る数
+        """
+        self.recipients = recipients or [Recipient(user_id=user_id)]
+        self.workers = max(1, workers)
+        self.uploader = uploader or ImageUploader()
+        self._outbox: list[_Outgoing] = []
+        self._outbox_lock = threading.Lock()
+        self._token = channel_access_token
+        self._api = api
+        self._api_lock = threading.Lock()
+        # push_now で使える残り送信数（未取得は False、上限なしは None）
+        self._quota: int | None | bool = False
+        self._quota_lock = threading.Lock()
+        self._available = (
+            api is not None or importlib.util.find_spec("linebot") is not None
+        )
+        if not self._available:
             logger.warning(
                 "line-bot-sdk がインストールされていません。"
                 "LINE通知は無効です。"
             )
-            self._available = False
 
-    def send_chirashi(self, store: StoreConfig, chirashi: Chirashi) -> bool:
-        """チラシのテキスト情報と画像をLINEで送信する."""
+    @property
+    def available(self) -> bool:
+        return self._available
+
+    @property
+    def api(self):
+        """MessagingApi（初回の利用時に生成する）."""
+        with self._api_lock:
+            if self._api is None:
+                from linebot.v3.messaging import (
+                    ApiClient,
+                    Configuration,
+                    MessagingApi,
+                )
+                config = Configuration(access_token=self._token)
+                self._api_client = ApiClient(config)
+                self._api = MessagingApi(self._api_client)
+        return self._api
+
+    def warm_up(self) -> None:
+        """line-bot-sdk をバックグラウンドで読み込んでおく.
+
+        段階的な送信では最初のメッセージ作成が読み込み待ちになるため、
+        タイル取得と並行して読み込む。
+        """
+        if self._available:
+            threading.Thread(
+                target=self._load_sdk, name="linebot-import", daemon=True
+            ).start()
+
+    def _load_sdk(self) -> None:
+        try:
+            import linebot.v3.messaging  # noqa: F401
+            self.api
+        except Exception as e:
+            logger.debug("line-bot-sdk の事前読み込み失敗: %s", e)
+
+    def upload_images(self, chirashi: Chirashi) -> list[tuple[str, str]]:
+        """全ページの画像とプレビューをアップロードする.
+
+        Returns:
+            (original_url, preview_url) のリスト
+        """
+        return self.uploader.upload_pages(
+            chirashi.local_image_paths, chirashi.previews
+        )
+
+    def build_messages(
+        self,
+        store: StoreConfig,
+        chirashi: Chirashi,
+        image_urls: list[tuple[str, str]],
+        stores: list[StoreConfig] | None = None,
+        pages: int | None = None,
+    ) -> list:
+        """見出しのテキストと各ページの画像メッセージを作る.
+
+        Args:
+            stores: チラシを掲載する店舗（省略時は store のみ）
+            pages: 見出しに書くページ数（省略時は取得済みの画像の数）
+        """
+        from linebot.v3.messaging import ImageMessage, TextMessage
+
+        pages = pages or len(chirashi.local_image_paths)
+        names = "、".join(s.name for s in stores or [store])
+        header = f"\U0001f4cb {names}\n{chirashi.title}({pages}p)"
+        messages = [TextMessage(text=header)]
+        for original_url, preview_url in image_urls:
+            messages.append(ImageMessage(
+                original_content_url=original_url,
+                preview_image_url=preview_url,
+            ))
+        return messages
+
+    def enqueue(
+        self,
+        chirashis: list[Chirashi],
+        image_urls: list[tuple[str, str]],
+    ) -> bool:
+        """チラシを送信待ちに追加する. 実際の送信は flush で行う.
+
+        Args:
+            chirashis: 同じチラシを掲載する店舗ごとのチラシ（1件として送る）
+        """
         if not self._available:
             return False
 
-        if not chirashi.local_image_paths:
-            logger.warning("送信する画像がありません: %s", store.name)
+        chirashi = chirashis[0]
+        store = chirashi.store
+        if not image_urls:
+            logger.error("画像アップロード全失敗: %s", store.name)
             return False
 
+        stores = [c.store for c in chirashis]
         try:
-            from linebot.v3.messaging import (
-                ImageMessage,
-                PushMessageRequest,
-                TextMessage,
-            )
-
-            pages = len(chirashi.local_image_paths)
-            header = f"\U0001f4cb {store.name}\n{chirashi.title}({pages}p)"
+            messages = self.build_messages(store, chirashi, image_urls, stores)
+        except Exception as e:
+            logger.error("LINEメッセージ作成失敗: %s", e)
+            return False
+        with self._outbox_lock:
+            self._outbox.append(_Outgoing(chirashis, messages))
+        logger.info(
+            "LINE送信待ち: %s (%d画像)",
+            "、".join(s.name for s in stores), len(image_urls),
+        )
+        return True
 
-            # テキスト + 画像（最大5メッセージ/リクエスト）
-            messages = [TextMessage(text=header)]
+    def push_now(
+        self,
+        chirashis: list[Chirashi],
+        image_urls: list[tuple[str, str]],
+        header: bool = True,
+        pages: int | None = None,
+    ) -> bool:
+        """送信待ちを経ずに、購読する全送信先へすぐ送る.
 
-            for img_path in chirashi.local_image_paths[:4]:
-                original_url = upload_image(img_path)
-                if not original_url:
-                    continue
+        見出しを含む最初の送信で、続きのページの分（pages まで）も含めて
+        月間の残り送信数を確保する。足りない場合は送らずに False を返す
+        （呼び出し側は送信待ちに回す）。
 
-                preview_path = create_preview(img_path)
-                preview_url = upload_image(preview_path)
-                if not preview_url:
-                    preview_url = original_url
+        Args:
+            chirashis: 同じチラシを掲載する店舗ごとのチラシ（1件として送る）
+            header: 見出しのテキストを含めるか（続きのページではFalse）
+            pages: チラシ全体のページ数（見出しにも書く）
+        """
+        if not self._available or not image_urls:
+            return False
 
-                messages.append(ImageMessage(
-                    original_content_url=original_url,
-                    preview_image_url=preview_url,
-                ))
+        chirashi = chirashis[0]
+        stores = [c.store for c in chirashis]
+        try:
+            messages = self.build_messages(
+                chirashi.store, chirashi, image_urls, stores, pages
+            )
+        except Exception as e:
+            logger.error("LINEメッセージ作成失敗: %s", e)
+            return False
+        if not header:
+            messages = messages[1:]
+        item = _Outgoing(chirashis, messages)
+        user_ids = [r.user_id for r in self.recipients if item.subscribed_by(r)]
+        if not user_ids:
+            return True
+        batches = pack_messages([item])
+        rest = max(0, (pages or 0) - len(image_urls))
+        requests = len(batches) + -(-rest // MAX_MESSAGES_PER_REQUEST)
+        if header and not self._reserve(requests * len(user_ids)):
+            logger.warning(
+                "月間の送信数の上限が近いため、すぐには送信しません: %s",
+                "、".join(s.name for s in stores),
+            )
+            return False
+        for batch, _ in batches:
+            if not self._send(batch, user_ids):
+                return False
+        logger.info(
+            "LINE送信: %s (%d画像)", "、".join(s.name for s in stores), len(image_urls)
+        )
+        return True
 
-            if len(messages) <= 1:
-                logger.error("画像アップロード全失敗: %s", store.name)
+    def _reserve(self, count: int) -> bool:
+        """残り送信数から count を確保する. 残り送信数は最初の1回だけ取得する."""
+        with self._quota_lock:
+            if self._quota is False:
+                self._quota = self.remaining_quota()
+            if self._quota is None:
+                return True
+            if self._quota < count:
                 return False
+            self._quota -= count
+            return True
 
-            self._api.push_message(PushMessageRequest(
-                to=self.user_id,
-                messages=messages,
-            ))
+    def flush(self) -> tuple[list[Chirashi], list[Chirashi]]:
+        """送信待ちをまとめて送信する.
+
+        月間の残り送信数が足りない場合は、各グループで送れる分だけを
+        先頭から送る。購読者のいない店舗のチラシは送信済みとして扱う。
+
+        Returns:
+            (送信できたチラシ, 送信できなかったチラシ)（いずれも店舗ごと）
+        """
+        with self._outbox_lock:
+            outgoing, self._outbox = self._outbox, []
+        with self._quota_lock:
+            reserved, self._quota = self._quota, False
+        if not outgoing:
+            return [], []
 
-            logger.info(
-                "LINE送信成功: %s (%d画像)",
-                store.name, len(messages) - 1,
+        # 受け取るチラシの組み合わせが同じ送信先をまとめる
+        groups: dict[tuple[int, ...], list[str]] = {}
+        for recipient in self.recipients:
+            indices = tuple(
+                i for i, o in enumerate(outgoing) if o.subscribed_by(recipient)
             )
-            return True
+            if indices:
+                groups.setdefault(indices, []).append(recipient.user_id)
+
+        remaining = self.remaining_quota()
+        if remaining is not None and reserved is not False and reserved is not None:
+            # push_now で送った分が消費量にまだ反映されていない場合に備える
+            remaining = min(remaining, reserved)
+        failed: set[int] = set()
+        plans = []
+        for indices, user_ids in groups.items():
+            items = [outgoing[i] for i in indices]
+            count = len(items)
+            if remaining is not None:
+                # 上限に収まる先頭のチラシだけを詰め直す（チラシの途中では切らない）
+                budget = remaining // len(user_ids)
+                while count and len(pack_messages(items[:count])) > budget:
+                    count -= 1
+                if count < len(items):
+                    logger.warning(
+                        "月間の送信数の上限が近いため %d/%dチラシのみ送信します "
+                        "(送信先%d人, 残り%d)",
+                        count, len(items), len(user_ids), remaining,
+                    )
+            batches = pack_messages(items[:count])
+            if remaining is not None:
+                remaining -= len(batches) * len(user_ids)
+            # 上限で送らなかった分は失敗扱い（次回の実行で送る）
+            failed.update(indices[count:])
+            plans.append((indices, batches, user_ids))
+
+        with ThreadPoolExecutor(
+            max_workers=min(self.workers, max(1, len(plans))),
+            thread_name_prefix="push",
+        ) as executor:
+            for group_failed in executor.map(lambda p: self._send_group(*p), plans):
+                failed |= group_failed
 
+        delivered = [
+            c for i, o in enumerate(outgoing) if i not in failed for c in o.chirashis
+        ]
+        undelivered = [
+            c for i, o in enumerate(outgoing) if i in failed for c in o.chirashis
+        ]
+        logger.info(
+            "LINE送信: %dチラシ / 送信先%dグループ / %dリクエスト (失敗 %dチラシ)",
+            len(outgoing) - len(failed), len(plans),
+            sum(len(p[1]) for p in plans), len(failed),
+        )
+        return delivered, undelivered
+
+    def _send_group(
+        self,
+        indices: tuple[int, ...],
+        batches: list[tuple[list, set[int]]],
+        user_ids: list[str],
+    ) -> set[int]:
+        """1グループ分を順に送り、失敗した送信待ちの番号を返す."""
+        failed: set[int] = set()
+        for batch, local in batches:
+            if not self._send(batch, user_ids):
+                failed.update(indices[i] for i in local)
+        return failed
+
+    def remaining_quota(self) -> int | None:
+        """今月の残り送信数. 上限なし・取得失敗の場合はNone."""
+        try:
+            quota = self.api.get_message_quota()
+            if quota.type != "limited":
+                return None
+            usage = self.api.get_message_quota_consumption().total_usage
         except Exception as e:
-            logger.error("LINE送信失敗: %s", e)
-            return False
+            logger.warning("送信数の上限を取得できません: %s", e)
+            return None
+        remaining = max(0, quota.value - usage)
+        logger.info("LINE送信数: 今月 %d/%d (残り%d)", usage, quota.value, remaining)
+        return remaining
+
+    def _send(self, messages: list, user_ids: list[str]) -> bool:
+        """送信先が1人ならプッシュ、複数ならマルチキャスト（500人ずつ）で送る.
+
+        LINE APIのサーキットが開いている場合は送らずに失敗とする（次回の実行で送る）。
+        """
+        from linebot.v3.messaging import MulticastRequest, PushMessageRequest
+
+        guard = resilience.guard(LINE_API_HOST)
+        ok = True
+        for start in range(0, len(user_ids), MAX_MULTICAST_RECIPIENTS):
+            chunk = user_ids[start:start + MAX_MULTICAST_RECIPIENTS]
+            try:
+                with guard.request(PUSH_TIMEOUT) as attempt, metrics.span("push"):
+                    if len(chunk) == 1:
+                        self.api.push_message(PushMessageRequest(
+                            to=chunk[0], messages=messages,
+                        ), _request_timeout=attempt.timeout)
+                    else:
+                        self.api.multicast(MulticastRequest(
+                            to=chunk, messages=messages,
+                        ), _request_timeout=attempt.timeout)
+            except Exception as e:
+                logger.error("LINE送信失敗 (送信先%d人): %s", len(chunk), e)
+                ok = False
+                continue
+            metrics.count("push_requests")
+            metrics.count("push_messages", len(messages))
+            metrics.count("push_recipients", len(chunk))
+        return ok
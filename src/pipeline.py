@@ -0,0 +1,492 @@
+"""チラシ取得 → 計画 → ダウンロード → アップロード → LINE送信 パイプライン.
+
+まず全店舗の店舗ページを並行に取得し、見つかったチラシを chirashi_id で
+まとめる（同じチェーンの店舗は同じチラシを掲載していることが多い）。
+まとめたチラシごとにタイル探索・ダウンロード・アップロードを1回だけ行い、
+掲載する全店舗を並べた1件のメッセージとして送る。
+
+店舗・チラシはそれぞれ独立したタスクとして並行実行し、ステージごとの
+同時実行数をセマフォで制限する。ある店舗・チラシで例外が起きても
+他には影響しない。タスク内のログは完了時にまとめて出力し、順序を保つ。
+LINE送信は全チラシの処理後にまとめて行い、チラシをまたいでリクエストを詰める。
+
+progressive を有効にすると、初めて送るチラシは1ページ目の結合が終わった
+時点でアップロード・送信し、残りのページは全ページの取得後に送る。
+
+scheduler を指定すると、店舗・チラシを優先度の高い順に処理し、実行時間の
+予算が足りなければズーム・ページ数を落とす（src.scheduler を参照）。
+"""
+
+import contextvars
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from src.models import Chirashi, StoreConfig
+from src.notify.ledger import DeliveryLedger
+from src.notify.line_notifier import LineNotifier
+from src.scheduler import BudgetScheduler
+from src.shufoo.client import DEFAULT_ZOOM, ShufooClient
+from src.shufoo.downloader import ChirashiDownloader, DownloadedPage
+from src.shufoo.resolution import ResolutionPolicy
+from src.utils.concurrency import submit_with_context
+from src.utils.logging_config import buffered_logs
+from src.utils.metrics import max_rss_kb, metrics
+
+logger = logging.getLogger(__name__)
+
+STAGES = ("scrape", "download", "upload", "push")
+# 処理時間の学習に使うステージ
+COSTED_STAGES = ("download", "upload")
+
+# 処理中のチラシについて、COSTED_STAGES で実際に処理した秒数（セマフォの
+# 待ち時間を除く）を集める
+_flyer_work: contextvars.ContextVar[
+    list[tuple[str, float]] | None
+] = contextvars.ContextVar("flyer_work", default=None)
+
+# stores: 同時に処理する店舗数、その他: 各ステージの同時実行数
+DEFAULT_CONCURRENCY = {
+    "stores": 4,
+    "scrape": 4,
+    "download": 2,
+    "upload": 4,
+    "push": 1,
+}
+
+
+@dataclass
+class FlyerPlan:
+    """同じチラシ（chirashi_id）を掲載する店舗のまとまり."""
+    chirashi_id: str
+    # 店舗ごとのチラシ（店舗の処理順）
+    chirashis: list[Chirashi]
+
+
+def plan_flyers(listings: list[list[Chirashi]]) -> list[FlyerPlan]:
+    """店舗ごとのチラシ一覧を chirashi_id でまとめる（最初に現れた順）."""
+    plans: dict[str, FlyerPlan] = {}
+    for chirashis in listings:
+        for chirashi in chirashis:
+            plan = plans.setdefault(
+                chirashi.chirashi_id, FlyerPlan(chirashi.chirashi_id, [])
+            )
+            if all(c.store.shop_id != chirashi.store.shop_id for c in plan.chirashis):
+                plan.chirashis.append(chirashi)
+    return list(plans.values())
+
+
+class Pipeline:
+    """複数店舗のチラシ処理を並行実行する."""
+
+    def __init__(
+        self,
+        shufoo: ShufooClient,
+        downloader: ChirashiDownloader,
+        line: LineNotifier,
+        concurrency: dict | None = None,
+        ledger: DeliveryLedger | None = None,
+        resolution: ResolutionPolicy | None = None,
+        progressive: bool = False,
+        scheduler: BudgetScheduler | None = None,
+    ):
+        """
+        Args:
+            progressive: 新しいチラシの1ページ目を取得しだい送る
+            scheduler: 優先度順の処理と、実行時間の予算に合わせた品質の調整
+        """
+        self.shufoo = shufoo
+        self.downloader = downloader
+        self.line = line
+        self.ledger = ledger
+        self.resolution = resolution
+        self.progressive = progressive
+        if progressive:
+            self.line.warm_up()
+        self.scheduler = scheduler
+        self.concurrency = {**DEFAULT_CONCURRENCY, **(concurrency or {})}
+        self._limits = {
+            stage: threading.BoundedSemaphore(
+                max(1, int(self.concurrency[stage]))
+            )
+            for stage in STAGES
+        }
+        self._stats_lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """ステージごとの集計を消す（常駐モードで実行ごとに呼ぶ）."""
+        with self._stats_lock:
+            self.stage_stats = {
+                stage: {"calls": 0, "seconds": 0.0, "peak_rss_kb": 0}
+                for stage in STAGES
+            }
+
+    @contextmanager
+    def _stage(self, name: str):
+        """ステージの同時実行数を制限し、所要時間を集計する.
+
+        peak_rss_kb はステージ終了時点のプロセス最大RSS（店舗を並行処理
+        するため、他ステージの分も含みうる）。
+        """
+        with self._limits[name]:
+            start = time.perf_counter()
+            try:
+                yield
+            finally:
+                elapsed = time.perf_counter() - start
+                work = _flyer_work.get()
+                if work is not None and name in COSTED_STAGES:
+                    work.append((name, elapsed))
+                rss = max_rss_kb()
+                with self._stats_lock:
+                    stats = self.stage_stats[name]
+                    stats["calls"] += 1
+                    stats["seconds"] += elapsed
+                    stats["peak_rss_kb"] = max(stats["peak_rss_kb"], rss)
+
+    def run(self, stores: list[StoreConfig]) -> dict[str, bool]:
+        """全店舗を処理し、店舗名 → 成功可否 を返す."""
+        if self.scheduler:
+            self.scheduler.start()
+            stores = sorted(stores, key=lambda s: -s.priority)
+        workers = max(1, min(int(self.concurrency["stores"]), len(stores)))
+        results: dict[str, bool] = {}
+        # 送信待ち以外の処理をすべて終えた店舗
+        self._completed: list[StoreConfig] = []
+        # 店舗ページを処理済みとして記録した（または前回から変化のない）店舗
+        self.committed: list[StoreConfig] = []
+
+        with ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="store"
+        ) as executor:
+            futures = {
+                executor.submit(self._scrape_store, store): store
+                for store in stores
+            }
+            listings: dict[str, list[Chirashi]] = {}
+            for future, store in futures.items():
+                chirashis = future.result()
+                results[store.name] = chirashis is not False
+                if chirashis is None or chirashis is False:
+                    continue
+                if chirashis:
+                    listings[store.shop_id] = chirashis
+                else:
+                    self._completed.append(store)
+
+            plans = plan_flyers(list(listings.values()))
+            if self.scheduler:
+                plans = self.scheduler.order(
+                    plans, lambda p: p.chirashis, self._is_new
+                )
+            shared = sum(len(p.chirashis) - 1 for p in plans)
+            if shared:
+                logger.info(
+                    "チラシ %d件 (複数店舗で共通のため %d件を省略)",
+                    len(plans), shared,
+                )
+            done = dict(zip(
+                (p.chirashi_id for p in plans),
+                executor.map(self._run_flyer, plans),
+            ))
+
+        for store in stores:
+            chirashis = listings.get(store.shop_id)
+            if chirashis and all(done[c.chirashi_id] for c in chirashis):
+                self._completed.append(store)
+        for plan in plans:
+            if done[plan.chirashi_id] is None:
+                for chirashi in plan.chirashis:
+                    results[chirashi.store.name] = False
+
+        # 送信待ちのまま送れなかったチラシがある店舗は失敗（次回の実行で送る）
+        pending = self._flush()
+        for store in stores:
+            if store.shop_id in pending:
+                results[store.name] = False
+        ok = sum(results.values())
+        logger.info("処理完了: %d/%d店舗", ok, len(results))
+        return results
+
+    def _flush(self) -> set[str]:
+        """送信待ちを送信し、台帳と店舗ページのキャッシュを確定させる.
+
+        Returns:
+            送信できなかったチラシのある店舗の shop_id
+        """
+        if self.line.available:
+            with self._stage("push"):
+                delivered, undelivered = self.line.flush()
+            if self.ledger:
+                for chirashi in delivered:
+                    self.ledger.record(chirashi)
+            pending = {c.store.shop_id for c in undelivered}
+        else:
+            pending = set()
+        for store in self._completed:
+            if store.shop_id not in pending:
+                self.shufoo.commit_shop_page(store)
+                self.committed.append(store)
+        return pending
+
+    def _scrape_store(self, store: StoreConfig) -> list[Chirashi] | None | bool:
+        """店舗ページからチラシ一覧を取得する.
+
+        Returns:
+            チラシ一覧。店舗ページが前回から変わっていなければ None、
+            例外が起きた場合は False（例外は店舗単位で握りつぶす）
+        """
+        with buffered_logs(), metrics.labels(store=store.name, chirashi=""):
+            logger.info("--- %s ---", store.name)
+            try:
+                with self._stage("scrape"):
+                    chirashis = self.shufoo.list_chirashis(store)
+            except Exception as e:
+                logger.error("  %s エラー: %s", store.name, e)
+                return False
+            if chirashis is None:
+                # 前回の処理完了時から店舗ページが変わっていない
+                self.committed.append(store)
+            elif not chirashis:
+                logger.info("  チラシなし")
+            return chirashis
+
+    def _is_new(self, plan: FlyerPlan) -> bool:
+        """一度も送っていないチラシか."""
+        return not self.ledger or not any(
+            self.ledger.is_known(c) for c in plan.chirashis
+        )
+
+    def _run_flyer(self, plan: FlyerPlan) -> bool | None:
+        """1チラシ分を処理する. 例外が起きた場合は None を返す."""
+        store = plan.chirashis[0].store
+        with buffered_logs(), metrics.labels(
+            store=store.name, chirashi=plan.chirashi_id
+        ):
+            logger.info(
+                "--- chirashi %s (%s) ---",
+                plan.chirashi_id, "、".join(c.store.name for c in plan.chirashis),
+            )
+            work: list[tuple[str, float]] = []
+            token = _flyer_work.set(work)
+            try:
+                result = self._process_flyer(plan)
+            except Exception as e:
+                logger.error("  chirashi %s エラー: %s", plan.chirashi_id, e)
+                return None
+            finally:
+                _flyer_work.reset(token)
+            if self.scheduler:
+                self._observe_cost(plan.chirashis, work)
+            return result
+
+    def _observe_cost(
+        self, chirashis: list[Chirashi], work: list[tuple[str, float]]
+    ) -> None:
+        """ダウンロード・アップロードの処理時間を学習する.
+
+        アップロードまで進まなかったチラシ、保存済みのページ・アップロード済みの
+        URLを再利用したチラシ、アップロードをリトライしたチラシは、処理時間が
+        通常と異なり見積もりを誤らせるため学習しない。
+        """
+        downloaded = [c for c in chirashis if c.local_image_paths]
+        if not downloaded or {name for name, _ in work} != set(COSTED_STAGES):
+            return
+        lead = downloaded[0]
+        if (
+            len(lead.page_widths) < len(lead.local_image_paths)
+            or metrics.value("upload_cache_hits")
+            or metrics.value("upload_errors")
+        ):
+            logger.debug("  再利用・リトライがあったため処理時間を学習しません")
+            return
+        self.scheduler.observe(lead, sum(seconds for _, seconds in work))
+
+    def _process_flyer(self, plan: FlyerPlan) -> bool:
+        """送信待ちに入れた（またはスキップ可能）ならTrueを返す.
+
+        タイル探索・ダウンロード・アップロードは掲載店舗の数によらず1回だけ行う。
+        """
+        stores = [c.store for c in plan.chirashis]
+        zooms = None
+        if self.resolution:
+            target = self.resolution.target_for(stores, self.line.recipients)
+            zooms = self.resolution.zooms_for(stores, target)
+        lowered = False
+        if self.scheduler:
+            requested = zooms or [DEFAULT_ZOOM]
+            zooms = self.scheduler.zooms_for(requested)
+            if zooms is None:
+                return False
+            lowered = zooms[0] < requested[0]
+        with self._stage("scrape"):
+            if not self.shufoo.resolve_tiles(plan.chirashis, zooms):
+                return False
+        if lowered:
+            # 下げたズームで見つかった場合のみ（元のズームなら品質は同じ）
+            tile_info = getattr(plan.chirashis[0], "_tile_info", None) or {}
+            lowered = tile_info.get("zoom", requested[0]) < requested[0]
+
+        chirashis = plan.chirashis
+        if self.ledger:
+            for chirashi in chirashis:
+                if self.ledger.is_sent(chirashi):
+                    logger.info("  送信済みのためスキップ: %s", chirashi.store.name)
+            chirashis = [c for c in chirashis if not self.ledger.is_sent(c)]
+            if not chirashis:
+                return True
+
+        lead = chirashis[0]
+        degraded = lowered
+        if self.scheduler:
+            fit, total = self._fit_pages(chirashis)
+            if total and not fit:
+                return False
+            degraded = degraded or fit < total
+        for chirashi in chirashis:
+            chirashi.degraded = degraded
+        # 1ページ目の送信（残りのページの取得と並行に行う）
+        first: Future | None = None
+        with self._stage("download"):
+            if self._can_push_early(chirashis):
+                first = self._download_pushing_first(chirashis)
+            else:
+                self.downloader.download(lead)
+        if not lead.local_image_paths:
+            logger.warning("  画像取得失敗")
+            return False
+        if self.resolution:
+            for store in stores:
+                self.resolution.observe(
+                    store, lead._tile_info["zoom"], lead.page_widths
+                )
+        for chirashi in chirashis[1:]:
+            chirashi.local_image_paths = list(lead.local_image_paths)
+            chirashi.page_hashes = list(lead.page_hashes)
+            chirashi.previews = list(lead.previews)
+
+        if self.ledger:
+            unchanged = [c for c in chirashis if self.ledger.is_unchanged(c)]
+            for chirashi in unchanged:
+                logger.info("  内容に変化なしのためスキップ: %s", chirashi.store.name)
+                self.ledger.record(chirashi)
+            chirashis = [c for c in chirashis if c not in unchanged]
+            if not chirashis:
+                return not degraded
+
+        if not self.line.available:
+            return False
+
+        if first is not None and first.result():
+            sent = self._push_rest(chirashis)
+        else:
+            with self._stage("upload"):
+                image_urls = self.line.upload_images(chirashis[0])
+            if not self._uploaded_all(image_urls, lead.local_image_paths):
+                return False
+            sent = self.line.enqueue(chirashis, image_urls)
+        # 品質を落として送った場合は店舗ページを確定させず、次回の実行で
+        # 送り直す（台帳には degraded として記録され、送信済みとみなさない）
+        return sent and not degraded
+
+    @staticmethod
+    def _uploaded_all(image_urls: list, paths: list[str]) -> bool:
+        """全ページをアップロードできたか.
+
+        一部のページだけで送ると台帳に送信済みと記録され、欠けたページが
+        二度と送られないため、チラシごと次回の実行に回す。
+        """
+        if len(image_urls) < len(paths):
+            logger.error(
+                "  画像アップロード失敗: %d/%dページ（次回すべて送り直します）",
+                len(paths) - len(image_urls), len(paths),
+            )
+            return False
+        return True
+
+    def _fit_pages(self, chirashis: list[Chirashi]) -> tuple[int, int]:
+        """締め切りに間に合うページ数に減らし、(送るページ数, 全ページ数) を返す.
+
+        タイル情報のないチラシは減らさない（0, 0）。
+        """
+        tile_info = getattr(chirashis[0], "_tile_info", None)
+        if not tile_info or not tile_info.get("pages"):
+            return 0, 0
+        pages = tile_info["pages"]
+        fit = self.scheduler.max_pages(tile_info["zoom"], len(pages))
+        if 0 < fit < len(pages):
+            trimmed = {**tile_info, "pages": pages[:fit]}
+            for chirashi in chirashis:
+                chirashi._tile_info = trimmed
+        return fit, len(pages)
+
+    def _can_push_early(self, chirashis: list[Chirashi]) -> bool:
+        """1ページ目を先に送ってよいか. 送信済みのチラシの更新は対象外."""
+        if not self.progressive or not self.line.available:
+            return False
+        return not self.ledger or not any(
+            self.ledger.is_known(c) for c in chirashis
+        )
+
+    def _download_pushing_first(self, chirashis: list[Chirashi]) -> Future | None:
+        """全ページを取得しつつ、1ページ目の送信を別スレッドで始める.
+
+        Returns:
+            1ページ目の送信結果（ページが1枚も取れなければNone）
+        """
+        lead = chirashis[0]
+        first: Future | None = None
+        pages = []
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="first")
+        try:
+            for page in self.downloader.iter_pages(lead):
+                if not pages:
+                    first = submit_with_context(
+                        executor, self._push_first, chirashis, page
+                    )
+                pages.append(page)
+        finally:
+            executor.shutdown(wait=False)
+        self.downloader.apply_pages(lead, pages)
+        return first
+
+    def _push_first(self, chirashis: list[Chirashi], page: DownloadedPage) -> bool:
+        """1ページ目をアップロードして見出しとともに送る（残りの取得と並行）."""
+        lead = chirashis[0]
+        tile_info = getattr(lead, "_tile_info", None) or {}
+        try:
+            with self._stage("upload"):
+                image_urls = self.line.uploader.upload_pages(
+                    [str(page.path)], [page.preview]
+                )
+            with self._stage("push"):
+                return self.line.push_now(
+                    chirashis, image_urls,
+                    pages=len(tile_info.get("pages") or lead.image_urls) or None,
+                )
+        except Exception as e:
+            logger.error("  1ページ目の送信失敗: %s", e)
+            return False
+
+    def _push_rest(self, chirashis: list[Chirashi]) -> bool:
+        """1ページ目を送ったチラシの残りのページを送り、台帳に記録する."""
+        lead = chirashis[0]
+        if len(lead.local_image_paths) > 1:
+            with self._stage("upload"):
+                image_urls = self.line.uploader.upload_pages(
+                    lead.local_image_paths[1:], lead.previews[1:]
+                )
+            if not self._uploaded_all(image_urls, lead.local_image_paths[1:]):
+                return False
+            with self._stage("push"):
+                if not self.line.push_now(chirashis, image_urls, header=False):
+                    logger.warning("  2ページ目以降の送信失敗（次回すべて送り直します）")
+                    return False
+        if self.ledger:
+            for chirashi in chirashis:
+                self.ledger.record(chirashi)
+        return True
@@ -0,0 +1,196 @@
+"""実行時間の予算に合わせた処理順と品質の調整.
+
+GitHub Actions や cron の実行には時間の上限があるため、チラシを優先度の
+高い順に処理し、残り時間が足りなければ品質を落としてでも送る:
+
+  1. 優先度順に処理する（店舗の priority の最大値。初めて送るチラシは
+     new_flyer_boost を加える）
+  2. 1ページあたりの所要時間（ズームごと）と1チラシのページ数を
+     過去の実行から学習し（data/timings.json）、処理を始める前に見積もる
+  3. 見積もりが残り時間を超えるチラシは、小さいズームを先に試す
+  4. それでも足りなければ、間に合うページ数だけ送る（残りは次回の実行で
+     全ページを送り直す）。1ページも間に合わなければ次回に回す
+
+所要時間はダウンロード・アップロードで実際に処理した時間（ステージの
+空き待ちを除く）で学習し、再利用したページのあるチラシは学習に使わない。
+チラシごとに「今から始めて締め切りに間に合うか」で判断する。
+"""
+
+import logging
+import threading
+import time
+from collections.abc import Callable
+
+from src.models import Chirashi
+from src.utils.json_store import JsonStore
+
+logger = logging.getLogger(__name__)
+
+NEW_FLYER_BOOST = 10
+# 未学習のズームで仮定する1ページあたりの秒数（ズーム200での値。面積に比例）
+DEFAULT_SECONDS_PER_PAGE = 3.0
+REFERENCE_ZOOM = 200
+DEFAULT_PAGES = 4
+# 学習の重み（指数移動平均）
+LEARN_RATE = 0.3
+
+
+class CostModel:
+    """過去の実行から学習したチラシの処理時間."""
+
+    def __init__(self, path: str = "data/timings.json"):
+        self._store = JsonStore(path)
+
+    def per_page(self, zoom: int) -> float:
+        """1ページあたりの秒数. 未学習のズームは学習済みのズームから面積比で推定する."""
+        with self._store.lock:
+            learned = dict(self._store.data.get("per_page", {}))
+        if str(zoom) in learned:
+            return learned[str(zoom)]
+        if learned:
+            base_zoom, seconds = next(iter(learned.items()))
+            return seconds * (zoom / int(base_zoom)) ** 2
+        return DEFAULT_SECONDS_PER_PAGE * (zoom / REFERENCE_ZOOM) ** 2
+
+    def pages(self) -> float:
+        """1チラシの平均ページ数."""
+        with self._store.lock:
+            return self._store.data.get("pages", DEFAULT_PAGES)
+
+    def estimate(self, zoom: int, pages: float | None = None) -> float:
+        return self.per_page(zoom) * (self.pages() if pages is None else pages)
+
+    def observe(self, zoom: int, pages: int, seconds: float) -> None:
+        """1チラシの処理（ダウンロード〜アップロード）にかかった時間を記録する."""
+        if pages <= 0:
+            return
+        with self._store.lock:
+            data = self._store.data
+            per_page = data.setdefault("per_page", {})
+            sample = seconds / pages
+            old = per_page.get(str(zoom))
+            per_page[str(zoom)] = round(
+                sample if old is None else old + LEARN_RATE * (sample - old), 3
+            )
+            old_pages = data.get("pages")
+            data["pages"] = round(
+                pages if old_pages is None
+                else old_pages + LEARN_RATE * (pages - old_pages), 2
+            )
+            self._store.save()
+
+
+class BudgetScheduler:
+    """優先度順の並べ替えと、締め切りに合わせた品質の調整."""
+
+    def __init__(
+        self,
+        budget_seconds: float | None = None,
+        reserve_seconds: float = 30,
+        new_flyer_boost: int = NEW_FLYER_BOOST,
+        costs: CostModel | None = None,
+    ):
+        """
+        Args:
+            budget_seconds: 1回の実行にかけられる秒数（None なら調整しない）
+            reserve_seconds: 最後のLINE送信・後処理のために残しておく秒数
+            new_flyer_boost: 初めて送るチラシに加える優先度
+        """
+        self.budget_seconds = budget_seconds
+        self.reserve_seconds = reserve_seconds
+        self.new_flyer_boost = new_flyer_boost
+        self.costs = costs or CostModel()
+        self._deadline: float | None = None
+        self._lock = threading.Lock()
+        self.degraded = {"zoom": 0, "pages": 0, "skipped": 0}
+
+    @classmethod
+    def from_config(cls, config: dict) -> "BudgetScheduler":
+        return cls(
+            budget_seconds=config.get("seconds"),
+            reserve_seconds=config.get("reserve_seconds", 30),
+            new_flyer_boost=config.get("new_flyer_boost", NEW_FLYER_BOOST),
+            costs=CostModel(config.get("timings", "data/timings.json")),
+        )
+
+    def start(self) -> None:
+        """実行の開始時に呼び、締め切りを決める."""
+        self.degraded = {"zoom": 0, "pages": 0, "skipped": 0}
+        self._deadline = (
+            time.monotonic() + self.budget_seconds - self.reserve_seconds
+            if self.budget_seconds else None
+        )
+
+    def remaining(self) -> float | None:
+        """締め切りまでの秒数（予算なしはNone）."""
+        if self._deadline is None:
+            return None
+        return self._deadline - time.monotonic()
+
+    def priority(self, chirashis: list[Chirashi], new: bool) -> int:
+        base = max(c.store.priority for c in chirashis)
+        return base + (self.new_flyer_boost if new else 0)
+
+    def order(self, items: list, chirashis_of: Callable, is_new: Callable) -> list:
+        """優先度の高い順に並べる（同じ優先度は元の順）."""
+        ranked = sorted(
+            items,
+            key=lambda item: -self.priority(chirashis_of(item), is_new(item)),
+        )
+        remaining = self.remaining()
+        if remaining is not None and ranked:
+            estimate = self.costs.estimate(REFERENCE_ZOOM) * len(ranked)
+            logger.info(
+                "見積もり: %dチラシ 約%.0f秒（直列換算） / 残り%.0f秒",
+                len(ranked), estimate, remaining,
+            )
+        return ranked
+
+    def zooms_for(self, zooms: list[int]) -> list[int] | None:
+        """締め切りに間に合うよう試すズームの順を調整する. 時間切れならNone."""
+        remaining = self.remaining()
+        if remaining is None:
+            return zooms
+        if remaining <= 0:
+            self._count("skipped")
+            logger.warning("  実行時間の上限のため次回に回します")
+            return None
+        if self.costs.estimate(zooms[0]) <= remaining:
+            return zooms
+        lower = sorted(zooms)
+        if lower[0] < zooms[0]:
+            self._count("zoom")
+            logger.warning(
+                "  残り%.0f秒のためズームを下げます (%d → %d)",
+                remaining, zooms[0], lower[0],
+            )
+            return lower
+        return zooms
+
+    def max_pages(self, zoom: int, pages: int) -> int:
+        """締め切りまでに処理できるページ数（pages 以下、0 なら次回に回す）."""
+        remaining = self.remaining()
+        if remaining is None:
+            return pages
+        fit = min(pages, int(max(0.0, remaining) / self.costs.per_page(zoom)))
+        if fit == 0:
+            self._count("skipped")
+            logger.warning("  実行時間の上限のため次回に回します")
+        elif fit < pages:
+            self._count("pages")
+            logger.warning(
+                "  残り%.0f秒のため %d/%dページのみ送ります", remaining, fit, pages,
+            )
+        return fit
+
+    def _count(self, kind: str) -> None:
+        with self._lock:
+            self.degraded[kind] += 1
+
+    def observe(self, chirashi: Chirashi, seconds: float) -> None:
+        """ダウンロードしたチラシの処理時間（ダウンロード〜アップロード）を学習する."""
+        tile_info = getattr(chirashi, "_tile_info", None)
+        if tile_info and chirashi.local_image_paths:
+            self.costs.observe(
+                tile_info["zoom"], len(chirashi.local_image_paths), seconds
+            )
@@ -5,7 +5,7 @@ Shufoo!のチラシ画像はタイル方式で提供される:
 
   - chirashiId: チラシ固有ID（dataLayer/リンクから取得）
   - page: ページ番号（0始まり）
-  - zoom: ズームレベル（100=等倍, 200=2倍）
+  - zoom: ズームレベル（100=等倍, 200=2倍。src.shufoo.resolution で選ぶ）
   - tile: タイル番号（左上から右方向、次の行へ）
 
 注意: 店舗ページ上のタイルURL（ipqcache2）は広告用であり、
@@ -14,125 +14,315 @@ Shufoo!のチラシ画像はタイル方式で提供される:
 """
 
 import logging
-import re
-from datetime import datetime, timedelta
+import threading
+from collections.abc import Callable
+from datetime import date, datetime, timedelta
 
 import requests
 
 from src.models import Chirashi, StoreConfig
+from src.shufoo.discovery import TileDiscovery
+from src.shufoo.extractor import extract_shop_page
+from src.shufoo.layout_cache import TileLayoutCache
+from src.shufoo.page_cache import ShopPageCache, page_fingerprint
+from src.shufoo.page_check import BROWSER_HEADERS, SHOP_PAGE_URL
+from src.utils.content_store import sha256_hex
+from src.utils.http import guarded_request
+from src.utils.metrics import metrics
 
 logger = logging.getLogger(__name__)
 
 IMAGE_BASE_URL = "https://ipqcache2.shufoo.net"
 
+MAX_PAGES = 10
+DEFAULT_ZOOM = 200
+MAX_TILES = 20
+DATE_PROBE_DAYS = 8
+
+# 掲載終了日は公開日からの推定値
+PUBLISH_PERIOD = timedelta(days=3)
+
 
 class ShufooClient:
     """Shufoo!からチラシデータを取得するクライアント."""
 
-    def __init__(self, timeout: int = 30):
+    def __init__(
+        self,
+        timeout: int = 30,
+        layout_cache: TileLayoutCache | None = None,
+        today: Callable[[], date] | None = None,
+        page_cache: ShopPageCache | None = None,
+    ):
+        """
+        Args:
+            today: 日付パス探索の基準日を返す関数（記録の再生時に固定する）
+            page_cache: 店舗ページの条件付き取得に使うキャッシュ
+        """
         self.timeout = timeout
+        self.layout_cache = layout_cache
+        self.page_cache = page_cache
+        self._page_lock = threading.Lock()
+        self.page_stats = {"not_modified": 0, "unchanged": 0, "changed": 0}
+        # shop_id → peek_chirashi_ids で取得した店舗ページ（次の取得で使う）
+        self._peeked: dict[str, requests.Response] = {}
+        self._today = today or date.today
         self.session = requests.Session()
-        self.session.headers.update({
-            "User-Agent": (
-                "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) "
-                "AppleWebKit/537.36 (KHTML, like Gecko) "
-                "Chrome/120.0.0.0 Safari/537.36"
-            ),
-            "Accept": "text/html,application/xhtml+xml,application/json",
-            "Accept-Language": "ja,en;q=0.9",
-        })
-
-    def fetch_chirashi_list(
+        self.session.headers.update(BROWSER_HEADERS)
+        metrics.instrument(self.session)
+        self.discovery = TileDiscovery(self.session)
+
+    @property
+    def head_requests(self) -> int:
+        """タイル探索で発行したHEADリクエスト数."""
+        return self.discovery.head_count
+
+    def reset(self) -> None:
+        """店舗ページとタイル探索の集計を消す（常駐モードで実行ごとに呼ぶ）."""
+        with self._page_lock:
+            self.page_stats = {"not_modified": 0, "unchanged": 0, "changed": 0}
+        self.discovery.reset()
+
+    def list_chirashis(
         self, store: StoreConfig, max_count: int = 3
-    ) -> list[Chirashi]:
-        """指定店舗の最新チラシ一覧を取得する."""
+    ) -> list[Chirashi] | None:
+        """店舗ページからチラシID・タイトルだけを取得する（タイル情報なし）.
+
+        タイル情報は resolve_tiles で付ける。前回処理を完了した時点から
+        店舗ページが変わっていなければ None を返す（page_cache を指定した場合のみ）。
+        """
         chirashis = []
         try:
             chirashis = self._fetch_from_shop_page(store, max_count)
         except Exception as e:
             logger.error("チラシ取得失敗 (%s): %s", store.name, e)
+            self.discard_shop_page(store)
 
+        if chirashis is None:
+            return None
         logger.info("%s: %d件のチラシを取得", store.name, len(chirashis))
         return chirashis[:max_count]
 
+    def resolve_tiles(
+        self, chirashis: list[Chirashi], zooms: list[int] | None = None
+    ) -> bool:
+        """同じ chirashi_id のチラシにタイル情報を付ける（探索は1回）.
+
+        タイルが見つからない場合は未公開の可能性があるため、
+        掲載する店舗のページを次回も再確認する。
+
+        Args:
+            zooms: 試すズームの順（先頭から、タイルのあるものを使う）
+        """
+        chirashi_id = chirashis[0].chirashi_id
+        with metrics.labels(chirashi=chirashi_id):
+            tile_info = self._get_tile_info(chirashi_id, zooms or [DEFAULT_ZOOM])
+        if not tile_info:
+            for chirashi in chirashis:
+                self.discard_shop_page(chirashi.store)
+            return False
+
+        pub_date = datetime.strptime(tile_info["date_path"], "%Y/%m/%d")
+        for chirashi in chirashis:
+            chirashi.publish_start = pub_date
+            chirashi.publish_end = pub_date + PUBLISH_PERIOD
+            chirashi._tile_info = tile_info
+        return True
+
+    def discard_shop_page(self, store: StoreConfig) -> None:
+        """今回のページを処理済みにせず、次回も再確認する."""
+        if self.page_cache:
+            self.page_cache.discard(store.shop_id)
+
+    def commit_shop_page(self, store: StoreConfig) -> None:
+        """店舗の処理完了後に呼び、今回のページを処理済みとして記録する."""
+        if self.page_cache:
+            self.page_cache.commit(store.shop_id)
+
+    def log_summary(self) -> None:
+        if not self.page_cache:
+            return
+        stats = self.page_stats
+        logger.info(
+            "店舗ページ: 変化なし %d件 (304: %d件) / 変化あり %d件",
+            stats["not_modified"] + stats["unchanged"],
+            stats["not_modified"], stats["changed"],
+        )
+
+    def peek_chirashi_ids(
+        self, store: StoreConfig, validators: dict, max_count: int = 3
+    ) -> list[str] | None:
+        """店舗ページのチラシIDだけを取得する（常駐モードの更新確認用）.
+
+        validators は呼び出し側が店舗ごとに保持するdictで、前回の
+        ETag/Last-Modified/ハッシュを使って条件付きで取得し、今回の値で更新する。
+        page_cache とは独立しているため、パイプラインの処理には影響しない。
+        ページが変わっていない・取得に失敗した場合は None を返す。
+
+        チラシIDを返した場合は取得したページを保持し、続けて実行する
+        パイプラインの取得（list_chirashis）で再リクエストせずに使う。
+        """
+        with self._page_lock:
+            self._peeked.pop(store.shop_id, None)
+        headers = {}
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+        try:
+            resp = self._get_shop_page(store, headers)
+            if resp.status_code == 304:
+                return None
+            resp.raise_for_status()
+        except Exception as e:
+            logger.warning("店舗ページの確認失敗 (%s): %s", store.name, e)
+            return None
+
+        current = _validators(resp)
+        if validators.get("body_hash") == current["body_hash"]:
+            return None
+        validators.update(current)
+        with self._page_lock:
+            self._peeked[store.shop_id] = resp
+        return extract_shop_page(resp.text, store.shop_id).chirashi_ids[:max_count]
+
+    def _get_shop_page(
+        self, store: StoreConfig, headers: dict[str, str]
+    ) -> requests.Response:
+        url = SHOP_PAGE_URL.format(shop_id=store.shop_id)
+        return guarded_request(
+            self.session, "GET", url, self.timeout, headers=headers
+        )
+
+    def _count_page(self, result: str) -> None:
+        with self._page_lock:
+            self.page_stats[result] += 1
+        metrics.count(
+            "page_cache_misses" if result == "changed" else "page_cache_hits"
+        )
+
     def _fetch_from_shop_page(
         self, store: StoreConfig, max_count: int
-    ) -> list[Chirashi]:
-        """店舗詳細ページからチラシ情報を抽出する."""
-        url = f"https://www.shufoo.net/pntweb/shopDetail/{store.shop_id}/"
-        resp = self.session.get(url, timeout=self.timeout)
+    ) -> list[Chirashi] | None:
+        """店舗詳細ページからチラシID・タイトルを抽出する.
+
+        ページが前回の処理完了時から変わっていなければ None を返す。
+        """
+        cached = self.page_cache.get(store.shop_id) if self.page_cache else None
+        with self._page_lock:
+            resp = self._peeked.pop(store.shop_id, None)
+        if resp is None:
+            headers = (
+                self.page_cache.conditional_headers(store.shop_id) if cached else {}
+            )
+            resp = self._get_shop_page(store, headers)
+        else:
+            logger.debug("確認時に取得した店舗ページを使用: %s", store.name)
+        if resp.status_code == 304 and cached:
+            logger.info("店舗ページ未更新 (304): %s", store.name)
+            self._count_page("not_modified")
+            return None
         resp.raise_for_status()
+
+        validators = _validators(resp)
+        if cached and cached.get("body_hash") == validators["body_hash"]:
+            logger.info("店舗ページに変化なし: %s", store.name)
+            self._count_page("unchanged")
+            self.page_cache.put(store.shop_id, {**cached, **validators})
+            return None
         html = resp.text
 
-        # チラシIDを抽出（リンクパターン + dataLayer）
-        chirashi_ids = self._extract_chirashi_ids(html, store)
+        # チラシID・タイトルを抽出（リンクパターン + dataLayer を1回の走査で）
+        page = extract_shop_page(html, store.shop_id)
+        chirashi_ids = page.chirashi_ids[:max_count]
+        titles = [page.title_for(cid, store.name) for cid in chirashi_ids]
+
+        # 広告などが変わっただけなら、チラシIDとタイトルで判定する
+        validators["fingerprint"] = page_fingerprint(chirashi_ids, titles)
+        if cached and cached.get("fingerprint") == validators["fingerprint"]:
+            logger.info("店舗のチラシに変化なし: %s", store.name)
+            self._count_page("unchanged")
+            self.page_cache.put(store.shop_id, validators)
+            return None
+        if self.page_cache:
+            self._count_page("changed")
+            self.page_cache.stage(store.shop_id, validators)
+
         if not chirashi_ids:
             logger.warning("チラシIDが見つかりません: %s", store.name)
             return []
 
-        # タイトル抽出
-        title_match = re.search(
-            r"['\"]content_title['\"]\s*:\s*['\"]([^'\"]+)['\"]", html
-        )
-        title = title_match.group(1) if title_match else store.name
-
-        results = []
-        for chirashi_id in chirashi_ids[:max_count]:
-            # 日付パスを探索してタイル情報を取得
-            tile_info = self._find_tiles_with_date_probe(chirashi_id)
-            if not tile_info:
-                continue
-
-            date_path = tile_info["date_path"]
-            pub_date = datetime.strptime(date_path, "%Y/%m/%d")
-
-            chirashi = Chirashi(
+        return [
+            Chirashi(
                 chirashi_id=chirashi_id,
                 store=store,
                 title=title,
                 image_urls=[],
-                publish_start=pub_date,
-                publish_end=pub_date + timedelta(days=3),
             )
-            chirashi._tile_info = tile_info
-            results.append(chirashi)
-
-        return results
+            for chirashi_id, title in zip(chirashi_ids, titles)
+        ]
 
-    def _extract_chirashi_ids(
-        self, html: str, store: StoreConfig
-    ) -> list[str]:
-        """HTMLから店舗のチラシIDを抽出する.
+    def _get_tile_info(
+        self, chirashi_id: str, zooms: list[int]
+    ) -> dict | None:
+        """タイル情報をキャッシュから取得し、なければ探索してキャッシュする.
 
-        リンクパターンとdataLayerの両方から取得し、重複を除去する。
+        zooms の先頭から順に、キャッシュ→探索の順で探す。別のズームの
+        キャッシュがあっても、先に優先するズームを探索する。
         """
-        ids: list[str] = []
-        seen: set[str] = set()
+        for i, zoom in enumerate(zooms):
+            if i:
+                logger.info(
+                    "chirashi %s: zoom=%dのタイルがないため zoom=%d を試します",
+                    chirashi_id, zooms[i - 1], zoom,
+                )
+            tile_info = self._cached_tile_info(chirashi_id, zoom)
+            if tile_info:
+                return tile_info
+            tile_info = self._find_tiles_with_date_probe(chirashi_id, zoom)
+            if tile_info:
+                if self.layout_cache:
+                    pub_date = datetime.strptime(tile_info["date_path"], "%Y/%m/%d")
+                    self.layout_cache.put(
+                        chirashi_id, tile_info, pub_date + PUBLISH_PERIOD
+                    )
+                return tile_info
+
+        logger.warning(
+            "タイルが見つかりません: chirashi %s", chirashi_id
+        )
+        return None
+
+    def _cached_tile_info(self, chirashi_id: str, zoom: int) -> dict | None:
+        """キャッシュにある指定ズームのタイル情報（無効ならキャッシュから消す）."""
+        if not self.layout_cache:
+            return None
+        cached = self.layout_cache.get(chirashi_id, zoom)
+        if not cached:
+            return None
+        tile_info = {
+            "base_url": self._base_url(chirashi_id, cached["date_path"]),
+            "zoom": cached["zoom"],
+            "date_path": cached["date_path"],
+            "pages": cached["pages"],
+        }
+        if self._validate_tile_info(tile_info):
+            logger.debug("タイル構成キャッシュ使用: chirashi %s", chirashi_id)
+            return tile_info
+        logger.info("タイル構成キャッシュ無効: chirashi %s", chirashi_id)
+        self.layout_cache.invalidate(chirashi_id)
+        return None
 
-        # 方法1: 店舗固有のリンクパターン
-        link_pattern = re.compile(
-            rf"/pntweb/shopDetail/{re.escape(store.shop_id)}/(\d+)/"
+    def _validate_tile_info(self, tile_info: dict) -> bool:
+        """最終ページの最終タイルが存在するかをHEAD1回で確認する."""
+        last = tile_info["pages"][-1]
+        url = (
+            f"{tile_info['base_url']}/"
+            f"{last['page']}_{tile_info['zoom']}_{last['tile_count'] - 1}.jpg"
         )
-        for m in link_pattern.finditer(html):
-            cid = m.group(1)
-            if cid not in seen:
-                seen.add(cid)
-                ids.append(cid)
-
-        # 方法2: dataLayer の chirashiId
-        for pattern in [
-            r"chirashiId\s*:\s*['\"](\d+)['\"]",
-            r"siteCatalyst_chirashiId\s*:\s*['\"](\d+)['\"]",
-        ]:
-            m = re.search(pattern, html)
-            if m and m.group(1) not in seen:
-                seen.add(m.group(1))
-                ids.append(m.group(1))
-
-        return ids
+        return self.discovery.exists(url)
 
     def _find_tiles_with_date_probe(
-        self, chirashi_id: str, zoom: int = 200
+        self, chirashi_id: str, zoom: int
     ) -> dict | None:
         """直近の日付を探索してタイルの存在する日付パスを特定し、タイル情報を返す.
 
@@ -145,40 +335,45 @@ class ShufooClient:
             }
             or None if no tiles found.
         """
-        today = datetime.now().date()
-
-        for days_ago in range(8):
-            date = today - timedelta(days=days_ago)
-            date_path = date.strftime("%Y/%m/%d")
-            base_url = (
-                f"{IMAGE_BASE_URL}/c/{date_path}/{chirashi_id}/index/img"
-            )
-
-            # タイル0の存在確認
-            test_url = f"{base_url}/0_{zoom}_0.jpg"
-            try:
-                resp = self.session.head(test_url, timeout=10)
-                if resp.status_code != 200:
-                    continue
-            except requests.RequestException:
+        today = self._today()
+        date_paths = [
+            (today - timedelta(days=days_ago)).strftime("%Y/%m/%d")
+            for days_ago in range(DATE_PROBE_DAYS)
+        ]
+
+        # 各日付のタイル0の存在を同時に確認し、新しい日付から採用する
+        found = self.discovery.probe_all([
+            f"{self._base_url(chirashi_id, date_path)}/0_{zoom}_0.jpg"
+            for date_path in date_paths
+        ])
+        for date_path, ok in zip(date_paths, found):
+            if not ok:
                 continue
 
             # タイルが見つかった → 全ページ・タイルを探索
-            result = self._discover_tiles(chirashi_id, date_path, zoom)
+            result = self._discover_tiles(
+                chirashi_id, date_path, zoom, known_pages=1
+            )
             if result["pages"]:
                 result["date_path"] = date_path
                 return result
-
-        logger.warning(
-            "タイルが見つかりません: chirashi %s", chirashi_id
-        )
         return None
 
+    @staticmethod
+    def _base_url(chirashi_id: str, date_path: str) -> str:
+        return f"{IMAGE_BASE_URL}/c/{date_path}/{chirashi_id}/index/img"
+
     def _discover_tiles(
-        self, chirashi_id: str, date_path: str, zoom: int = 200
+        self,
+        chirashi_id: str,
+        date_path: str,
+        zoom: int = DEFAULT_ZOOM,
+        known_pages: int = 0,
     ) -> dict:
         """タイル画像の構成（ページ数・タイル数）を探索する.
 
+        ページ数を求めた後、全ページのタイル数を同時に探索する。
+
         Returns:
             {
                 "base_url": str,
@@ -189,36 +384,43 @@ class ShufooClient:
                 ]
             }
         """
-        base_url = f"{IMAGE_BASE_URL}/c/{date_path}/{chirashi_id}/index/img"
+        base_url = self._base_url(chirashi_id, date_path)
         result = {"base_url": base_url, "zoom": zoom, "pages": []}
-
-        for page in range(10):
-            # まずタイル0の存在を確認
-            test_url = f"{base_url}/{page}_{zoom}_0.jpg"
-            try:
-                resp = self.session.head(test_url, timeout=10)
-                if resp.status_code != 200:
-                    break
-            except requests.RequestException:
-                break
-
-            # タイル数を探索
-            tile_count = 0
-            for tile in range(20):
-                tile_url = f"{base_url}/{page}_{zoom}_{tile}.jpg"
-                try:
-                    resp = self.session.head(tile_url, timeout=10)
-                    if resp.status_code == 200:
-                        tile_count += 1
-                    else:
-                        break
-                except requests.RequestException:
-                    break
-
-            result["pages"].append({"page": page, "tile_count": tile_count})
+        heads_before = self.discovery.head_count
+
+        # ページ数: 各ページのタイル0が存在するか
+        page_count = self.discovery.count_contiguous(
+            [lambda page: f"{base_url}/{page}_{zoom}_0.jpg"],
+            limit=MAX_PAGES,
+            known=known_pages,
+        )[0]
+
+        # タイル数: 全ページ分を並行に探索（タイル0は存在確認済み）
+        tile_counts = self.discovery.count_contiguous(
+            [
+                lambda tile, page=page: f"{base_url}/{page}_{zoom}_{tile}.jpg"
+                for page in range(page_count)
+            ],
+            limit=MAX_TILES,
+            known=1,
+        )
+        result["pages"] = [
+            {"page": page, "tile_count": tile_count}
+            for page, tile_count in enumerate(tile_counts)
+        ]
 
         logger.info(
-            "chirashi %s: %dページ, zoom=%d",
+            "chirashi %s: %dページ, zoom=%d (HEAD %d回)",
             chirashi_id, len(result["pages"]), zoom,
+            self.discovery.head_count - heads_before,
         )
         return result
+
+
+def _validators(resp: requests.Response) -> dict:
+    """条件付き取得に使う検証子."""
+    return {
+        "etag": resp.headers.get("ETag"),
+        "last_modified": resp.headers.get("Last-Modified"),
+        "body_hash": sha256_hex(resp.content),
+    }
@@ -0,0 +1,140 @@
+"""タイル構成の探索エンジン.
+
+ページ番号・タイル番号はいずれも 0 から連続して存在するため、
+「先頭から連続して存在する個数」を求める問題になる。
+1ラウンド目で指数的な位置（0, 1, 3, 7, 15, ...）を同時にHEADし、
+以降は残った区間を fanout 分割してHEADを並行発行する。
+複数系列（全ページのタイル数など）はラウンドを揃えて同時に探索するため、
+レイテンシは O(log n) ラウンドトリップで済む。
+"""
+
+import logging
+import threading
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from src.utils.concurrency import submit_with_context
+from src.utils.http import guarded_request
+
+logger = logging.getLogger(__name__)
+
+
+class TileDiscovery:
+    """HEADリクエストでタイルの存在範囲を並行探索する."""
+
+    def __init__(
+        self,
+        session: requests.Session,
+        timeout: int = 10,
+        max_workers: int = 8,
+        fanout: int = 3,
+    ):
+        self.session = session
+        self.timeout = timeout
+        self.fanout = max(1, fanout)
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="probe"
+        )
+        self._lock = threading.Lock()
+        self._head_count = 0
+
+    @property
+    def head_count(self) -> int:
+        """これまでに発行したHEADリクエスト数（ベンチマーク用）."""
+        return self._head_count
+
+    def reset(self) -> None:
+        """HEADリクエスト数の集計を消す（常駐モードで実行ごとに呼ぶ）."""
+        with self._lock:
+            self._head_count = 0
+
+    def exists(self, url: str) -> bool:
+        """URLが200を返すか確認する. 通信エラーは存在しない扱い.
+
+        ホストのサーキットが開いている場合は、存在しないと誤って判定しないよう
+        CircuitOpenError を送出する。
+        """
+        with self._lock:
+            self._head_count += 1
+        try:
+            resp = guarded_request(self.session, "HEAD", url, self.timeout)
+            return resp.status_code == 200
+        except requests.RequestException:
+            return False
+
+    def probe_all(self, urls: list[str]) -> list[bool]:
+        """複数URLを並行にHEADし、入力順に結果を返す."""
+        if not urls:
+            return []
+        futures = [
+            submit_with_context(self._executor, self.exists, url)
+            for url in urls
+        ]
+        return [f.result() for f in futures]
+
+    def count_contiguous(
+        self,
+        url_fns: list[Callable[[int], str]],
+        limit: int,
+        known: int = 0,
+    ) -> list[int]:
+        """各系列について、番号0から連続して存在する個数を求める.
+
+        Args:
+            url_fns: 番号 → URL を返す関数（系列ごと）
+            limit: 探索する番号の上限（この個数で打ち切る）
+            known: 存在が既知の先頭個数
+
+        Returns:
+            系列ごとの個数
+        """
+        n = len(url_fns)
+        lo = [known - 1] * n  # 存在が確定した最大番号
+        hi = [limit] * n      # 存在しないことが確定した最小番号
+        expanding = True
+
+        while True:
+            plan: list[tuple[int, list[int]]] = []
+            for i in range(n):
+                if hi[i] - lo[i] <= 1:
+                    continue
+                if expanding:
+                    points = self._exponential_points(lo[i], hi[i])
+                else:
+                    points = self._split_points(lo[i], hi[i])
+                plan.append((i, points))
+            if not plan:
+                break
+
+            urls = [url_fns[i](p) for i, points in plan for p in points]
+            found = iter(self.probe_all(urls))
+            for i, points in plan:
+                results = [next(found) for _ in points]
+                for point, ok in zip(points, results):
+                    if ok:
+                        lo[i] = point
+                    else:
+                        hi[i] = point
+                        break
+            expanding = False
+
+        return [x + 1 for x in lo]
+
+    @staticmethod
+    def _exponential_points(lo: int, hi: int) -> list[int]:
+        points = []
+        step = 1
+        while lo + step < hi:
+            points.append(lo + step)
+            step *= 2
+        return points
+
+    def _split_points(self, lo: int, hi: int) -> list[int]:
+        width = hi - lo
+        points = {
+            lo + round(width * j / (self.fanout + 1))
+            for j in range(1, self.fanout + 1)
+        }
+        return sorted(p for p in points if lo < p < hi)
@@ -3,215 +3,265 @@
 Shufoo!のチラシ画像はタイル分割で提供される:
   URL: {base_url}/{page}_{zoom}_{tile}.jpg
 
-各タイルをダウンロードしPILで結合して完全なページ画像を生成する。
+各タイルをダウンロードしPILで結合して完全なページ画像を生成する
+（結合処理は src.shufoo.stitcher を参照）。
 タイルは左上から右方向に並び、行末で次の行に折り返す。
 """
 
-import io
 import logging
-import math
 import shutil
+from collections import deque
+from collections.abc import Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 from pathlib import Path
 
 import requests
-from PIL import Image
+from requests.adapters import HTTPAdapter
 
 from src.models import Chirashi
+from src.shufoo.image_pool import ImagePool
+from src.utils.concurrency import submit_with_context
+from src.utils.content_store import ContentStore, sha256_hex, tiles_digest
+from src.utils.http import HostLimiter, get_with_retry, guarded_request
+from src.utils.metrics import metrics
 
 logger = logging.getLogger(__name__)
 
 
+@dataclass
+class DownloadedPage:
+    """保存済みのページ画像."""
+    path: Path
+    # タイル群（直接取得の場合は画像）のハッシュ
+    source: str
+    # 結合時に作ったプレビュー（保存済みのページを再利用した場合はNone）
+    preview: bytes | None = None
+    # 結合したページの幅（同上）
+    width: int | None = None
+
+
 class ChirashiDownloader:
     """チラシ画像をローカルにダウンロードする."""
 
-    def __init__(self, base_dir: str = "data/images", timeout: int = 30):
+    def __init__(
+        self,
+        base_dir: str = "data/images",
+        timeout: int = 30,
+        mode: str = "threaded",
+        workers: int = 8,
+        per_host: int = 6,
+        retries: int = 3,
+        assembly: str = "pil",
+        image_pool: ImagePool | None = None,
+    ):
+        """
+        Args:
+            mode: タイル取得方式。"threaded"（並行）または "serial"（逐次）
+            workers: threaded時のワーカースレッド数
+            per_host: ホストごとの同時接続数
+            retries: タイル1枚あたりのリトライ回数
+            assembly: ページ結合方式。"pil" または "lossless"（jpegtran）
+            image_pool: 結合・エンコードを実行するプール（省略時は同期実行）
+        """
+        if mode not in ("threaded", "serial"):
+            raise ValueError(f"不明なダウンロードモード: {mode}")
         self.base_dir = Path(base_dir)
         self.base_dir.mkdir(parents=True, exist_ok=True)
+        self.store = ContentStore(base_dir)
         self.timeout = timeout
+        self.mode = mode
+        self.retries = retries
+        self.assembly = assembly
+        self.image_pool = image_pool or ImagePool(workers=0)
         self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=4, pool_maxsize=max(per_host, workers)
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        metrics.instrument(self.session)
+        self._limiter = HostLimiter(per_host)
+        self._executor = (
+            ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tile")
+            if mode == "threaded" else None
+        )
 
     def download(self, chirashi: Chirashi) -> Chirashi:
         """チラシの画像をダウンロードする.
 
         タイル情報がある場合はタイルを結合、なければ直接URLからダウンロード。
+        画像はコンテンツストアに保存され、同じ内容のページは共有される。
         """
-        save_dir = (
-            self.base_dir / chirashi.store.shop_id / chirashi.chirashi_id
-        )
-        save_dir.mkdir(parents=True, exist_ok=True)
+        return self.apply_pages(chirashi, list(self.iter_pages(chirashi)))
+
+    def iter_pages(self, chirashi: Chirashi) -> Iterator[DownloadedPage]:
+        """ページをページ順に、結合が終わったものから返す.
+
+        返されたページを処理している間は次のページのタイル取得が止まるため、
+        時間のかかる処理は別スレッドで行う。
+        """
+        key_prefix = f"{chirashi.store.shop_id}/{chirashi.chirashi_id}"
 
         tile_info = getattr(chirashi, "_tile_info", None)
         if tile_info and tile_info.get("pages"):
-            local_paths = self._download_tiles(tile_info, save_dir)
+            yield from self._download_tiles(tile_info, key_prefix)
         elif chirashi.image_urls:
-            local_paths = self._download_direct(chirashi, save_dir)
-        else:
-            local_paths = []
-
-        chirashi.local_image_paths = local_paths
+            yield from self._download_direct(chirashi, key_prefix)
+
+    @staticmethod
+    def apply_pages(chirashi: Chirashi, pages: list[DownloadedPage]) -> Chirashi:
+        """取得したページをチラシに設定する."""
+        chirashi.local_image_paths = [str(p.path) for p in pages]
+        chirashi.page_hashes = [p.source for p in pages]
+        chirashi.previews = [p.preview for p in pages]
+        chirashi.page_widths = [p.width for p in pages if p.width]
         logger.info(
             "%s: %d枚の画像を取得",
             chirashi.store.name,
-            len(local_paths),
+            len(pages),
         )
         return chirashi
 
+    def _reuse_page(self, key: str, source: str) -> Path | None:
+        """タイル群のハッシュが同じ保存済みページがあれば再利用する."""
+        path = self.store.lookup_source(source)
+        if path:
+            logger.debug("同一内容のページを再利用: %s → %s", key, path.name)
+            self._record_page(key, source, path)
+        return path
+
+    def _save_page(self, key: str, source: str, data: bytes) -> Path:
+        path = self.store.put(data, source=source)
+        self._record_page(key, source, path)
+        return path
+
+    def _record_page(self, key: str, source: str, path: Path) -> None:
+        if self.store.record_page(key, source, path):
+            logger.info("ページ変更を検出: %s", key)
+
     def _download_tiles(
-        self, tile_info: dict, save_dir: Path
-    ) -> list[str]:
-        """タイル画像をダウンロードして結合する."""
+        self, tile_info: dict, key_prefix: str
+    ) -> Iterator[DownloadedPage]:
+        """タイル画像をダウンロードして結合する.
+
+        結合は画像処理プールに投入し、待たずに次のページのタイル取得へ進む。
+        先頭から結合が終わっているページは、その時点で返す。
+        """
         base_url = tile_info["base_url"]
         zoom = tile_info["zoom"]
-        local_paths = []
+        # (ページ番号, タイル群のハッシュ, 保存済みパス or 結合中のFuture, タイル数)
+        pending: deque = deque()
 
         for page_info in tile_info["pages"]:
             page_num = page_info["page"]
             tile_count = page_info["tile_count"]
-            local_path = save_dir / f"page_{page_num + 1}.jpg"
-
-            # 既にダウンロード済みならスキップ
-            if local_path.exists() and local_path.stat().st_size > 10000:
-                local_paths.append(str(local_path))
-                logger.debug("キャッシュ使用: %s", local_path)
-                continue
-
-            # 全タイルをダウンロード
-            tiles: list[Image.Image] = []
-            for tile_idx in range(tile_count):
-                tile_url = f"{base_url}/{page_num}_{zoom}_{tile_idx}.jpg"
-                try:
-                    resp = self.session.get(tile_url, timeout=self.timeout)
-                    if resp.status_code != 200:
-                        logger.debug(
-                            "タイル取得失敗 (HTTP %d): %s",
-                            resp.status_code, tile_url,
-                        )
-                        break
-                    img = Image.open(io.BytesIO(resp.content))
-                    tiles.append(img)
-                except Exception as e:
-                    logger.debug(
-                        "タイル取得エラー (%d_%d_%d): %s",
-                        page_num, zoom, tile_idx, e,
-                    )
-                    break
 
+            # 全タイルをダウンロード（取得順はタイル番号順を保つ）
+            tile_urls = [
+                f"{base_url}/{page_num}_{zoom}_{tile_idx}.jpg"
+                for tile_idx in range(tile_count)
+            ]
+            tiles = self._fetch_tiles(tile_urls)
             if not tiles:
                 continue
-
-            # タイルを結合
-            stitched = self._stitch_tiles(tiles)
-            if stitched:
-                stitched.save(str(local_path), "JPEG", quality=95)
-                local_paths.append(str(local_path))
-                logger.info(
-                    "ページ%d: %dタイル結合 → %dx%d (%dKB)",
-                    page_num + 1, len(tiles),
-                    stitched.width, stitched.height,
-                    local_path.stat().st_size // 1024,
+            # ズームの選択による転送量の違いを比べるため、ページ単位で数える
+            metrics.count("tile_bytes", sum(map(len, tiles)))
+            metrics.count("tile_pages")
+            source = tiles_digest(tiles)
+
+            path = self._reuse_page(f"{key_prefix}/{page_num}", source)
+            if path:
+                pending.append((page_num, source, path, len(tiles)))
+            else:
+                # ヘッダからレイアウトを決めて結合
+                future = self.image_pool.submit(tiles, assembly=self.assembly)
+                pending.append((page_num, source, future, len(tiles)))
+
+            while pending and (
+                isinstance(pending[0][2], Path) or pending[0][2].done()
+            ):
+                page = self._finish_page(key_prefix, *pending.popleft())
+                if page:
+                    yield page
+
+        while pending:
+            page = self._finish_page(key_prefix, *pending.popleft())
+            if page:
+                yield page
+
+    def _finish_page(
+        self,
+        key_prefix: str,
+        page_num: int,
+        source: str,
+        result: Path | Future,
+        tile_total: int,
+    ) -> DownloadedPage | None:
+        """結合の完了を待って保存する."""
+        if isinstance(result, Path):
+            return DownloadedPage(result, source)
+        try:
+            page = result.result()
+        except Exception as e:
+            logger.error("ページ%d: 結合失敗: %s", page_num + 1, e)
+            return None
+        if page is None:
+            return None
+        metrics.count("decode_ms", page.decode_ms)
+        metrics.count("encode_ms", page.encode_ms)
+        logger.info(
+            "ページ%d: %dタイル結合 → %dx%d (%dKB)",
+            page_num + 1, tile_total, page.width, page.height,
+            len(page.data) // 1024,
+        )
+        path = self._save_page(f"{key_prefix}/{page_num}", source, page.data)
+        return DownloadedPage(path, source, page.preview, page.width)
+
+    def _fetch_tiles(self, urls: list[str]) -> list[bytes]:
+        """タイルを取得する. 最初に失敗したタイルより前の分だけを返す."""
+        if self._executor is None:
+            results = []
+            for url in urls:
+                data = self._fetch_tile(url)
+                if data is None:
+                    break
+                results.append(data)
+            return results
+
+        futures = [
+            submit_with_context(self._executor, self._fetch_tile, url)
+            for url in urls
+        ]
+        results = [f.result() for f in futures]
+        if None in results:
+            results = results[:results.index(None)]
+        return results
+
+    def _fetch_tile(self, url: str) -> bytes | None:
+        try:
+            resp = get_with_retry(
+                self.session, url, self.timeout,
+                retries=self.retries, limiter=self._limiter,
+            )
+            if resp.status_code != 200:
+                logger.debug(
+                    "タイル取得失敗 (HTTP %d): %s", resp.status_code, url,
                 )
-
-        return local_paths
-
-    def _stitch_tiles(self, tiles: list[Image.Image]) -> Image.Image | None:
-        """タイル画像をグリッド状に結合する."""
-        if not tiles:
+                return None
+            return resp.content
+        except requests.RequestException as e:
+            logger.debug("タイル取得エラー (%s): %s", url, e)
             return None
-        if len(tiles) == 1:
-            return tiles[0]
-
-        num_cols = self._detect_columns(tiles)
-        num_rows = math.ceil(len(tiles) / num_cols)
-
-        # 各列の幅・各行の高さを計算
-        col_widths = []
-        for col in range(num_cols):
-            w = 0
-            for row in range(num_rows):
-                idx = row * num_cols + col
-                if idx < len(tiles):
-                    w = max(w, tiles[idx].width)
-            col_widths.append(w)
-
-        row_heights = []
-        for row in range(num_rows):
-            h = 0
-            for col in range(num_cols):
-                idx = row * num_cols + col
-                if idx < len(tiles):
-                    h = max(h, tiles[idx].height)
-            row_heights.append(h)
-
-        total_w = sum(col_widths)
-        total_h = sum(row_heights)
-
-        canvas = Image.new("RGB", (total_w, total_h), (255, 255, 255))
-
-        y = 0
-        for row in range(num_rows):
-            x = 0
-            for col in range(num_cols):
-                idx = row * num_cols + col
-                if idx < len(tiles):
-                    canvas.paste(tiles[idx], (x, y))
-                x += col_widths[col]
-            y += row_heights[row]
-
-        return canvas
-
-    def _detect_columns(self, tiles: list[Image.Image]) -> int:
-        """タイルの幅パターンから列数を自動検出する.
-
-        右端のタイルは基準幅より狭いことを利用して行の区切りを検出する。
-        全タイルが同一幅の場合はtile_countの約数から推定する。
-        """
-        if len(tiles) <= 1:
-            return 1
-
-        base_width = tiles[0].width
-
-        # 基準幅より狭いタイルを探す → 行の右端
-        for i in range(1, len(tiles)):
-            if tiles[i].width < base_width:
-                return i + 1  # 0..i がfirst rowの i+1 タイル
-                # ただし i が先頭タイルの次(=1)で狭い場合、2列
-                # i=2 で狭い場合、3列（tiles 0,1,2 が1行目）
-
-        # 全タイル同一幅 → tile_countの約数から推定
-        n = len(tiles)
-        base_h = tiles[0].height
-        best_cols = n  # fallback: 1行
-        best_ratio_diff = float("inf")
-
-        for cols in range(1, n + 1):
-            if n % cols != 0:
-                continue
-            rows = n // cols
-            aspect = (cols * base_width) / (rows * base_h)
-            # チラシは縦長（aspect ratio 0.6〜0.8程度）が一般的
-            diff = abs(aspect - 0.7)
-            if diff < best_ratio_diff:
-                best_ratio_diff = diff
-                best_cols = cols
-
-        return best_cols
 
     def _download_direct(
-        self, chirashi: Chirashi, save_dir: Path
-    ) -> list[str]:
+        self, chirashi: Chirashi, key_prefix: str
+    ) -> Iterator[DownloadedPage]:
         """直接URLから画像をダウンロードする."""
-        local_paths = []
-
         for i, url in enumerate(chirashi.image_urls):
-            local_path = save_dir / f"page_{i + 1}.jpg"
-
-            if local_path.exists() and local_path.stat().st_size > 1000:
-                local_paths.append(str(local_path))
-                continue
-
             try:
-                resp = self.session.get(url, timeout=self.timeout)
+                resp = guarded_request(self.session, "GET", url, self.timeout)
                 if resp.status_code == 404:
                     break
                 resp.raise_for_status()
@@ -223,23 +273,34 @@ class ChirashiDownloader:
                     )
                     continue
 
-                with open(local_path, "wb") as f:
-                    f.write(resp.content)
-                local_paths.append(str(local_path))
+                data = resp.content
+                source = sha256_hex(data)
+                key = f"{key_prefix}/{i}"
+                path = self._reuse_page(key, source)
+                if path is None:
+                    path = self._save_page(key, source, data)
+                yield DownloadedPage(path, source)
 
             except requests.RequestException as e:
                 logger.debug("直接ダウンロード失敗: %s", e)
                 break
 
-        return local_paths
+    def close(self) -> None:
+        """ワーカープールを停止する."""
+        self.image_pool.close()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
 
     def cleanup_old_images(self, days: int = 3) -> None:
         """指定日数以上前の画像を削除する."""
+        self.store.cleanup(days)
+
+        # 旧形式（{shop_id}/{chirashi_id}/page_N.jpg）の画像
         cutoff = datetime.now() - timedelta(days=days)
         removed = 0
 
         for shop_dir in self.base_dir.iterdir():
-            if not shop_dir.is_dir():
+            if not shop_dir.is_dir() or shop_dir == self.store.objects_dir:
                 continue
             for chirashi_dir in shop_dir.iterdir():
                 if not chirashi_dir.is_dir():
@@ -250,4 +311,4 @@ class ChirashiDownloader:
                     removed += 1
 
         if removed:
-            logger.info("古い画像を%d件削除しました", removed)
+            logger.info("旧形式の画像を%d件削除しました", removed)
@@ -0,0 +1,105 @@
+"""店舗詳細ページのHTMLからチラシ情報を抽出する.
+
+チラシへのリンク（/pntweb/shopDetail/{shopId}/{chirashiId}/）は、店舗ごとに
+事前コンパイルした正規表現でHTML全体を1回だけ走査し、リンクのtitle属性を
+チラシごとのタイトルとして同時に取り出す。リンク文字列は「チラシを見る」の
+ような定型文であることが多いため、タイトルには使わない。
+dataLayer はHTML中の "dataLayer" を文字列検索で見つけ、その<script>内の
+項目だけを解析する（チラシIDとタイトルが揃った時点で以降は探さない）。
+
+CPythonの正規表現は先頭が固定文字列のパターンを高速に検索できるが、
+選択（|）を含むパターンではこの最適化が効かないため、リンクと dataLayer を
+1つの正規表現にまとめるとかえって遅くなる（benchmarks/bench_extract.py）。
+"""
+
+import html as html_lib
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+
+# dataLayer 上でチラシIDを表す項目（この順に採用する）
+_ID_KEYS = ("chirashiId", "siteCatalyst_chirashiId")
+
+_DATA_LAYER = "dataLayer"
+_SCRIPT_END = "</script>"
+# <script>の終わりが見つからない場合に解析する最大文字数
+_DATA_LAYER_MAX = 8192
+
+_FIELD = re.compile(r"['\"]?(\w+)['\"]?\s*:\s*['\"]([^'\"]*)['\"]")
+_TITLE_ATTR = re.compile(r"\btitle=['\"]([^'\"]+)['\"]")
+
+
+@dataclass
+class ShopPage:
+    """店舗ページから抽出した情報."""
+    chirashi_ids: list[str] = field(default_factory=list)
+    # chirashi_id → タイトル（リンクのtitle属性から取れたもののみ）
+    titles: dict[str, str] = field(default_factory=dict)
+    # dataLayer の項目（同じ項目は最初の値）
+    data_layer: dict[str, str] = field(default_factory=dict)
+
+    def title_for(self, chirashi_id: str, default: str) -> str:
+        """チラシのタイトル. title属性がなければ dataLayer の content_title."""
+        return (
+            self.titles.get(chirashi_id)
+            or self.data_layer.get("content_title")
+            or default
+        )
+
+
+@lru_cache(maxsize=256)
+def _link_pattern(shop_id: str) -> re.Pattern:
+    return re.compile(
+        rf"/pntweb/shopDetail/{re.escape(shop_id)}/(\d+)/"
+        r"(?:([^<>]{0,300})>)?"
+    )
+
+
+def extract_shop_page(html: str, shop_id: str) -> ShopPage:
+    """店舗のチラシID・タイトル・dataLayer項目を返す.
+
+    チラシIDはリンクの出現順、続いて dataLayer のIDの順で、重複を除く。
+    """
+    page = ShopPage(data_layer=_parse_data_layer(html))
+    seen: set[str] = set()
+
+    for m in _link_pattern(shop_id).finditer(html):
+        cid, attrs = m.groups()
+        if cid not in seen:
+            seen.add(cid)
+            page.chirashi_ids.append(cid)
+        if cid not in page.titles:
+            title = _link_title(attrs)
+            if title:
+                page.titles[cid] = title
+
+    for key in _ID_KEYS:
+        cid = page.data_layer.get(key)
+        if cid and cid.isdigit() and cid not in seen:
+            seen.add(cid)
+            page.chirashi_ids.append(cid)
+    return page
+
+
+def _parse_data_layer(html: str) -> dict[str, str]:
+    fields: dict[str, str] = {}
+    pos = html.find(_DATA_LAYER)
+    while pos != -1:
+        end = html.find(_SCRIPT_END, pos)
+        if end == -1 or end - pos > _DATA_LAYER_MAX:
+            end = pos + _DATA_LAYER_MAX
+        for key, value in _FIELD.findall(html, pos, end):
+            fields.setdefault(key, value)
+        if "content_title" in fields and any(k in fields for k in _ID_KEYS):
+            break
+        pos = html.find(_DATA_LAYER, end)
+    return fields
+
+
+def _link_title(attrs: str | None) -> str | None:
+    """リンクのtitle属性（なければNone）."""
+    if attrs:
+        m = _TITLE_ATTR.search(attrs)
+        if m:
+            return html_lib.unescape(m.group(1)).strip() or None
+    return None
@@ -0,0 +1,64 @@
+"""画像処理（結合・JPEGエンコード・プレビュー生成）のワーカープール.
+
+ダウンロード済みのタイルを投入すると、別プロセス（または別スレッド）で
+build_page を実行する。ダウンロード段は結果を待たずに次のページの
+タイル取得へ進めるため、ネットワーク待ちとCPU処理が重なり、
+複数コアを使える。
+"""
+
+import logging
+import multiprocessing
+from concurrent.futures import (
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+)
+
+from src.shufoo.stitcher import BuiltPage, build_page
+
+logger = logging.getLogger(__name__)
+
+
+class ImagePool:
+    """build_page を実行するワーカープール.
+
+    Args:
+        workers: ワーカー数。0なら呼び出し元スレッドで即時実行する
+        kind: "process"（マルチコア）または "thread"（PILはデコード・
+            エンコード中にGILを解放するため、スレッドでも並列化される）
+    """
+
+    def __init__(self, workers: int = 0, kind: str = "process"):
+        if kind not in ("process", "thread"):
+            raise ValueError(f"不明なワーカー種別: {kind}")
+        self.workers = workers
+        self.kind = kind
+        self._executor: Executor | None = None
+        if workers > 0 and kind == "process":
+            # スレッドを持つ親プロセスからforkしないよう spawn を使う
+            self._executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        elif workers > 0:
+            self._executor = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix="image"
+            )
+
+    def submit(
+        self, tiles: list[bytes], assembly: str = "pil"
+    ) -> Future[BuiltPage | None]:
+        if self._executor is None:
+            future: Future = Future()
+            try:
+                future.set_result(build_page(tiles, assembly=assembly))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        return self._executor.submit(build_page, tiles, assembly)
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
@@ -0,0 +1,58 @@
+"""チラシごとのタイル構成キャッシュ.
+
+chirashi_id → {date_path, zoom, pages} を data/tile_cache.json に保存し、
+掲載期間（publish_end）が過ぎるまで日付パス探索とタイル探索を省略する。
+"""
+
+import logging
+from datetime import datetime
+
+from src.utils.json_store import JsonStore
+
+logger = logging.getLogger(__name__)
+
+
+class TileLayoutCache:
+    """タイル構成を永続化するキャッシュ."""
+
+    def __init__(self, path: str = "data/tile_cache.json"):
+        self._store = JsonStore(path)
+        self._purge_expired()
+
+    def get(self, chirashi_id: str, zoom: int) -> dict | None:
+        """有効期限内のエントリを返す. zoomが異なる場合はNone."""
+        with self._store.lock:
+            entry = self._store.data.get(chirashi_id)
+        if not entry or entry.get("zoom") != zoom:
+            return None
+        if datetime.fromisoformat(entry["expires_at"]) < datetime.now():
+            return None
+        return entry
+
+    def put(self, chirashi_id: str, tile_info: dict, expires_at: datetime) -> None:
+        with self._store.lock:
+            self._store.data[chirashi_id] = {
+                "date_path": tile_info["date_path"],
+                "zoom": tile_info["zoom"],
+                "pages": tile_info["pages"],
+                "expires_at": expires_at.isoformat(),
+            }
+            self._store.save()
+
+    def invalidate(self, chirashi_id: str) -> None:
+        with self._store.lock:
+            if self._store.data.pop(chirashi_id, None) is not None:
+                self._store.save()
+
+    def _purge_expired(self) -> None:
+        now = datetime.now()
+        with self._store.lock:
+            expired = [
+                cid for cid, entry in self._store.data.items()
+                if datetime.fromisoformat(entry["expires_at"]) < now
+            ]
+            for cid in expired:
+                del self._store.data[cid]
+            if expired:
+                self._store.save()
+                logger.debug("期限切れのタイル構成を%d件削除", len(expired))
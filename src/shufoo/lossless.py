@@ -0,0 +1,113 @@
+"""JPEGタイルの無劣化結合（jpegtran -drop）.
+
+Shufoo!のタイルはMCU境界で分割されたJPEGのため、DCT係数のまま
+キャンバスへ差し込めばデコード → 再エンコードを省ける。
+libjpeg-turbo 2.1 以降 / IJG jpeg-9 の jpegtran が持つ -drop を使う。
+
+条件を満たさない場合（jpegtranがない、サンプリング係数や量子化テーブルが
+タイル間で異なる、貼り付け位置がMCU境界に揃っていない）は None を返し、
+呼び出し側はPILによる結合にフォールバックする。
+"""
+
+import io
+import logging
+import shutil
+import subprocess
+import tempfile
+from pathlib import Path
+
+from PIL import Image, JpegImagePlugin
+
+from src.shufoo.stitcher import TileLayout
+
+logger = logging.getLogger(__name__)
+
+# JpegImagePlugin.get_sampling の戻り値 → MCUサイズ(px)
+_MCU_SIZE = {
+    -1: (8, 8),    # グレースケール等
+    0: (8, 8),     # 4:4:4
+    1: (16, 8),    # 4:2:2
+    2: (16, 16),   # 4:2:0
+}
+
+
+def jpegtran_path() -> str | None:
+    return shutil.which("jpegtran")
+
+
+def _tile_params(data: bytes) -> tuple | None:
+    """結合可否の判定に使うタイルのパラメータ."""
+    with Image.open(io.BytesIO(data)) as img:
+        if img.format != "JPEG":
+            return None
+        return (
+            img.mode,
+            JpegImagePlugin.get_sampling(img),
+            tuple(sorted((k, tuple(v)) for k, v in img.quantization.items())),
+        )
+
+
+def _blank_canvas(layout: TileLayout, sample: bytes) -> bytes:
+    """タイルと同じサンプリング・量子化テーブルの白紙JPEGを作る."""
+    with Image.open(io.BytesIO(sample)) as tile:
+        mode = tile.mode
+        qtables = tile.quantization
+        subsampling = JpegImagePlugin.get_sampling(tile)
+    fill = 255 if mode == "L" else (255,) * len(mode)
+    canvas = Image.new(mode, (layout.width, layout.height), fill)
+    buf = io.BytesIO()
+    kwargs = {"qtables": qtables}
+    if subsampling >= 0:
+        kwargs["subsampling"] = subsampling
+    canvas.save(buf, "JPEG", **kwargs)
+    return buf.getvalue()
+
+
+def assemble_lossless(tiles: list[bytes], layout: TileLayout) -> bytes | None:
+    """タイルをDCT係数のまま結合したJPEGを返す. 結合できなければNone."""
+    jpegtran = jpegtran_path()
+    if jpegtran is None:
+        logger.debug("jpegtranが見つからないため無劣化結合をスキップ")
+        return None
+
+    try:
+        params = {_tile_params(data) for data in tiles}
+    except OSError as e:
+        logger.debug("タイル読み込みエラー: %s", e)
+        return None
+    if len(params) != 1 or None in params:
+        logger.debug("タイル間でJPEGパラメータが異なるため無劣化結合不可")
+        return None
+
+    mode, subsampling, _ = next(iter(params))
+    if subsampling == -1 and mode != "L":
+        return None
+    mcu_w, mcu_h = _MCU_SIZE.get(subsampling, (16, 16))
+    positions = [layout.position(idx) for idx in range(len(tiles))]
+    if any(x % mcu_w or y % mcu_h for x, y in positions):
+        logger.debug("タイル位置がMCU境界に揃っていないため無劣化結合不可")
+        return None
+
+    with tempfile.TemporaryDirectory(prefix="lossless") as tmp:
+        work = Path(tmp)
+        current = work / "canvas_0.jpg"
+        current.write_bytes(_blank_canvas(layout, tiles[0]))
+
+        for idx, ((x, y), data) in enumerate(zip(positions, tiles)):
+            tile_path = work / f"tile_{idx}.jpg"
+            tile_path.write_bytes(data)
+            out = work / f"canvas_{idx + 1}.jpg"
+            try:
+                subprocess.run(
+                    [jpegtran, "-copy", "none", "-drop", f"+{x}+{y}",
+                     str(tile_path), "-outfile", str(out), str(current)],
+                    check=True, capture_output=True, timeout=30,
+                )
+            except (OSError, subprocess.SubprocessError) as e:
+                logger.debug("jpegtran失敗 (タイル%d): %s", idx, e)
+                return None
+            current.unlink()
+            tile_path.unlink()
+            current = out
+
+        return current.read_bytes()
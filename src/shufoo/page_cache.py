@@ -0,0 +1,70 @@
+"""店舗ページの条件付き取得用キャッシュ.
+
+shop_id → {etag, last_modified, body_hash, fingerprint} を
+data/page_cache.json に保存する。fingerprint は抽出したチラシIDとタイトルの
+ハッシュで、広告などページの他の部分が変わっても内容の変化を判定できる。
+
+エントリは店舗の処理がすべて完了した時点で確定させる（stage → commit）。
+途中で失敗した店舗は次回も未処理として扱われ、取りこぼさない。
+"""
+
+import json
+import logging
+import threading
+from datetime import datetime
+
+from src.utils.content_store import sha256_hex
+from src.utils.json_store import JsonStore
+
+logger = logging.getLogger(__name__)
+
+
+def page_fingerprint(chirashi_ids: list[str], titles: list[str]) -> str:
+    """抽出したチラシIDとタイトルのハッシュ."""
+    return sha256_hex(json.dumps([chirashi_ids, titles]).encode("utf-8"))
+
+
+class ShopPageCache:
+    """店舗ページの検証子（ETag/Last-Modified/ハッシュ）のキャッシュ."""
+
+    def __init__(self, path: str = "data/page_cache.json"):
+        self._store = JsonStore(path)
+        self._pending: dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def get(self, shop_id: str) -> dict | None:
+        with self._store.lock:
+            return self._store.data.get(shop_id)
+
+    def conditional_headers(self, shop_id: str) -> dict[str, str]:
+        """条件付きリクエスト用のヘッダを返す."""
+        entry = self.get(shop_id) or {}
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def put(self, shop_id: str, entry: dict) -> None:
+        with self._store.lock:
+            self._store.data[shop_id] = {
+                **entry, "checked_at": datetime.now().isoformat(timespec="seconds"),
+            }
+            self._store.save()
+
+    def stage(self, shop_id: str, entry: dict) -> None:
+        """処理完了まで確定させずに保持する."""
+        with self._lock:
+            self._pending[shop_id] = entry
+
+    def commit(self, shop_id: str) -> None:
+        """保持中のエントリを確定させる."""
+        with self._lock:
+            entry = self._pending.pop(shop_id, None)
+        if entry is not None:
+            self.put(shop_id, entry)
+
+    def discard(self, shop_id: str) -> None:
+        with self._lock:
+            self._pending.pop(shop_id, None)
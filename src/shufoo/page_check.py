@@ -0,0 +1,84 @@
+"""店舗ページに変化があるかだけを確認する（python main.py --check）.
+
+requests・Pillow・line-bot-sdk を読み込まず、標準ライブラリの urllib で
+店舗ページを条件付き取得し、data/page_cache.json の内容と比べる。
+判定は ShufooClient と同じく 304 → 本文のハッシュ → チラシIDとタイトル の順。
+キャッシュは更新しないため、続けて通常の実行をしても結果は変わらない。
+"""
+
+import logging
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from src.models import StoreConfig
+from src.shufoo.extractor import extract_shop_page
+from src.shufoo.page_cache import ShopPageCache, page_fingerprint
+from src.utils.content_store import sha256_hex
+
+logger = logging.getLogger(__name__)
+
+SHOP_PAGE_URL = "https://www.shufoo.net/pntweb/shopDetail/{shop_id}/"
+
+BROWSER_HEADERS = {
+    "User-Agent": (
+        "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) "
+        "AppleWebKit/537.36 (KHTML, like Gecko) "
+        "Chrome/120.0.0.0 Safari/537.36"
+    ),
+    "Accept": "text/html,application/xhtml+xml,application/json",
+    "Accept-Language": "ja,en;q=0.9",
+}
+
+
+def check_stores(
+    stores: list[StoreConfig],
+    page_cache: ShopPageCache,
+    timeout: int = 30,
+    workers: int = 8,
+    max_count: int = 3,
+) -> list[StoreConfig]:
+    """前回の処理完了時から店舗ページが変わった店舗を返す.
+
+    確認できなかった店舗も、処理が必要なものとして含める。
+    """
+    if not stores:
+        return []
+    with ThreadPoolExecutor(
+        max_workers=min(workers, len(stores)), thread_name_prefix="check"
+    ) as executor:
+        changed = list(executor.map(
+            lambda s: _changed(s, page_cache, timeout, max_count), stores
+        ))
+    return [s for s, c in zip(stores, changed) if c]
+
+
+def _changed(
+    store: StoreConfig, page_cache: ShopPageCache, timeout: int, max_count: int
+) -> bool:
+    cached = page_cache.get(store.shop_id)
+    if not cached:
+        return True
+    request = urllib.request.Request(
+        SHOP_PAGE_URL.format(shop_id=store.shop_id),
+        headers={**BROWSER_HEADERS, **page_cache.conditional_headers(store.shop_id)},
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as resp:
+            body = resp.read()
+            charset = resp.headers.get_content_charset() or "utf-8"
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            return False
+        logger.warning("店舗ページの確認失敗 (%s): HTTP %d", store.name, e.code)
+        return True
+    except OSError as e:
+        logger.warning("店舗ページの確認失敗 (%s): %s", store.name, e)
+        return True
+
+    if cached.get("body_hash") == sha256_hex(body):
+        return False
+    page = extract_shop_page(body.decode(charset, "replace"), store.shop_id)
+    chirashi_ids = page.chirashi_ids[:max_count]
+    titles = [page.title_for(cid, store.name) for cid in chirashi_ids]
+    return cached.get("fingerprint") != page_fingerprint(chirashi_ids, titles)
@@ -0,0 +1,90 @@
+"""タイルのズーム（解像度）の選択.
+
+Shufoo!のタイルはズームごとに用意されており、ページの幅はズームに比例する
+（200 は 100 の2倍）。LINEのプレビューは幅240px、オリジナルも端末の画面幅が
+あれば足りるため、目標の幅を満たす最小のズームを選んでタイルの転送量を減らす。
+
+ズーム100でのページ幅は、実際に結合したページの幅から店舗ごとに学習する
+（data/page_widths.json）。未学習の店舗は base_width を使う。
+選んだズームのタイルがなければ、より大きいズーム → 小さいズームの順に試す。
+"""
+
+import logging
+
+from src.models import Recipient, StoreConfig
+from src.utils.json_store import JsonStore
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ZOOMS = (100, 200)
+# 未学習の店舗で仮定する、ズーム100でのページ幅(px)
+DEFAULT_BASE_WIDTH = 1000
+
+
+class ResolutionPolicy:
+    """目標の幅を満たす最小のズームを選ぶ."""
+
+    def __init__(
+        self,
+        target_width: int | None = None,
+        zooms: list[int] | tuple[int, ...] = DEFAULT_ZOOMS,
+        base_width: int = DEFAULT_BASE_WIDTH,
+        path: str = "data/page_widths.json",
+    ):
+        """
+        Args:
+            target_width: 目標のページ幅(px)。店舗・送信先の target_width が
+                優先され、どこにも指定がなければ最大のズームを使う
+            zooms: 使ってよいズームの候補
+            base_width: 未学習の店舗で仮定するズーム100でのページ幅
+        """
+        self.target_width = target_width
+        self.zooms = sorted(set(zooms))
+        self.base_width = base_width
+        self._store = JsonStore(path)
+
+    @classmethod
+    def from_config(cls, config: dict) -> "ResolutionPolicy":
+        return cls(
+            target_width=config.get("target_width"),
+            zooms=config.get("zooms") or DEFAULT_ZOOMS,
+            base_width=config.get("base_width", DEFAULT_BASE_WIDTH),
+            path=config.get("widths", "data/page_widths.json"),
+        )
+
+    def target_for(
+        self, stores: list[StoreConfig], recipients: list[Recipient]
+    ) -> int | None:
+        """チラシに必要な幅. 掲載店舗と、それを購読する送信先の最大値."""
+        targets = [s.target_width for s in stores if s.target_width]
+        targets += [
+            r.target_width for r in recipients
+            if r.target_width and any(r.subscribes(s) for s in stores)
+        ]
+        return max(targets) if targets else self.target_width
+
+    def zooms_for(
+        self, stores: list[StoreConfig], target_width: int | None
+    ) -> list[int]:
+        """試すズームの順（目標を満たす最小 → それより大きい順 → 小さい順）."""
+        if not target_width:
+            return sorted(self.zooms, reverse=True)
+        base = min(self.base_width_for(s) for s in stores)
+        enough = [z for z in self.zooms if base * z / 100 >= target_width]
+        return enough + [z for z in reversed(self.zooms) if z not in enough]
+
+    def base_width_for(self, store: StoreConfig) -> float:
+        with self._store.lock:
+            return self._store.data.get(store.shop_id, self.base_width)
+
+    def observe(self, store: StoreConfig, zoom: int, widths: list[int]) -> None:
+        """結合したページの幅を記録する（最も狭いページを基準にする）."""
+        if not widths:
+            return
+        base = min(widths) * 100 / zoom
+        with self._store.lock:
+            if self._store.data.get(store.shop_id) == base:
+                return
+            self._store.data[store.shop_id] = base
+            self._store.save()
+        logger.debug("ページ幅を学習: %s zoom100=%dpx", store.name, base)
@@ -0,0 +1,212 @@
+"""タイル画像の結合.
+
+JPEGはヘッダだけで寸法が分かるため、まず全タイルのヘッダから
+グリッドのレイアウトを決めてキャンバスを確保し、タイルを1枚ずつ
+デコード → 貼り付け → 解放する。デコード済みタイルを全て保持しないので、
+ピークメモリはキャンバス + タイル1枚分で済む。
+Pillow は結合する時まで読み込まない（新しいチラシがない実行では不要なため）。
+"""
+
+import io
+import logging
+import math
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from src.utils.preview import preview_from_jpeg, render_preview
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class TileLayout:
+    """タイルのグリッド配置."""
+    sizes: list[tuple[int, int]]
+    num_cols: int
+    col_widths: list[int]
+    row_heights: list[int]
+
+    @property
+    def width(self) -> int:
+        return sum(self.col_widths)
+
+    @property
+    def height(self) -> int:
+        return sum(self.row_heights)
+
+    def position(self, idx: int) -> tuple[int, int]:
+        row, col = divmod(idx, self.num_cols)
+        return sum(self.col_widths[:col]), sum(self.row_heights[:row])
+
+
+def read_tile_sizes(tiles: list[bytes]) -> list[tuple[int, int]]:
+    """タイルのヘッダから寸法を読む. 読めないタイル以降は切り捨てる."""
+    from PIL import Image
+
+    sizes = []
+    for idx, data in enumerate(tiles):
+        try:
+            with Image.open(io.BytesIO(data)) as img:
+                sizes.append(img.size)
+        except OSError as e:
+            logger.debug("タイル読み込みエラー (%d): %s", idx, e)
+            break
+    return sizes
+
+
+def detect_columns(sizes: list[tuple[int, int]]) -> int:
+    """タイルの幅パターンから列数を自動検出する.
+
+    右端のタイルは基準幅より狭いことを利用して行の区切りを検出する。
+    全タイルが同一幅の場合はtile_countの約数から推定する。
+    """
+    if len(sizes) <= 1:
+        return 1
+
+    base_width, base_h = sizes[0]
+
+    # 基準幅より狭いタイルを探す → 行の右端
+    for i in range(1, len(sizes)):
+        if sizes[i][0] < base_width:
+            return i + 1  # 0..i が1行目の i+1 タイル
+
+    # 全タイル同一幅 → tile_countの約数から推定
+    n = len(sizes)
+    best_cols = n  # fallback: 1行
+    best_ratio_diff = float("inf")
+
+    for cols in range(1, n + 1):
+        if n % cols != 0:
+            continue
+        rows = n // cols
+        aspect = (cols * base_width) / (rows * base_h)
+        # チラシは縦長（aspect ratio 0.6〜0.8程度）が一般的
+        diff = abs(aspect - 0.7)
+        if diff < best_ratio_diff:
+            best_ratio_diff = diff
+            best_cols = cols
+
+    return best_cols
+
+
+def compute_layout(sizes: list[tuple[int, int]]) -> TileLayout:
+    """タイル寸法から各列の幅・各行の高さを計算する."""
+    num_cols = detect_columns(sizes)
+    num_rows = math.ceil(len(sizes) / num_cols)
+
+    col_widths = [0] * num_cols
+    row_heights = [0] * num_rows
+    for idx, (w, h) in enumerate(sizes):
+        row, col = divmod(idx, num_cols)
+        col_widths[col] = max(col_widths[col], w)
+        row_heights[row] = max(row_heights[row], h)
+
+    return TileLayout(sizes, num_cols, col_widths, row_heights)
+
+
+class StreamingStitcher:
+    """確保済みキャンバスにタイルを1枚ずつ貼り付ける."""
+
+    def __init__(self, layout: TileLayout):
+        from PIL import Image
+
+        self.layout = layout
+        self.image = Image.new(
+            "RGB", (layout.width, layout.height), (255, 255, 255)
+        )
+
+    def paste(self, idx: int, data: bytes) -> None:
+        """タイルをデコードして貼り付け、デコード結果はすぐ解放する."""
+        from PIL import Image
+
+        with Image.open(io.BytesIO(data)) as tile:
+            self.image.paste(tile, self.layout.position(idx))
+
+
+def stitch_tiles(
+    tiles: list[bytes], layout: TileLayout | None = None
+) -> "Image.Image | None":
+    """JPEGタイル（エンコード済みバイト列）をグリッド状に結合する.
+
+    貼り付け済みタイルのバイト列はリスト内で空にし、早めに解放する。
+    """
+    if layout is None:
+        sizes = read_tile_sizes(tiles)
+        if not sizes:
+            return None
+        layout = compute_layout(sizes)
+    count = len(layout.sizes)
+    if count == 1:
+        from PIL import Image
+
+        img = Image.open(io.BytesIO(tiles[0]))
+        img.load()
+        return img
+
+    stitcher = StreamingStitcher(layout)
+    for idx in range(count):
+        stitcher.paste(idx, tiles[idx])
+        tiles[idx] = b""
+    return stitcher.image
+
+
+@dataclass
+class BuiltPage:
+    """結合済みページのJPEGとプレビュー.
+
+    decode_ms はタイルのデコード・結合、encode_ms はJPEGエンコードと
+    プレビュー生成の所要時間（ワーカープロセス内で計測する）。
+    """
+    data: bytes
+    width: int
+    height: int
+    preview: bytes
+    decode_ms: float = 0.0
+    encode_ms: float = 0.0
+
+
+def build_page(
+    tiles: list[bytes], assembly: str = "pil", quality: int = 95
+) -> BuiltPage | None:
+    """タイルを結合したページのJPEGとプレビューを返す.
+
+    プレビューはメモリ上のキャンバスから直接作り、ディスクを経由しない。
+
+    Args:
+        assembly: "pil"（デコードして結合・再エンコード）または
+            "lossless"（DCT係数のまま結合。不可能ならpilにフォールバック）
+    """
+    sizes = read_tile_sizes(tiles)
+    if not sizes:
+        return None
+    tiles = tiles[:len(sizes)]
+    layout = compute_layout(sizes)
+
+    start = time.perf_counter()
+    if assembly == "lossless":
+        data = tiles[0] if len(tiles) == 1 else None
+        if data is None:
+            from src.shufoo.lossless import assemble_lossless
+            data = assemble_lossless(tiles, layout)
+        if data is not None:
+            preview = preview_from_jpeg(data)
+            return BuiltPage(
+                data, layout.width, layout.height, preview,
+                encode_ms=(time.perf_counter() - start) * 1000,
+            )
+
+    start = time.perf_counter()
+    image = stitch_tiles(tiles, layout)
+    decoded = time.perf_counter()
+    buf = io.BytesIO()
+    image.save(buf, "JPEG", quality=quality)
+    preview = render_preview(image)
+    return BuiltPage(
+        buf.getvalue(), image.width, image.height, preview,
+        decode_ms=(decoded - start) * 1000,
+        encode_ms=(time.perf_counter() - decoded) * 1000,
+    )
@@ -0,0 +1,34 @@
+"""アップロード先バックエンドの共通インターフェース."""
+
+from abc import ABC, abstractmethod
+
+
+class UploadError(Exception):
+    """アップロードに失敗した（リトライ対象）."""
+
+
+class UploadTimeoutError(UploadError):
+    """タイムアウトした（適応タイムアウトを延ばす対象）."""
+
+
+class UploadBackend(ABC):
+    """画像を公開URLで配信できる場所に置くバックエンド."""
+
+    # キャッシュのキーやログに使う識別名
+    name: str = ""
+    # 流量制限・サーキットブレーカーの単位（省略時は name）
+    host: str = ""
+
+    @abstractmethod
+    def upload(
+        self, data: bytes, filename: str, timeout: float | None = None
+    ) -> str:
+        """画像を保存し、公開URLを返す.
+
+        Args:
+            timeout: 1回のリクエストのタイムアウト秒（None はバックエンドの既定）。
+                HTTPを使わないバックエンドは無視してよい
+
+        Raises:
+            UploadError: 失敗した場合（requests の例外もそのまま送出してよい）
+        """
@@ -0,0 +1,31 @@
+"""catbox.moe（登録不要の画像ホスティング）."""
+
+import requests
+
+from src.upload.base import UploadBackend, UploadError
+
+CATBOX_API_URL = "https://catbox.moe/user/api.php"
+
+
+class CatboxBackend(UploadBackend):
+    name = "catbox"
+    host = "catbox.moe"
+
+    def __init__(self, session: requests.Session, timeout: int = 120):
+        self.session = session
+        self.timeout = timeout
+
+    def upload(
+        self, data: bytes, filename: str, timeout: float | None = None
+    ) -> str:
+        resp = self.session.post(
+            CATBOX_API_URL,
+            data={"reqtype": "fileupload"},
+            files={"fileToUpload": (filename, data)},
+            timeout=timeout or self.timeout,
+        )
+        resp.raise_for_status()
+        url = resp.text.strip()
+        if not url.startswith("https://"):
+            raise UploadError(f"想定外の応答: {url[:100]}")
+        return url
@@ -0,0 +1,32 @@
+"""設定からアップロードバックエンドを生成する."""
+
+import requests
+
+from src.upload.base import UploadBackend
+
+
+def create_upload_backend(
+    upload_cfg: dict, session: requests.Session
+) -> UploadBackend:
+    """config.yaml の upload セクションからバックエンドを生成する.
+
+    Args:
+        upload_cfg: upload セクション（backend 未指定時は catbox）
+        session: HTTPを使うバックエンドで使い回すセッション
+    """
+    backend = upload_cfg.get("backend", "catbox")
+    options = upload_cfg.get(backend) or {}
+
+    if backend == "catbox":
+        from src.upload.catbox import CatboxBackend
+        return CatboxBackend(session, timeout=upload_cfg.get("timeout", 120))
+    if backend == "s3":
+        from src.upload.s3 import S3Backend
+        return S3Backend(**options)
+    if backend == "local":
+        from src.upload.local import LocalServerBackend
+        return LocalServerBackend(**options)
+    if backend == "fake":
+        from src.upload.fake import FakeBackend
+        return FakeBackend(**options)
+    raise ValueError(f"不明なアップロードバックエンド: {backend}")
@@ -0,0 +1,53 @@
+"""ベンチマーク用の疑似バックエンド.
+
+実際には何も送らず、設定した遅延の後にダミーURLを返す。
+一定確率で失敗させ（遅延がタイムアウトを超える場合はタイムアウトさせ）、
+リトライやエラー処理を含めたパイプライン全体のスループットを
+オフラインで計測するために使う。
+"""
+
+import random
+import threading
+import time
+
+import requests
+
+from src.upload.base import UploadBackend, UploadError
+
+
+class FakeBackend(UploadBackend):
+    name = "fake"
+
+    def __init__(
+        self,
+        latency_ms: float = 500,
+        jitter_ms: float = 0,
+        failure_rate: float = 0.0,
+        base_url: str = "https://fake.invalid",
+        seed: int | None = None,
+    ):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.failure_rate = failure_rate
+        self.base_url = base_url.rstrip("/")
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.uploaded_bytes = 0
+        self.upload_count = 0
+
+    def upload(
+        self, data: bytes, filename: str, timeout: float | None = None
+    ) -> str:
+        with self._lock:
+            delay = self.latency_ms + self._random.uniform(0, self.jitter_ms)
+            fail = self._random.random() < self.failure_rate
+        if timeout is not None and delay / 1000 > timeout:
+            time.sleep(timeout)
+            raise requests.exceptions.Timeout("疑似的なアップロードのタイムアウト")
+        time.sleep(delay / 1000)
+        if fail:
+            raise UploadError("疑似的なアップロード失敗")
+        with self._lock:
+            self.upload_count += 1
+            self.uploaded_bytes += len(data)
+        return f"{self.base_url}/{filename}"
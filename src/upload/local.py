@@ -0,0 +1,64 @@
+"""ローカルの静的HTTPサーバー.
+
+ファイルをディレクトリに置き、base_url 以下のURLを返す。
+serve: true の場合はこのプロセス内で http.server を起動して配信する。
+LINEへ実際に送る場合は base_url がインターネットから
+HTTPSで到達できる必要がある（リバースプロキシ等の背後に置く）。
+"""
+
+import functools
+import logging
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from src.upload.base import UploadBackend
+
+logger = logging.getLogger(__name__)
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+
+class LocalServerBackend(UploadBackend):
+    name = "local"
+
+    def __init__(
+        self,
+        directory: str = "data/public",
+        base_url: str | None = None,
+        serve: bool = False,
+        host: str = "127.0.0.1",
+        port: int = 8765,
+    ):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.base_url = (base_url or f"http://{host}:{port}").rstrip("/")
+        self._server = None
+        if serve:
+            handler = functools.partial(
+                _QuietHandler, directory=str(self.directory)
+            )
+            self._server = ThreadingHTTPServer((host, port), handler)
+            threading.Thread(
+                target=self._server.serve_forever,
+                name="local-upload-server",
+                daemon=True,
+            ).start()
+            logger.info("ローカル配信サーバー起動: http://%s:%d", host, port)
+
+    def upload(
+        self, data: bytes, filename: str, timeout: float | None = None
+    ) -> str:
+        path = self.directory / filename
+        if not path.exists():
+            tmp = path.with_suffix(path.suffix + ".tmp")
+            tmp.write_bytes(data)
+            tmp.replace(path)
+        return f"{self.base_url}/{filename}"
+
+    def close(self) -> None:
+        if self._server:
+            self._server.shutdown()
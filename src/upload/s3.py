@@ -0,0 +1,84 @@
+"""S3互換オブジェクトストレージ（AWS S3, Cloudflare R2, MinIO など）.
+
+boto3 が必要（requirements.txt には含めていない任意依存）。
+boto3 のタイムアウトはクライアント単位の設定のため、適応タイムアウトの
+秒数（切り上げ）ごとにクライアントを作って使い回す。
+"""
+
+import logging
+import math
+import threading
+
+from src.upload.base import UploadBackend, UploadError, UploadTimeoutError
+
+logger = logging.getLogger(__name__)
+
+
+class S3Backend(UploadBackend):
+    name = "s3"
+
+    def __init__(
+        self,
+        bucket: str,
+        public_base_url: str,
+        endpoint_url: str | None = None,
+        region: str | None = None,
+        prefix: str = "",
+        access_key_id: str | None = None,
+        secret_access_key: str | None = None,
+    ):
+        try:
+            import boto3
+        except ImportError:
+            raise UploadError(
+                "boto3 がインストールされていません。"
+                "S3バックエンドを使うには pip install boto3 を実行してください。"
+            )
+        self.bucket = bucket
+        self.public_base_url = public_base_url.rstrip("/")
+        self.prefix = prefix
+        self._session = boto3.session.Session(
+            aws_access_key_id=access_key_id,
+            aws_secret_access_key=secret_access_key,
+            region_name=region,
+        )
+        self._endpoint_url = endpoint_url
+        # タイムアウト秒（None は boto3 の既定）→ クライアント
+        self._clients: dict[int | None, object] = {}
+        self._lock = threading.Lock()
+
+    def _client(self, timeout: float | None):
+        seconds = math.ceil(timeout) if timeout else None
+        with self._lock:
+            client = self._clients.get(seconds)
+            if client is None:
+                from botocore.config import Config
+
+                config = (
+                    Config(connect_timeout=seconds, read_timeout=seconds)
+                    if seconds else None
+                )
+                client = self._session.client(
+                    "s3", endpoint_url=self._endpoint_url, config=config
+                )
+                self._clients[seconds] = client
+        return client
+
+    def upload(
+        self, data: bytes, filename: str, timeout: float | None = None
+    ) -> str:
+        from botocore.exceptions import ConnectTimeoutError, ReadTimeoutError
+
+        key = f"{self.prefix}{filename}"
+        try:
+            self._client(timeout).put_object(
+                Bucket=self.bucket,
+                Key=key,
+                Body=data,
+                ContentType="image/jpeg",
+            )
+        except (ConnectTimeoutError, ReadTimeoutError) as e:
+            raise UploadTimeoutError(str(e)) from e
+        except Exception as e:
+            raise UploadError(str(e)) from e
+        return f"{self.public_base_url}/{key}"
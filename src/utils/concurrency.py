@@ -0,0 +1,16 @@
+"""スレッドプール関連のユーティリティ."""
+
+import contextvars
+from concurrent.futures import Executor, Future
+
+
+def submit_with_context(
+    executor: Executor, fn, /, *args, **kwargs
+) -> Future:
+    """呼び出し元の contextvars を引き継いでタスクを投入する.
+
+    ThreadPoolExecutor はワーカースレッドへコンテキストを伝播しないため、
+    店舗単位のログバッファなどを子タスクでも有効にするために使う。
+    """
+    ctx = contextvars.copy_context()
+    return executor.submit(ctx.run, fn, *args, **kwargs)
@@ -0,0 +1,114 @@
+"""ハッシュをキーにしたページ画像ストア.
+
+ページ画像は内容のSHA-256をファイル名にして
+  {root}/objects/{先頭2文字}/{digest}.jpg
+に1つだけ保存する。manifest.json には
+  - sources: タイル群のハッシュ → ページ画像のハッシュ
+  - pages:   "{shop_id}/{chirashi_id}/{page}" → 直近のタイル群/ページ画像のハッシュ
+を記録する。同じチェーンの別店舗や、IDを変えて再掲載されたチラシでも
+タイルが同じなら結合・保存・アップロードは1回で済み、
+既存ファイルの有無ではなくタイルのハッシュでページの変更を検出できる。
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from src.utils.json_store import JsonStore
+
+logger = logging.getLogger(__name__)
+
+
+def sha256_hex(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def tiles_digest(tiles: list[bytes]) -> str:
+    """タイル群のハッシュ（各タイルのハッシュを順に連結してハッシュ）."""
+    h = hashlib.sha256()
+    for data in tiles:
+        h.update(hashlib.sha256(data).digest())
+    return h.hexdigest()
+
+
+class ContentStore:
+    """内容アドレス方式のページ画像ストア."""
+
+    def __init__(self, root: str = "data/images"):
+        self.root = Path(root)
+        self.objects_dir = self.root / "objects"
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        self._manifest = JsonStore(str(self.root / "manifest.json"))
+        self._manifest.data.setdefault("sources", {})
+        self._manifest.data.setdefault("pages", {})
+
+    def object_path(self, digest: str) -> Path:
+        return self.objects_dir / digest[:2] / f"{digest}.jpg"
+
+    def lookup_source(self, source: str) -> Path | None:
+        """タイル群のハッシュに対応する保存済みページ画像を返す."""
+        with self._manifest.lock:
+            digest = self._manifest.data["sources"].get(source)
+        if not digest:
+            return None
+        path = self.object_path(digest)
+        if not path.exists():
+            return None
+        path.touch()  # 使用中の画像を掃除対象から外す
+        return path
+
+    def put(self, data: bytes, source: str | None = None) -> Path:
+        """ページ画像を保存してパスを返す. 同じ内容なら書き込まない."""
+        digest = sha256_hex(data)
+        path = self.object_path(digest)
+        if path.exists():
+            path.touch()
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        if source:
+            with self._manifest.lock:
+                self._manifest.data["sources"][source] = digest
+        return path
+
+    def record_page(self, key: str, source: str, path: Path) -> bool:
+        """ページの最新ハッシュを記録する. 前回から変わっていればTrue."""
+        entry = {
+            "source": source,
+            "object": path.stem,
+            "updated_at": datetime.now().isoformat(timespec="seconds"),
+        }
+        with self._manifest.lock:
+            previous = self._manifest.data["pages"].get(key)
+            self._manifest.data["pages"][key] = entry
+            self._manifest.save()
+        return previous is not None and previous["source"] != source
+
+    def cleanup(self, days: int = 3) -> None:
+        """一定期間使われていない画像とマニフェストの参照を削除する."""
+        cutoff = (datetime.now() - timedelta(days=days)).timestamp()
+        removed = 0
+        for path in self.objects_dir.glob("*/*.jpg"):
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+                removed += 1
+
+        with self._manifest.lock:
+            sources = self._manifest.data["sources"]
+            for source, digest in list(sources.items()):
+                if not self.object_path(digest).exists():
+                    del sources[source]
+            pages = self._manifest.data["pages"]
+            for key, entry in list(pages.items()):
+                if not self.object_path(entry["object"]).exists():
+                    del pages[key]
+            self._manifest.save()
+
+        if removed:
+            logger.info("古い画像を%d件削除しました", removed)
@@ -0,0 +1,94 @@
+"""HTTP共通処理（ホスト単位の同時接続制限・流量制限・リトライ）."""
+
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import requests
+
+from src.utils.resilience import resilience
+
+logger = logging.getLogger(__name__)
+
+# リトライ対象のステータスコード
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class HostLimiter:
+    """ホストごとの同時接続数を制限する."""
+
+    def __init__(self, per_host: int = 6):
+        self.per_host = max(1, per_host)
+        self._lock = threading.Lock()
+        self._semaphores: dict[str, threading.BoundedSemaphore] = {}
+
+    @contextmanager
+    def acquire(self, url: str):
+        host = urlsplit(url).netloc
+        with self._lock:
+            sem = self._semaphores.get(host)
+            if sem is None:
+                sem = threading.BoundedSemaphore(self.per_host)
+                self._semaphores[host] = sem
+        with sem:
+            yield
+
+
+def backoff_delay(attempt: int, base: float = 0.5, cap: float = 10.0) -> float:
+    """指数バックオフ（フルジッター）の待機秒数."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def guarded_request(
+    session: requests.Session, method: str, url: str, timeout: float, **kwargs
+) -> requests.Response:
+    """ホストの流量制限・適応タイムアウト・サーキットブレーカーを通して送る.
+
+    Raises:
+        CircuitOpenError: ホストのサーキットが開いている場合
+    """
+    with resilience.guard(url).request(timeout) as attempt:
+        resp = session.request(method, url, timeout=attempt.timeout, **kwargs)
+        if resp.status_code in RETRY_STATUS:
+            attempt.fail()
+        return resp
+
+
+def get_with_retry(
+    session: requests.Session,
+    url: str,
+    timeout: float,
+    retries: int = 3,
+    limiter: HostLimiter | None = None,
+) -> requests.Response:
+    """GETし、通信エラーと一時的なエラー応答はジッター付きでリトライする.
+
+    404などリトライ対象外の応答はそのまま返す。
+    ホストのサーキットが開いている場合はリトライせず CircuitOpenError を送出する。
+    """
+    for attempt in range(retries + 1):
+        try:
+            if limiter:
+                with limiter.acquire(url):
+                    resp = guarded_request(session, "GET", url, timeout)
+            else:
+                resp = guarded_request(session, "GET", url, timeout)
+            if resp.status_code not in RETRY_STATUS or attempt == retries:
+                return resp
+            reason = f"HTTP {resp.status_code}"
+        except requests.RequestException as e:
+            if attempt == retries:
+                raise
+            reason = str(e)
+
+        delay = backoff_delay(attempt)
+        logger.debug(
+            "リトライ %d/%d (%.2f秒後): %s %s",
+            attempt + 1, retries, delay, url, reason,
+        )
+        time.sleep(delay)
+
+    raise AssertionError("unreachable")
@@ -1,78 +1,271 @@
 """画像をHTTPS URLにアップロードする.
 
 LINE ImageMessage は公開HTTPS URLが必須のため、
-catbox.moe（登録不要）にアップロードしてURLを取得する。
+アップロード先バックエンド（既定は catbox.moe、src.upload を参照）に
+アップロードしてURLを取得する。
+
+ImageUploader はセッションを使い回し、オリジナルとプレビューを並行に
+アップロードする。返却URLは画像内容のハッシュをキーに
+data/upload_cache.json へ有効期限付きでキャッシュし、同じ画像は再送しない。
+プレビューは作り直すとバイト列が変わるため、ページ本体のハッシュをキーにする。
 """
 
 import logging
+import statistics
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
 
 import requests
-from PIL import Image
+from requests.adapters import HTTPAdapter
+
+from src.upload.base import UploadBackend, UploadError
+from src.upload.catbox import CatboxBackend
+from src.upload.factory import create_upload_backend
+from src.utils.concurrency import submit_with_context
+from src.utils.content_store import sha256_hex
+from src.utils.http import backoff_delay
+from src.utils.json_store import JsonStore
+from src.utils.metrics import metrics
+from src.utils.preview import preview_from_jpeg
+from src.utils.resilience import resilience
 
 logger = logging.getLogger(__name__)
 
 
-def upload_image(file_path: str, max_retries: int = 3) -> str | None:
-    """画像をcatbox.moeにアップロードし、HTTPS URLを返す.
+class ImageUploader:
+    """バックエンドへの画像アップロードをまとめて扱う."""
+
+    def __init__(
+        self,
+        backend: UploadBackend | None = None,
+        workers: int = 4,
+        cache_path: str | None = "data/upload_cache.json",
+        cache_ttl_days: int = 7,
+        max_retries: int = 3,
+        timeout: int = 120,
+        session: requests.Session | None = None,
+    ):
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.cache_ttl = timedelta(days=cache_ttl_days)
+        self.session = session or requests.Session()
+        self.session.mount(
+            "https://", HTTPAdapter(pool_maxsize=max(1, workers))
+        )
+        metrics.instrument(self.session)
+        self.backend = backend or CatboxBackend(self.session, timeout)
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, workers), thread_name_prefix="upload"
+        )
+        self._cache = JsonStore(cache_path) if cache_path else None
+        self._lock = threading.Lock()
+        self.latencies: list[float] = []
+        self.cache_hits = 0
+
+    @classmethod
+    def from_config(cls, upload_cfg: dict) -> "ImageUploader":
+        """config.yaml の upload セクションから生成する."""
+        session = requests.Session()
+        return cls(
+            backend=create_upload_backend(upload_cfg, session),
+            workers=upload_cfg.get("workers", 4),
+            cache_ttl_days=upload_cfg.get("cache_ttl_days", 7),
+            max_retries=upload_cfg.get("retries", 3),
+            timeout=upload_cfg.get("timeout", 120),
+            session=session,
+        )
 
-    Args:
-        file_path: アップロードする画像のパス
-        max_retries: 最大リトライ回数（デフォルト: 3）
+    def upload(self, file_path: str) -> str | None:
+        """画像ファイルをアップロードし、HTTPS URLを返す. 失敗時はNone.
 
-    Returns:
-        アップロード成功時はHTTPS URL、失敗時はNone
-    """
-    for attempt in range(max_retries):
+        Raises:
+            CircuitOpenError: アップロード先のサーキットが開いている場合
+        """
         try:
-            with open(file_path, "rb") as f:
-                resp = requests.post(
-                    "https://catbox.moe/user/api.php",
-                    data={"reqtype": "fileupload"},
-                    files={"fileToUpload": f},
-                    timeout=120,  # タイムアウトを120秒に延長
-                )
-            resp.raise_for_status()
-            url = resp.text.strip()
-            logger.info("画像アップロード成功: %s", url)
-            return url
-        except requests.exceptions.Timeout:
-            if attempt < max_retries - 1:
-                wait_time = (attempt + 1) * 5  # 5秒、10秒、15秒と増加
-                logger.warning(
-                    "画像アップロードタイムアウト (%s): リトライ %d/%d (待機: %d秒)",
-                    file_path, attempt + 1, max_retries, wait_time
-                )
-                time.sleep(wait_time)
-            else:
-                logger.error("画像アップロード失敗 (%s): タイムアウト (最大リトライ回数に到達)", file_path)
-                return None
-        except requests.exceptions.RequestException as e:
-            if attempt < max_retries - 1:
-                wait_time = (attempt + 1) * 5
-                logger.warning(
-                    "画像アップロードエラー (%s): %s - リトライ %d/%d (待機: %d秒)",
-                    file_path, e, attempt + 1, max_retries, wait_time
-                )
-                time.sleep(wait_time)
-            else:
-                logger.error("画像アップロード失敗 (%s): %s", file_path, e)
-                return None
-        except Exception as e:
+            data = Path(file_path).read_bytes()
+        except OSError as e:
             logger.error("画像アップロード失敗 (%s): %s", file_path, e)
             return None
+        return self.upload_bytes(data, Path(file_path).suffix, label=file_path)
+
+    def upload_bytes(
+        self, data: bytes, suffix: str = ".jpg", label: str = ""
+    ) -> str | None:
+        """メモリ上の画像をアップロードし、HTTPS URLを返す. 失敗時はNone.
+
+        Raises:
+            CircuitOpenError: アップロード先のサーキットが開いている場合
+        """
+        digest = sha256_hex(data)
+        cache_key = f"{self.backend.name}:{digest}"
+        label = label or digest[:12]
+
+        url = self._reuse(cache_key, label)
+        if url:
+            return url
+
+        start = time.perf_counter()
+        with metrics.span("upload"):
+            url = self._send(label, data, digest + suffix)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.latencies.append(elapsed)
+        if url:
+            metrics.count("upload_bytes", len(data))
+            logger.info("画像アップロード成功: %s (%.2f秒)", url, elapsed)
+            self._store_url(cache_key, url)
+        return url
+
+    def upload_pages(
+        self,
+        paths: list[str],
+        previews: list[bytes | None] | None = None,
+    ) -> list[tuple[str, str]]:
+        """各ページのオリジナルとプレビューを並行にアップロードする.
+
+        Args:
+            paths: ページ画像のパス
+            previews: 作成済みのプレビュー（pathsと対応、未作成はNone）。
+                未作成のページは縮小デコードでメモリ上に作る
+
+        Returns:
+            (original_url, preview_url) のリスト。オリジナルが失敗したページは除く。
+            プレビューが失敗した場合はオリジナルのURLで代用する。
 
-    return None
+        Raises:
+            CircuitOpenError: アップロード先のサーキットが開いている場合
+                （チラシを失敗として扱い、次回の実行で送り直すため）
+        """
+        previews = list(previews or [])
+        previews += [None] * (len(paths) - len(previews))
 
+        originals = [
+            submit_with_context(self._executor, self.upload, path)
+            for path in paths
+        ]
+        preview_futures = [
+            submit_with_context(self._executor, self._upload_preview, path, preview)
+            for path, preview in zip(paths, previews)
+        ]
+
+        results = []
+        for original, preview in zip(originals, preview_futures):
+            original_url = original.result()
+            preview_url = preview.result()
+            if not original_url:
+                continue
+            results.append((original_url, preview_url or original_url))
+        return results
+
+    def reset(self) -> None:
+        """アップロード所要時間の集計を消す（常駐モードで実行ごとに呼ぶ）."""
+        with self._lock:
+            self.latencies = []
+            self.cache_hits = 0
+
+    def _upload_preview(self, path: str, preview: bytes | None) -> str | None:
+        """ページのプレビューをアップロードする. 未作成なら縮小デコードで作る.
+
+        URLはページ本体のハッシュでもキャッシュし、保存済みのページから
+        プレビューを作り直した場合も再送しない。
+        """
+        label = f"{path} (preview)"
+        try:
+            page_key = (
+                f"{self.backend.name}:preview:{sha256_hex(Path(path).read_bytes())}"
+            )
+        except OSError:
+            page_key = None
+        url = self._reuse(page_key, label) if page_key else None
+        if url:
+            return url
+        if preview is None:
+            try:
+                preview = preview_from_jpeg(path)
+            except Exception as e:
+                logger.warning("プレビュー作成失敗 (%s): %s", path, e)
+                return None
+        url = self.upload_bytes(preview, ".jpg", label)
+        if url and page_key:
+            self._store_url(page_key, url)
+        return url
+
+    def _reuse(self, cache_key: str, label: str) -> str | None:
+        """アップロード済みのURLがあれば返す."""
+        url = self._cached_url(cache_key)
+        if url:
+            with self._lock:
+                self.cache_hits += 1
+            metrics.count("upload_cache_hits")
+            logger.debug("アップロード済みURLを再利用: %s → %s", label, url)
+        return url
+
+    def log_summary(self) -> None:
+        """アップロード所要時間の集計をログ出力する."""
+        with self._lock:
+            latencies = list(self.latencies)
+            hits = self.cache_hits
+        if not latencies:
+            if hits:
+                logger.info("アップロード: 0件 (キャッシュ利用 %d件)", hits)
+            return
+        logger.info(
+            "アップロード: %d件 合計%.1f秒 中央値%.2f秒 最大%.2f秒 (キャッシュ利用 %d件)",
+            len(latencies), sum(latencies),
+            statistics.median(latencies), max(latencies), hits,
+        )
+
+    def _send(self, label: str, data: bytes, filename: str) -> str | None:
+        """リトライ付きでアップロードする.
+
+        サーキットが開いていればリトライせず CircuitOpenError を送出する。
+        """
+        guard = resilience.guard(self.backend.host or self.backend.name)
+        for attempt in range(self.max_retries):
+            try:
+                with guard.request(self.timeout) as call:
+                    return self.backend.upload(data, filename, timeout=call.timeout)
+            except (UploadError, requests.exceptions.RequestException) as e:
+                metrics.count("upload_errors")
+                if attempt < self.max_retries - 1:
+                    wait_time = backoff_delay(attempt, base=2.0, cap=30.0)
+                    logger.warning(
+                        "画像アップロードエラー (%s): %s - リトライ %d/%d (待機: %.1f秒)",
+                        label, e, attempt + 1, self.max_retries, wait_time
+                    )
+                    time.sleep(wait_time)
+                else:
+                    logger.error("画像アップロード失敗 (%s): %s", label, e)
+        return None
+
+    def _cached_url(self, cache_key: str) -> str | None:
+        if self._cache is None:
+            return None
+        with self._cache.lock:
+            entry = self._cache.data.get(cache_key)
+        if not entry:
+            return None
+        if datetime.fromisoformat(entry["expires_at"]) < datetime.now():
+            return None
+        return entry["url"]
 
-def create_preview(file_path: str, max_width: int = 240) -> str:
-    """プレビュー用にリサイズした画像を作成し、パスを返す."""
-    img = Image.open(file_path)
-    if img.width > max_width:
-        ratio = max_width / img.width
-        new_size = (max_width, int(img.height * ratio))
-        img = img.resize(new_size, Image.LANCZOS)
+    def _store_url(self, cache_key: str, url: str) -> None:
+        if self._cache is None:
+            return
+        now = datetime.now()
+        with self._cache.lock:
+            data = self._cache.data
+            for key in [
+                k for k, v in data.items()
+                if datetime.fromisoformat(v["expires_at"]) < now
+            ]:
+                del data[key]
+            data[cache_key] = {
+                "url": url,
+                "expires_at": (now + self.cache_ttl).isoformat(timespec="seconds"),
+            }
+            self._cache.save()
 
-    preview_path = file_path.rsplit(".", 1)[0] + "_preview.jpg"
-    img.save(preview_path, "JPEG", quality=80)
-    return preview_path
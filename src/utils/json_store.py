@@ -0,0 +1,45 @@
+"""data/ 以下に置く小さなJSONファイルの永続化."""
+
+import json
+import logging
+import os
+import tempfile
+import threading
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+class JsonStore:
+    """dictをJSONファイルに保存する. スレッドセーフで書き込みはアトミック."""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.lock = threading.RLock()
+        self.data: dict = self._load()
+
+    def _load(self) -> dict:
+        if not self.path.exists():
+            return {}
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except (OSError, ValueError) as e:
+            logger.warning("読み込み失敗のため破棄します (%s): %s", self.path, e)
+            return {}
+
+    def save(self) -> None:
+        """一時ファイルに書いてから置き換える."""
+        with self.lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(
+                dir=self.path.parent, prefix=self.path.name, suffix=".tmp"
+            )
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(self.data, f, ensure_ascii=False, indent=1)
+                os.replace(tmp, self.path)
+            except BaseException:
+                Path(tmp).unlink(missing_ok=True)
+                raise
@@ -1,8 +1,53 @@
 """ロギング設定."""
 
+import contextvars
 import logging
+from contextlib import contextmanager
 from pathlib import Path
 
+# 有効な場合、ログレコードを出力せずにこのリストへ溜める
+_log_buffer: contextvars.ContextVar[list | None] = contextvars.ContextVar(
+    "log_buffer", default=None
+)
+
+
+class _DeferredHandler(logging.Handler):
+    """バッファ中のレコードを保留し、それ以外は配下のハンドラへ渡す."""
+
+    def __init__(self, handlers: list[logging.Handler]):
+        super().__init__()
+        self.handlers = handlers
+
+    def emit(self, record: logging.LogRecord) -> None:
+        buffer = _log_buffer.get()
+        if buffer is not None:
+            # 引数は後から変化し得るので、この時点でメッセージを確定させる
+            record.msg = record.getMessage()
+            record.args = None
+            buffer.append(record)
+            return
+        for handler in self.handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+
+@contextmanager
+def buffered_logs():
+    """with内で出たログを溜め、終了時にまとめて出力する.
+
+    並行実行される店舗の処理ログが混ざらないようにするために使う。
+    スレッドをまたぐ場合は contextvars を引き継ぐ必要がある
+    （src.utils.concurrency.submit_with_context を参照）。
+    """
+    buffer: list[logging.LogRecord] = []
+    token = _log_buffer.set(buffer)
+    try:
+        yield
+    finally:
+        _log_buffer.reset(token)
+        for record in buffer:
+            logging.getLogger(record.name).handle(record)
+
 
 def setup_logging(log_dir: str = "logs", level: int = logging.INFO) -> None:
     """コンソールとファイルの両方にログ出力を設定する."""
@@ -26,5 +71,4 @@ def setup_logging(log_dir: str = "logs", level: int = logging.INFO) -> None:
 
     root_logger = logging.getLogger()
     root_logger.setLevel(level)
-    root_logger.addHandler(console_handler)
-    root_logger.addHandler(file_handler)
+    root_logger.addHandler(_DeferredHandler([console_handler, file_handler]))
@@ -0,0 +1,182 @@
+"""実行ごとの計測（リクエスト数・転送量・処理時間）とランレポート.
+
+カウンタは contextvars で設定した店舗・チラシのラベルごとに集計する。
+ワーカースレッドで計測する場合は contextvars を引き継ぐ必要がある
+（src.utils.concurrency.submit_with_context を参照）。
+
+主なカウンタ:
+  head_probes / get_requests / post_requests  HTTPリクエスト数
+  bytes_received / upload_bytes               転送量
+  decode_ms / encode_ms / upload_ms / push_ms 処理時間（ミリ秒の合計）
+  upload_cache_hits / upload_errors           アップロードの再利用・失敗した試行
+"""
+
+import contextvars
+import json
+import logging
+import resource
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+_labels: contextvars.ContextVar[tuple[str, str]] = contextvars.ContextVar(
+    "metric_labels", default=("", "")
+)
+
+_METHOD_COUNTERS = {
+    "HEAD": "head_probes",
+    "GET": "get_requests",
+    "POST": "post_requests",
+}
+
+
+def max_rss_kb() -> int:
+    """プロセスの最大RSS（KB）."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOSはバイト単位、Linuxはキロバイト単位
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+
+class RunMetrics:
+    """(店舗, チラシ) ごとのカウンタ."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: dict[tuple[str, str], dict[str, float]] = defaultdict(
+            lambda: defaultdict(float)
+        )
+        self.started_at = datetime.now()
+
+    @contextmanager
+    def labels(self, store: str | None = None, chirashi: str | None = None):
+        """with内の計測に店舗・チラシのラベルを付ける（省略時は外側を継承）."""
+        current_store, current_chirashi = _labels.get()
+        token = _labels.set((
+            current_store if store is None else store,
+            current_chirashi if chirashi is None else chirashi,
+        ))
+        try:
+            yield
+        finally:
+            _labels.reset(token)
+
+    def count(self, name: str, value: float = 1) -> None:
+        key = _labels.get()
+        with self._lock:
+            self._counters[key][name] += value
+
+    def value(self, name: str) -> float:
+        """現在のラベル（店舗・チラシ）でのカウンタの値."""
+        key = _labels.get()
+        with self._lock:
+            counters = self._counters.get(key)
+            return counters.get(name, 0) if counters else 0
+
+    @contextmanager
+    def span(self, name: str):
+        """with内の経過時間を {name}_ms に加算する."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.count(f"{name}_ms", (time.perf_counter() - start) * 1000)
+
+    def instrument(self, session: requests.Session) -> None:
+        """セッションの全レスポンスについてリクエスト数と受信バイト数を数える."""
+        session.hooks["response"].append(self._on_response)
+
+    def _on_response(self, resp: requests.Response, *args, **kwargs) -> None:
+        method = resp.request.method if resp.request else "GET"
+        self.count(_METHOD_COUNTERS.get(method, f"{method.lower()}_requests"))
+        if method != "HEAD":
+            self.count("bytes_received", len(resp.content))
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+        self.started_at = datetime.now()
+
+    def report(self, **extra) -> dict:
+        """合計・店舗別・チラシ別に集計したレポートを返す."""
+        with self._lock:
+            items = [(k, dict(v)) for k, v in self._counters.items()]
+
+        totals: dict[str, float] = defaultdict(float)
+        stores: dict[str, dict] = {}
+        for (store, chirashi), counters in sorted(items):
+            entry = stores.setdefault(
+                store or "-", {"totals": defaultdict(float), "chirashi": {}}
+            )
+            for name, value in counters.items():
+                totals[name] += value
+                entry["totals"][name] += value
+            if chirashi:
+                entry["chirashi"][chirashi] = _rounded(counters)
+
+        return {
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "finished_at": datetime.now().isoformat(timespec="seconds"),
+            "totals": _rounded(totals),
+            "stores": {
+                name: {
+                    "totals": _rounded(entry["totals"]),
+                    "chirashi": entry["chirashi"],
+                }
+                for name, entry in stores.items()
+            },
+            **extra,
+        }
+
+    def to_prometheus(self, prefix: str = "chirashi") -> str:
+        """Prometheusのテキスト形式（node_exporter の textfile 用）で出力する."""
+        with self._lock:
+            items = [(k, dict(v)) for k, v in self._counters.items()]
+
+        series: dict[str, list[str]] = defaultdict(list)
+        for (store, chirashi), counters in sorted(items):
+            labels = f'store="{_escape(store)}",chirashi="{_escape(chirashi)}"'
+            for name, value in counters.items():
+                series[name].append(f"{prefix}_{name}_total{{{labels}}} {value:g}")
+
+        lines = []
+        for name in sorted(series):
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            lines.extend(series[name])
+        return "\n".join(lines) + "\n"
+
+    def write(self, json_path: str, prometheus_path: str | None = None, **extra) -> dict:
+        """レポートをJSON（と任意でPrometheus形式）で書き出す."""
+        report = self.report(**extra)
+        path = Path(json_path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        if prometheus_path:
+            prom = Path(prometheus_path)
+            prom.parent.mkdir(parents=True, exist_ok=True)
+            prom.write_text(self.to_prometheus(), encoding="utf-8")
+        logger.info("ランレポート出力: %s", path)
+        return report
+
+
+def _rounded(counters: dict[str, float]) -> dict[str, float]:
+    return {
+        name: round(value, 1) if name.endswith("_ms") else int(value)
+        for name, value in sorted(counters.items())
+    }
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# プロセス全体で共有する計測器
+metrics = RunMetrics()
@@ -0,0 +1,201 @@
+"""HTTPの記録・再生（ベンチマーク/オフライン検証用）.
+
+requests.Session にアダプタを差し込み、実通信のやり取りを
+カセット（ディレクトリ）へ記録したり、記録済みのやり取りを再生したりする。
+
+カセットの構成:
+  {cassette}/index.json   メタ情報と、(method, url) ごとの応答一覧
+  {cassette}/bodies/      応答ボディ（SHA-256をファイル名にして重複排除）
+
+再生時は同じ (method, url) の応答を記録順に返し、尽きたら最後の応答を
+繰り返す。記録にないリクエストには404を返す。遅延を注入でき、
+ホストごとのリクエスト数・転送量を集計する。
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from io import BytesIO
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+logger = logging.getLogger(__name__)
+
+# 記録する応答ヘッダ（それ以外は再生に不要）
+_KEPT_HEADERS = ("content-type", "etag", "last-modified", "content-length")
+
+
+class RequestStats:
+    """ホスト・メソッドごとのリクエスト数と受信バイト数."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests: dict[str, int] = defaultdict(int)
+        self.bytes: dict[str, int] = defaultdict(int)
+
+    def add(self, method: str, url: str, size: int) -> None:
+        key = f"{method} {urlsplit(url).netloc}"
+        with self._lock:
+            self.requests[key] += 1
+            self.bytes[key] += size
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {
+                key: {"requests": self.requests[key], "bytes": self.bytes[key]}
+                for key in sorted(self.requests)
+            }
+
+
+class Cassette:
+    """記録済みのHTTPやり取り."""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.bodies_dir = self.path / "bodies"
+        self._lock = threading.Lock()
+        self.meta: dict = {}
+        self.entries: dict[str, list[dict]] = defaultdict(list)
+        self._cursor: dict[str, int] = defaultdict(int)
+        index = self.path / "index.json"
+        if index.exists():
+            with open(index, encoding="utf-8") as f:
+                raw = json.load(f)
+            self.meta = raw.get("meta", {})
+            self.entries.update(raw.get("entries", {}))
+
+    @staticmethod
+    def key(method: str, url: str) -> str:
+        return f"{method.upper()} {url}"
+
+    def record(self, method: str, url: str, status: int, headers: dict, body: bytes) -> None:
+        digest = hashlib.sha256(body).hexdigest()
+        with self._lock:
+            self.bodies_dir.mkdir(parents=True, exist_ok=True)
+            body_path = self.bodies_dir / digest
+            if not body_path.exists():
+                body_path.write_bytes(body)
+            self.entries[self.key(method, url)].append({
+                "status": status,
+                "headers": {
+                    k: v for k, v in headers.items()
+                    if k.lower() in _KEPT_HEADERS
+                },
+                "body": digest,
+            })
+
+    def next_response(self, method: str, url: str) -> tuple[dict, bytes] | None:
+        key = self.key(method, url)
+        with self._lock:
+            responses = self.entries.get(key)
+            if not responses:
+                return None
+            idx = min(self._cursor[key], len(responses) - 1)
+            self._cursor[key] += 1
+        entry = responses[idx]
+        return entry, (self.bodies_dir / entry["body"]).read_bytes()
+
+    def save(self, **meta) -> None:
+        with self._lock:
+            self.meta.update(meta)
+            self.meta.setdefault(
+                "recorded_at", datetime.now().isoformat(timespec="seconds")
+            )
+            self.path.mkdir(parents=True, exist_ok=True)
+            with open(self.path / "index.json", "w", encoding="utf-8") as f:
+                json.dump(
+                    {"meta": self.meta, "entries": self.entries},
+                    f, ensure_ascii=False, indent=1,
+                )
+        logger.info("HTTPのやり取りを記録しました: %s", self.path)
+
+
+class RecordingAdapter(HTTPAdapter):
+    """実際に通信し、やり取りをカセットに記録する."""
+
+    def __init__(self, cassette: Cassette, stats: RequestStats | None = None, **kwargs):
+        super().__init__(**kwargs)
+        self.cassette = cassette
+        self.stats = stats
+
+    def send(self, request, **kwargs):
+        resp = super().send(request, **kwargs)
+        body = resp.content
+        self.cassette.record(
+            request.method, request.url, resp.status_code, resp.headers, body
+        )
+        if self.stats:
+            self.stats.add(request.method, request.url, len(body))
+        return resp
+
+
+class ReplayAdapter(BaseAdapter):
+    """通信せずにカセットから応答を返す."""
+
+    def __init__(
+        self,
+        cassette: Cassette,
+        latency_ms: float = 0,
+        stats: RequestStats | None = None,
+    ):
+        super().__init__()
+        self.cassette = cassette
+        self.latency_ms = latency_ms
+        self.stats = stats
+
+    def send(self, request, **kwargs):
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+
+        found = self.cassette.next_response(request.method, request.url)
+        if found is None:
+            entry, body = {"status": 404, "headers": {}}, b""
+        else:
+            entry, body = found
+        if request.method == "HEAD":
+            body = b""
+
+        resp = requests.Response()
+        resp.status_code = entry["status"]
+        resp.headers = CaseInsensitiveDict(entry["headers"])
+        resp.raw = BytesIO(body)
+        resp._content = body
+        resp.url = request.url
+        resp.request = request
+        resp.encoding = requests.utils.get_encoding_from_headers(resp.headers)
+        if self.stats:
+            self.stats.add(request.method, request.url, len(body))
+        return resp
+
+    def close(self):
+        pass
+
+
+def install(
+    session: requests.Session,
+    cassette: Cassette,
+    mode: str,
+    latency_ms: float = 0,
+    stats: RequestStats | None = None,
+) -> None:
+    """セッションに記録（record）または再生（replay）のアダプタを差し込む."""
+    if mode == "record":
+        pool_maxsize = max(
+            (getattr(a, "_pool_maxsize", 10) for a in session.adapters.values()),
+            default=10,
+        )
+        adapter = RecordingAdapter(cassette, stats, pool_maxsize=pool_maxsize)
+    elif mode == "replay":
+        adapter = ReplayAdapter(cassette, latency_ms, stats)
+    else:
+        raise ValueError(f"不明なモード: {mode}")
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
@@ -0,0 +1,313 @@
+"""ホストごとの流量制限・適応タイムアウト・サーキットブレーカー.
+
+Shufoo!・アップロード先・LINEのいずれかが不調になると、全店舗の処理が
+タイムアウト待ちで実行時間を使い切ってしまう。そこでホストごとに
+HostGuard を持ち、すべてのリクエストを通す:
+
+  流量制限          トークンバケット（rate 件/秒、burst 件まで連続可）
+  適応タイムアウト  成功したリクエストの応答時間（平滑化した平均 + 4×ばらつき）
+                    から決め、設定値を上限とする。タイムアウトしたら2倍に戻す
+  サーキット        連続 failure_threshold 回失敗したら reset_seconds の間は
+  ブレーカー        すぐに CircuitOpenError を送出する。経過後は1件だけ試し
+                    （half-open）、成功すれば閉じ、失敗すれば再び開く
+
+失敗として数えるのは通信エラー・タイムアウトと、429/5xx の応答のみ
+（404 などはホストが正常に応答しているため成功扱い）。
+状態はプロセス全体で共有し、ランレポートに含める。
+"""
+
+import logging
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+from urllib.parse import urlsplit
+
+from src.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_SECONDS = 30.0
+DEFAULT_MIN_TIMEOUT = 2.0
+# 応答時間を学習するまでは設定のタイムアウトを使う
+MIN_SAMPLES = 5
+
+
+class CircuitOpenError(Exception):
+    """サーキットが開いているため、リクエストを送らずに失敗させた."""
+
+
+class TokenBucket:
+    """rate 件/秒で補充され、burst 件まで貯まるトークンバケット."""
+
+    def __init__(self, rate: float, burst: float | None = None):
+        self.rate = rate
+        self.burst = max(1.0, burst or rate)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """トークンを1つ取得する（なければ待つ）. 待った秒数を返す."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            # 先に取得した分を差し引き、足りない分は待つ（順番を保つ）
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+class AdaptiveTimeout:
+    """応答時間から決めるタイムアウト（TCPの再送タイムアウトと同じ考え方）."""
+
+    def __init__(self, min_timeout: float = DEFAULT_MIN_TIMEOUT):
+        self.min_timeout = min_timeout
+        self.samples = 0
+        self._srtt = 0.0
+        self._rttvar = 0.0
+        self._backoff = 1.0
+        self._lock = threading.Lock()
+
+    def value(self, cap: float) -> float:
+        """今回のリクエストに使うタイムアウト（cap を超えない）."""
+        with self._lock:
+            if self.samples < MIN_SAMPLES:
+                return cap
+            timeout = (self._srtt + 4 * self._rttvar) * self._backoff
+        return min(cap, max(self.min_timeout, timeout))
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            if self.samples == 0:
+                self._srtt = seconds
+                self._rttvar = seconds / 2
+            else:
+                self._rttvar = 0.75 * self._rttvar + 0.25 * abs(self._srtt - seconds)
+                self._srtt = 0.875 * self._srtt + 0.125 * seconds
+            self.samples += 1
+            self._backoff = 1.0
+
+    def timed_out(self) -> None:
+        with self._lock:
+            self._backoff = min(self._backoff * 2, 64.0)
+
+    @property
+    def srtt(self) -> float:
+        return self._srtt
+
+
+class CircuitBreaker:
+    """連続した失敗でリクエストを止め、一定時間後に1件だけ試す."""
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+        reset_seconds: float = DEFAULT_RESET_SECONDS,
+    ):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_seconds = reset_seconds
+        self.state = CLOSED
+        self.failures = 0
+        self.opened = 0
+        self.rejected = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def before(self) -> None:
+        """リクエスト前に呼ぶ. 送れない場合は CircuitOpenError を送出する."""
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self._opened_at < self.reset_seconds:
+                    self.rejected += 1
+                    raise CircuitOpenError(f"{self.name}: サーキットが開いています")
+                self.state = HALF_OPEN
+                logger.info("%s: サーキット半開（1件だけ試行）", self.name)
+            if self.state == HALF_OPEN:
+                if self._probing:
+                    self.rejected += 1
+                    raise CircuitOpenError(f"{self.name}: 試行中のため待機")
+                self._probing = True
+
+    def success(self) -> None:
+        with self._lock:
+            if self.state != CLOSED:
+                logger.info("%s: サーキットを閉じました", self.name)
+            self.state = CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == HALF_OPEN or (
+                self.state == CLOSED and self.failures >= self.failure_threshold
+            ):
+                self.state = OPEN
+                self.opened += 1
+                self._opened_at = time.monotonic()
+                logger.warning(
+                    "%s: %d回連続で失敗したためサーキットを開きます (%.0f秒)",
+                    self.name, self.failures, self.reset_seconds,
+                )
+
+
+@dataclass
+class Attempt:
+    """HostGuard.request で行う1回のリクエスト."""
+    # 使うタイムアウト（呼び出し側がタイムアウトを持たない場合はNone）
+    timeout: float | None
+    failed: bool = False
+
+    def fail(self) -> None:
+        """例外にならない失敗（429/5xx の応答など）を記録する."""
+        self.failed = True
+
+
+class HostGuard:
+    """1ホスト分の流量制限・タイムアウト・サーキットブレーカー."""
+
+    def __init__(
+        self,
+        host: str,
+        rate: float | None = None,
+        burst: float | None = None,
+        failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+        reset_seconds: float = DEFAULT_RESET_SECONDS,
+        min_timeout: float = DEFAULT_MIN_TIMEOUT,
+    ):
+        """
+        Args:
+            rate: 1秒あたりのリクエスト数の上限（None は無制限）
+            burst: 連続して送れるリクエスト数（省略時は rate）
+        """
+        self.host = host
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.timeout = AdaptiveTimeout(min_timeout)
+        self.breaker = CircuitBreaker(host, failure_threshold, reset_seconds)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.wait_seconds = 0.0
+
+    @contextmanager
+    def request(self, timeout: float | None = None) -> Iterator[Attempt]:
+        """with内で1回のリクエストを行う.
+
+        Args:
+            timeout: 設定のタイムアウト（適応タイムアウトの上限）。
+                省略時は応答時間の記録のみ行う
+
+        Raises:
+            CircuitOpenError: サーキットが開いている場合（リクエストは送らない）
+        """
+        self.breaker.before()
+        if self.bucket:
+            waited = self.bucket.acquire()
+            if waited:
+                metrics.count("rate_wait_ms", waited * 1000)
+                with self._lock:
+                    self.wait_seconds += waited
+        attempt = Attempt(self.timeout.value(timeout) if timeout else None)
+        start = time.perf_counter()
+        try:
+            yield attempt
+        except Exception as e:
+            if _is_timeout(e):
+                self.timeout.timed_out()
+            self._record(ok=False)
+            raise
+        if attempt.failed:
+            self._record(ok=False)
+        else:
+            self.timeout.observe(time.perf_counter() - start)
+            self._record(ok=True)
+
+    def _record(self, ok: bool) -> None:
+        with self._lock:
+            self.requests += 1
+            if not ok:
+                self.errors += 1
+        if ok:
+            self.breaker.success()
+        else:
+            self.breaker.failure()
+
+    def report(self) -> dict:
+        breaker = self.breaker
+        return {
+            "state": breaker.state,
+            "requests": self.requests,
+            "errors": self.errors,
+            "rejected": breaker.rejected,
+            "opened": breaker.opened,
+            "srtt_ms": round(self.timeout.srtt * 1000, 1),
+            "rate_wait_ms": round(self.wait_seconds * 1000, 1),
+        }
+
+
+def _is_timeout(error: Exception) -> bool:
+    return isinstance(error, TimeoutError) or "Timeout" in type(error).__name__
+
+
+class Resilience:
+    """ホスト名 → HostGuard. 設定はホストごとに default を上書きする."""
+
+    def __init__(self, config: dict | None = None):
+        self._lock = threading.Lock()
+        self._guards: dict[str, HostGuard] = {}
+        self.configure(config or {})
+
+    def configure(self, config: dict) -> None:
+        """config.yaml の resilience セクションを反映する（既存の状態は捨てる）."""
+        with self._lock:
+            self._default = dict(config.get("default") or {})
+            self._hosts = {
+                host: dict(options or {})
+                for host, options in (config.get("hosts") or {}).items()
+            }
+            self._guards.clear()
+
+    def guard(self, url_or_host: str) -> HostGuard:
+        host = urlsplit(url_or_host).netloc or url_or_host
+        with self._lock:
+            guard = self._guards.get(host)
+            if guard is None:
+                options = {**self._default, **self._hosts.get(host, {})}
+                guard = HostGuard(host, **options)
+                self._guards[host] = guard
+        return guard
+
+    def report(self) -> dict:
+        """ホストごとの状態（ランレポート用）."""
+        with self._lock:
+            guards = dict(self._guards)
+        return {host: g.report() for host, g in sorted(guards.items())}
+
+    def log_summary(self) -> None:
+        for host, state in self.report().items():
+            if state["errors"] or state["rejected"] or state["state"] != CLOSED:
+                logger.warning(
+                    "%s: %s (失敗 %d/%d件, 遮断 %d件)",
+                    host, state["state"], state["errors"], state["requests"],
+                    state["rejected"],
+                )
+
+
+# プロセス全体で共有する（常駐モードでは実行をまたいで状態を引き継ぐ）
+resilience = Resilience()
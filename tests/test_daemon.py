@@ -0,0 +1,49 @@
+from datetime import datetime
+
+from src.daemon import PollSchedule
+from src.models import StoreConfig
+
+
+def _schedule(tmp_path, **kwargs) -> PollSchedule:
+    return PollSchedule(history_path=str(tmp_path / "publish_times.json"), **kwargs)
+
+
+def test_next_poll_uses_interval(tmp_path):
+    schedule = _schedule(tmp_path, interval_minutes=60)
+    store = StoreConfig(name="a", shop_id="1")
+    now = datetime(2024, 6, 1, 12, 0)
+    assert schedule.next_poll(store, now) == datetime(2024, 6, 1, 13, 0)
+
+
+def test_next_poll_store_interval_wins(tmp_path):
+    schedule = _schedule(tmp_path, interval_minutes=60)
+    store = StoreConfig(name="a", shop_id="1", poll_minutes=15)
+    now = datetime(2024, 6, 1, 12, 0)
+    assert schedule.next_poll(store, now) == datetime(2024, 6, 1, 12, 15)
+
+
+def test_next_poll_in_peak(tmp_path):
+    schedule = _schedule(
+        tmp_path, interval_minutes=60, peak_interval_minutes=10,
+        peak_hours=["09:00-11:00"],
+    )
+    store = StoreConfig(name="a", shop_id="1")
+    now = datetime(2024, 6, 1, 9, 30)
+    assert schedule.next_poll(store, now) == datetime(2024, 6, 1, 9, 40)
+
+
+def test_next_poll_wakes_at_peak_start(tmp_path):
+    schedule = _schedule(tmp_path, interval_minutes=60, peak_hours=["09:00-11:00"])
+    store = StoreConfig(name="a", shop_id="1")
+    now = datetime(2024, 6, 1, 8, 45, 30)
+    assert schedule.next_poll(store, now) == datetime(2024, 6, 1, 9, 0)
+
+
+def test_next_poll_learns_publish_hours(tmp_path):
+    schedule = _schedule(tmp_path, interval_minutes=120)
+    store = StoreConfig(name="a", shop_id="1")
+    for day in (1, 2):
+        schedule.record_publish(store, datetime(2024, 6, day, 17, 10))
+    now = datetime(2024, 6, 3, 15, 0)
+    # 17時台の公開を学習し、その30分前から確認を増やす
+    assert schedule.next_poll(store, now) == datetime(2024, 6, 3, 16, 30)
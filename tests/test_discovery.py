@@ -0,0 +1,46 @@
+import requests
+
+from src.shufoo.discovery import TileDiscovery
+from src.utils.replay import Cassette, install
+
+BASE = "https://tiles.example"
+
+
+def _discovery(tmp_path, counts: list[int]) -> TileDiscovery:
+    """系列 i に counts[i] 個のタイルがあるカセットを再生するセッション."""
+    cassette = Cassette(str(tmp_path / "cassette"))
+    for series, count in enumerate(counts):
+        for n in range(count):
+            cassette.record("HEAD", f"{BASE}/{series}_{n}.jpg", 200, {}, b"")
+    session = requests.Session()
+    install(session, cassette, "replay")
+    return TileDiscovery(session)
+
+
+def _url_fns(n: int):
+    return [lambda i, s=s: f"{BASE}/{s}_{i}.jpg" for s in range(n)]
+
+
+def test_count_contiguous(tmp_path):
+    counts = [0, 1, 6, 13]
+    discovery = _discovery(tmp_path, counts)
+    assert discovery.count_contiguous(_url_fns(len(counts)), limit=64) == counts
+
+
+def test_count_contiguous_stops_at_limit(tmp_path):
+    discovery = _discovery(tmp_path, [20])
+    assert discovery.count_contiguous(_url_fns(1), limit=8) == [8]
+
+
+def test_count_contiguous_skips_known(tmp_path):
+    discovery = _discovery(tmp_path, [5])
+    assert discovery.count_contiguous(_url_fns(1), limit=64, known=1) == [5]
+    assert discovery.head_count < 10
+
+
+def test_reset_clears_head_count(tmp_path):
+    discovery = _discovery(tmp_path, [3])
+    discovery.count_contiguous(_url_fns(1), limit=8)
+    assert discovery.head_count
+    discovery.reset()
+    assert discovery.head_count == 0
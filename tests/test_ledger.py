@@ -0,0 +1,54 @@
+from src.models import Chirashi, StoreConfig
+from src.notify.ledger import DeliveryLedger
+
+
+def _chirashi(tile_counts: list[int], zoom: int = 200) -> Chirashi:
+    chirashi = Chirashi(
+        chirashi_id="100",
+        store=StoreConfig(name="a", shop_id="1"),
+        title="",
+        image_urls=[],
+        page_hashes=["h"] * len(tile_counts),
+    )
+    chirashi._tile_info = {
+        "zoom": zoom,
+        "pages": [
+            {"page": i, "tile_count": n} for i, n in enumerate(tile_counts)
+        ],
+    }
+    return chirashi
+
+
+def _ledger(tmp_path) -> DeliveryLedger:
+    return DeliveryLedger(str(tmp_path / "ledger.json"))
+
+
+def test_is_sent_same_layout(tmp_path):
+    ledger = _ledger(tmp_path)
+    assert not ledger.is_sent(_chirashi([6, 6]))
+    ledger.record(_chirashi([6, 6]))
+    assert ledger.is_sent(_chirashi([6, 6]))
+    assert not ledger.is_sent(_chirashi([6, 6, 6]))
+    assert not ledger.is_sent(_chirashi([6, 4]))
+
+
+def test_is_sent_other_zoom_compares_pages(tmp_path):
+    ledger = _ledger(tmp_path)
+    ledger.record(_chirashi([6, 6], zoom=200))
+    assert ledger.is_sent(_chirashi([2, 2], zoom=100))
+    assert not ledger.is_sent(_chirashi([2], zoom=100))
+
+
+def test_is_sent_ignores_degraded(tmp_path):
+    ledger = _ledger(tmp_path)
+    degraded = _chirashi([2, 2], zoom=100)
+    degraded.degraded = True
+    ledger.record(degraded)
+    assert ledger.is_known(degraded)
+    assert not ledger.is_sent(_chirashi([6, 6], zoom=200))
+    assert not ledger.is_sent(_chirashi([2, 2], zoom=100))
+
+
+def test_is_sent_persists(tmp_path):
+    _ledger(tmp_path).record(_chirashi([6]))
+    assert _ledger(tmp_path).is_sent(_chirashi([6]))
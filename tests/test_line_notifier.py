@@ -0,0 +1,33 @@
+from src.models import Chirashi, StoreConfig
+from src.notify.line_notifier import (
+    MAX_MESSAGES_PER_REQUEST,
+    _Outgoing,
+    pack_messages,
+)
+
+
+def _outgoing(name: str, count: int) -> _Outgoing:
+    store = StoreConfig(name=name, shop_id=name)
+    chirashi = Chirashi(chirashi_id=name, store=store, title=name, image_urls=[])
+    return _Outgoing([chirashi], [f"{name}{i}" for i in range(count)])
+
+
+def test_pack_messages_keeps_order():
+    batches = pack_messages([_outgoing("a", 3), _outgoing("b", 4), _outgoing("c", 1)])
+    assert [messages for messages, _ in batches] == [
+        ["a0", "a1", "a2", "b0", "b1"],
+        ["b2", "b3", "c0"],
+    ]
+    assert [owners for _, owners in batches] == [{0, 1}, {1, 2}]
+
+
+def test_pack_messages_fills_requests():
+    batches = pack_messages([_outgoing("a", MAX_MESSAGES_PER_REQUEST * 2 + 1)])
+    assert [len(messages) for messages, _ in batches] == [
+        MAX_MESSAGES_PER_REQUEST, MAX_MESSAGES_PER_REQUEST, 1,
+    ]
+
+
+def test_pack_messages_empty():
+    assert pack_messages([]) == []
+    assert pack_messages([_outgoing("a", 0)]) == []
@@ -0,0 +1,52 @@
+import pytest
+
+from src.utils.resilience import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    CircuitBreaker,
+    CircuitOpenError,
+)
+
+
+def test_opens_after_consecutive_failures():
+    breaker = CircuitBreaker("host", failure_threshold=3, reset_seconds=60)
+    for _ in range(2):
+        breaker.before()
+        breaker.failure()
+    assert breaker.state == CLOSED
+    breaker.before()
+    breaker.failure()
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before()
+    assert breaker.rejected == 1
+
+
+def test_success_resets_failures():
+    breaker = CircuitBreaker("host", failure_threshold=2, reset_seconds=60)
+    breaker.failure()
+    breaker.success()
+    breaker.failure()
+    assert breaker.state == CLOSED
+
+
+def test_half_open_allows_one_probe():
+    breaker = CircuitBreaker("host", failure_threshold=1, reset_seconds=0)
+    breaker.failure()
+    assert breaker.state == OPEN
+    breaker.before()
+    assert breaker.state == HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before()
+    breaker.success()
+    assert breaker.state == CLOSED
+
+
+def test_half_open_failure_reopens():
+    breaker = CircuitBreaker("host", failure_threshold=1, reset_seconds=0)
+    breaker.failure()
+    breaker.before()
+    breaker.failure()
+    assert breaker.state == OPEN
+    assert breaker.opened == 2
@@ -0,0 +1,40 @@
+from src.models import Recipient, StoreConfig
+from src.shufoo.resolution import ResolutionPolicy
+
+
+def _policy(tmp_path, **kwargs) -> ResolutionPolicy:
+    return ResolutionPolicy(path=str(tmp_path / "page_widths.json"), **kwargs)
+
+
+def test_zooms_for_without_target_prefers_largest(tmp_path):
+    policy = _policy(tmp_path, zooms=[100, 200, 150])
+    store = StoreConfig(name="a", shop_id="1")
+    assert policy.zooms_for([store], None) == [200, 150, 100]
+
+
+def test_zooms_for_picks_smallest_enough(tmp_path):
+    policy = _policy(tmp_path, zooms=[50, 100, 200], base_width=1000)
+    store = StoreConfig(name="a", shop_id="1")
+    assert policy.zooms_for([store], 900) == [100, 200, 50]
+    assert policy.zooms_for([store], 400) == [50, 100, 200]
+
+
+def test_zooms_for_uses_learned_width(tmp_path):
+    policy = _policy(tmp_path, zooms=[100, 200], base_width=1000)
+    wide = StoreConfig(name="a", shop_id="1")
+    narrow = StoreConfig(name="b", shop_id="2")
+    policy.observe(narrow, 200, [1200, 1400])
+    assert policy.zooms_for([wide], 900) == [100, 200]
+    # 共通のチラシは最も狭い店舗に合わせる
+    assert policy.zooms_for([wide, narrow], 900) == [200, 100]
+
+
+def test_target_for_takes_subscribed_maximum(tmp_path):
+    policy = _policy(tmp_path, target_width=480)
+    store = StoreConfig(name="a", shop_id="1", target_width=600)
+    recipients = [
+        Recipient(user_id="u1", target_width=1080),
+        Recipient(user_id="u2", stores={"other"}, target_width=2000),
+    ]
+    assert policy.target_for([store], recipients) == 1080
+    assert policy.target_for([StoreConfig(name="b", shop_id="2")], []) == 480